@@ -1,9 +1,28 @@
 """
-Middleware для поддержки правильного формирования redirect_uri для OIDC.
+Middleware для поддержки правильного формирования redirect_uri для OIDC
+и замеров производительности запросов.
+
+Все middleware умеют работать и синхронно, и асинхронно: иначе под ASGI
+Django переводит всю цепочку в синхронный режим и async views выполняются
+в потоке (см. library/async_views.py).
 """
 
+import json
+import logging
+import time
+from contextlib import ExitStack
 from urllib.parse import urljoin
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from library import metrics, profiling
+from library.translation import SOURCE_LANG, translation_languages
+
+perf_logger = logging.getLogger('library.perf')
+
 
 class OIDCRedirectURIMiddleware:
     """
@@ -11,10 +30,16 @@ class OIDCRedirectURIMiddleware:
     Добавляет OIDC_RP_CALLBACK_URL_NAME к контексту запроса.
     """
 
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
-    def __call__(self, request):
+    @staticmethod
+    def _set_callback_url(request):
         if request.is_secure():
             scheme = 'https'
         else:
@@ -26,5 +51,169 @@ class OIDCRedirectURIMiddleware:
 
         request.oidc_callback_url = callback_url
 
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self._set_callback_url(request)
         response = self.get_response(request)
         return response
+
+    async def __acall__(self, request):
+        self._set_callback_url(request)
+        return await self.get_response(request)
+
+
+class PerformanceMiddleware:
+    """
+    Замеры каждого запроса: SQL (число и время, через execute_wrapper),
+    вызовы переводчика, рендер шаблонов и общее время.
+
+    Результат уходит в заголовок `Server-Timing`, в лог `library.perf`
+    одной JSON-строкой и в гистограммы процесса по маршруту и языку
+    (их показывает /manage/metrics/). Включается `PERF_INSTRUMENTATION`.
+
+    В async-режиме ORM выполняется в потоке sync_to_async этого запроса
+    (у каждого потока свои соединения), поэтому обёртки SQL ставятся там же.
+
+    У потоковых ответов (экспорт) тело формируется уже после middleware:
+    их замеры неполные, поэтому в гистограммы они не попадают, а в
+    заголовке и логе помечены как `streaming`.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PERF_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _db_wrapper(timings):
+        def wrapper(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                timings.add('db', time.perf_counter() - started)
+        return wrapper
+
+    @classmethod
+    def _wrap_connections(cls, stack, timings):
+        wrapper = cls._db_wrapper(timings)
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(wrapper))
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = metrics.RequestTimings()
+        token = metrics.current_request.set(timings)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                self._wrap_connections(stack, timings)
+                response = self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+        self._report(request, response, timings, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        timings = metrics.RequestTimings()
+        token = metrics.current_request.set(timings)
+        started = time.perf_counter()
+        stack = ExitStack()
+        try:
+            await sync_to_async(self._wrap_connections)(stack, timings)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            metrics.current_request.reset(token)
+        self._report(request, response, timings, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def _metric_lang(request):
+        # ?lang= задаёт клиент: в ключи гистограмм попадают только известные языки
+        lang = request.GET.get('lang', SOURCE_LANG)
+        return lang if lang == SOURCE_LANG or lang in translation_languages() else 'other'
+
+    def _report(self, request, response, timings, total):
+        match = getattr(request, 'resolver_match', None)
+        route = (match.url_name or match.view_name) if match else 'unresolved'
+        lang = self._metric_lang(request)
+        streaming = response.streaming
+        db_queries, db_time = timings.get('db')
+        tr_calls, tr_time = timings.get('translator')
+        renders, tpl_time = timings.get('template')
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={db_time * 1000:.1f};desc="{db_queries} queries"',
+            f'translator;dur={tr_time * 1000:.1f};desc="{tr_calls} calls"',
+            f'template;dur={tpl_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}' + (';desc="streaming"' if streaming else ''),
+        ])
+
+        if not streaming:
+            prefix = f'request.{route}.{lang}'
+            metrics.histogram(f'{prefix}.total_ms', total * 1000)
+            metrics.histogram(f'{prefix}.db_ms', db_time * 1000)
+            metrics.histogram(f'{prefix}.db_queries', db_queries)
+            if tr_calls:
+                metrics.histogram(f'{prefix}.translator_ms', tr_time * 1000)
+            if renders:
+                metrics.histogram(f'{prefix}.template_ms', tpl_time * 1000)
+
+        if perf_logger.isEnabledFor(logging.INFO):
+            perf_logger.info(json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'route': route,
+                'lang': lang,
+                'status': response.status_code,
+                'streaming': streaming,
+                'total_ms': round(total * 1000, 2),
+                'db_queries': db_queries,
+                'db_ms': round(db_time * 1000, 2),
+                'translator_calls': tr_calls,
+                'translator_ms': round(tr_time * 1000, 2),
+                'template_ms': round(tpl_time * 1000, 2),
+            }))
+
+
+class ProfilerMiddleware:
+    """
+    Профилирование одного запроса по подписанному токену администратора
+    (см. library/profiling.py). Запросы без токена проходят без
+    дополнительной работы — только проверка параметра и заголовка.
+    Должен стоять после AuthenticationMiddleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = profiling.requested_token(request)
+        if token and profiling.token_valid(token, request):
+            return profiling.profile_request(self.get_response, request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        token = profiling.requested_token(request)
+        # проверка токена читает пользователя и его роли из БД
+        if token and await sync_to_async(profiling.token_valid)(token, request):
+            return await profiling.aprofile_request(self.get_response, request)
+        return await self.get_response(request)
+
@@ -36,6 +36,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'book_library.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -44,13 +45,14 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'book_library.middleware.OIDCRedirectURIMiddleware',
+    'book_library.middleware.ProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'book_library.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'book_library.template_backend.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -59,6 +61,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'library.context_processors.roles',
             ],
         },
     },
@@ -69,13 +72,42 @@ WSGI_APPLICATION = 'book_library.wsgi.application'
 
 
 
+# SQLite для нескольких воркеров: synchronous=NORMAL (в WAL не теряет целостность),
+# mmap и кэш страниц, ожидание блокировки вместо ошибки. Сам режим WAL хранится в файле
+# базы и включается один раз миграцией library 0015, а не при каждом подключении
+SQLITE_PRAGMAS = (
+    'PRAGMA synchronous=NORMAL; PRAGMA mmap_size=268435456; '
+    'PRAGMA cache_size=-32000; PRAGMA busy_timeout=10000;'
+)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': SQLITE_PRAGMAS,
+            # atomic() сразу берёт блокировку записи: без «database is locked»
+            # при попытке записи из транзакции, начатой чтением
+            'transaction_mode': 'IMMEDIATE',
+        },
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Реплика для чтения каталога (см. library/routers.py): копия LiteFS/Litestream
+# или тот же файл только для чтения — 'file:/path/db.sqlite3?mode=ro'
+DATABASE_REPLICA_NAME = os.environ.get('DATABASE_REPLICA_NAME')
+if DATABASE_REPLICA_NAME:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': DATABASE_REPLICA_NAME,
+        'OPTIONS': {'init_command': 'PRAGMA query_only=1; ' + SQLITE_PRAGMAS},
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['library.routers.ReplicaRouter']
+
 
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -117,6 +149,96 @@ LOGOUT_REDIRECT_URL = '/login/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Замеры запросов (book_library/middleware.py): Server-Timing, лог library.perf,
+# гистограммы на /manage/metrics/
+PERF_INSTRUMENTATION = True
+
+# Профилирование запросов по токену администратора (/manage/profiles/)
+PROFILE_DIR = os.path.join(MEDIA_ROOT, 'profiles')
+PROFILE_TOKEN_MAX_AGE = 60 * 60
+PROFILE_KEEP = 50
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # одна JSON-строка на запрос; включается PERF_LOG_LEVEL=INFO (по умолчанию
+        # выключено, чтобы не засорять консоль runserver и вывод тестов)
+        'library.perf': {'handlers': ['console'], 'level': os.environ.get('PERF_LOG_LEVEL', 'WARNING'), 'propagate': False},
+    },
+}
+
+# Каталог: размер страницы по умолчанию и максимальный для ?size=
+CATALOG_PAGE_SIZE = 24
+CATALOG_MAX_PAGE_SIZE = 100
+# Страница списка пользователей /manage/users/
+USERS_PAGE_SIZE = 50
+# Кэш Django: фрагменты сетки каталога и т.п. В проде с несколькими воркерами
+# лучше общий бэкенд (Redis/Memcached), иначе у каждого процесса свой кэш.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'library',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+# Сколько секунд хранится отрендеренная сетка каталога (ключ включает версию каталога)
+GRID_CACHE_TIMEOUT = 600
+
+# Cache-Control max-age для JSON book_detail (секунды); дальше — ревалидация по ETag
+BOOK_DETAIL_MAX_AGE = 60
+# Хранить группы пользователя в сессии (library/roles.py): проверки прав без запросов к БД.
+# Сбрасываются по версии в CACHES, поэтому включено только с общим для всех процессов
+# бэкендом кэша (Redis, Memcached, БД): версия в LocMemCache не видна другим воркерам
+ROLES_SESSION_CACHE = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+# Сколько секунд /stat/itemuse отдаётся из кэша процесса без обращения к БД
+STAT_CACHE_TTL = 60
+# Сколько подсказок отдаёт /search/suggest/
+SEARCH_SUGGEST_LIMIT = 8
+# Дальше этой страницы результаты поиска не листаются (страница пустая)
+SEARCH_MAX_PAGE = 50
+
+# Обложки: ширина производных вариантов и форматы (см. library/images.py)
+COVER_VARIANTS = {'thumb': 200, 'modal': 600}
+COVER_FORMATS = ['avif', 'webp', 'jpeg']
+# Строить производные обложки в фоновом потоке после сохранения книги, а не в запросе
+COVER_PROCESSING_ASYNC = True
+# Файлы обложек моложе N секунд не удаляются сразу (их может ждать ещё
+# не сохранённая книга) — их убирает manage.py sweep_covers
+COVER_SWEEP_GRACE = 3600
+
+# Async-версии каталога, карточки книги и корзины (library/async_views.py).
+# Имеет смысл только при запуске под ASGI (uvicorn/daphne book_library.asgi:application)
+ASYNC_VIEWS = False
+
+# Перевод контента (translatepy)
+TRANSLATOR_CLASS = 'translatepy.Translator'
+TRANSLATION_CACHE_SIZE = 10000
+TRANSLATION_CACHE_TTL = 60 * 60 * 24 * 30
+# Сколько запросов к переводчику выполняется параллельно
+TRANSLATION_MAX_WORKERS = 8
+# Сколько запросов к переводчику одновременно делает async-клиент (на процесс).
+# Действует для переводчика с async API (`atranslate`); у translatepy его нет, и
+# async-клиент упирается в тот же пул TRANSLATION_MAX_WORKERS, что и sync views
+TRANSLATION_ASYNC_CONCURRENCY = 64
+# Сколько секунд запрос может ждать переводчик; дальше — русский оригинал
+TRANSLATION_BUDGET = 2.0
+# То же для фонового обновления BookTranslation
+TRANSLATION_REFRESH_BUDGET = 120
+# Circuit breaker: после N ошибок подряд не обращаться к переводчику M секунд
+TRANSLATION_BREAKER_THRESHOLD = 5
+TRANSLATION_BREAKER_COOLDOWN = 30
+# Языки, для которых переводы книг хранятся в BookTranslation
+TRANSLATION_LANGUAGES = ['en', 'kz']
+# Переводить книги в фоновом потоке после сохранения
+BOOK_TRANSLATION_ASYNC = True
+
 AUTHENTICATION_BACKENDS = (
     "django.contrib.auth.backends.ModelBackend",
     "library.oidc_backend.KeycloakOIDCBackend",
@@ -147,4 +269,9 @@ OIDC_CREATE_USER = True
 OIDC_STORE_ACCESS_TOKEN = True
 OIDC_STORE_ID_TOKEN = True
 
-OIDC_VERIFY_SSL = False
\ No newline at end of file
+OIDC_VERIFY_SSL = False
+# Ключи JWKS кэшируются в процессе; новый kid перечитывает их сразу, kid, которого нет и в IdP, — не чаще MIN_REFRESH секунд
+OIDC_JWKS_CACHE_TTL = 60 * 60
+OIDC_JWKS_MIN_REFRESH = 60
+# Если ID-токен содержит эти claims, userinfo не запрашивается (None — запрашивать всегда)
+OIDC_ID_TOKEN_CLAIMS = ['email', 'given_name', 'family_name']
\ No newline at end of file
@@ -0,0 +1,36 @@
+"""
+Шаблонный бэкенд Django с замером времени рендера.
+
+Время каждого `render()` добавляется к замерам текущего запроса
+(см. PerformanceMiddleware); без middleware накладные расходы — один
+вызов perf_counter.
+"""
+
+import time
+
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from library.metrics import add_request_timing
+
+
+class InstrumentedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            add_request_timing('template', time.perf_counter() - started)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return InstrumentedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
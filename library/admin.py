@@ -1,11 +1,17 @@
 from django.contrib import admin
-from .models import Book, Cart, CartItem
+from .models import Book, Cart, CartItem, BorrowEvent, MonthlyBorrowStat
+from .images import schedule_process_cover
 
 
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
 	list_display = ('title', 'author', 'year', 'publisher')
 
+	def save_model(self, request, obj, form, change):
+		super().save_model(request, obj, form, change)
+		if 'cover' in form.changed_data:
+			schedule_process_cover(obj)
+
 
 class CartItemInline(admin.TabularInline):
 	model = CartItem
@@ -21,3 +27,15 @@ class CartAdmin(admin.ModelAdmin):
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
 	list_display = ('cart', 'book', 'quantity', 'added_at')
+
+
+@admin.register(BorrowEvent)
+class BorrowEventAdmin(admin.ModelAdmin):
+	list_display = ('user', 'book', 'quantity', 'created_at')
+	list_select_related = ('user', 'book')
+	date_hierarchy = 'created_at'
+
+
+@admin.register(MonthlyBorrowStat)
+class MonthlyBorrowStatAdmin(admin.ModelAdmin):
+	list_display = ('month', 'borrowers', 'books')
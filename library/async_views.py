@@ -0,0 +1,122 @@
+"""
+Async-версии каталога, карточки книги и корзины.
+
+Под ASGI ожидание БД и переводчика не держит поток воркера: данные идут
+через async ORM, каталог и карточка книги читают готовые BookTranslation,
+а корзина переводит названия через `atranslate_many`. У translatepy нет
+async API, поэтому его вызовы всё равно выполняются в пуле потоков
+`TRANSLATION_MAX_WORKERS` — пропускная способность перевода та же, что у
+sync views (см. bench_translation, режим executor). Рендер шаблонов
+остаётся синхронным и уходит в `sync_to_async`, потому что
+контекст-процессоры (сессия, сообщения) обращаются к БД.
+
+Включаются настройкой `ASYNC_VIEWS` (см. urls.py); под WSGI выигрыша нет.
+"""
+
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
+from django.http import Http404, JsonResponse
+from django.shortcuts import redirect, render
+from django.views.decorators.http import require_http_methods
+
+from . import metrics
+from .cart import add_item
+from .decorators import async_condition, cache_headers
+from .models import Book, Cart, CartItem
+from .pagination import akeyset_paginate
+from .translation import apply_book_translations, atranslate_many
+from .versioning import book_etag, book_last_modified, catalog_etag, catalog_last_modified
+from .catalog import parse_filters
+from .views import (
+    book_payload, catalog_sidebar, detail_books, get_book_ids, get_lang, get_quantity, grid_books,
+    grid_cache_key, grid_page_args, render_page_grid,
+)
+
+arender = sync_to_async(render)
+
+
+@cache_headers(max_age=0)
+@async_condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
+async def index(request):
+    lang = get_lang(request)
+    filters = parse_filters(request.GET)
+    # версия каталога и пользователь уже загружены в async_condition
+    key = grid_cache_key(request, lang)
+    grid = await cache.aget(key)
+    if grid is not None:
+        metrics.incr('grid_cache.hits')
+    else:
+        metrics.incr('grid_cache.misses')
+        started = time.perf_counter()
+        page = await akeyset_paginate(grid_books(lang, filters), *grid_page_args(request))
+        await sync_to_async(apply_book_translations)(page.items, lang)
+        grid = await sync_to_async(render_page_grid)(request, lang, page)
+        metrics.observe('grid_cache.render', time.perf_counter() - started)
+        await cache.aset(key, grid, settings.GRID_CACHE_TIMEOUT)
+
+    sidebar = await sync_to_async(catalog_sidebar)(request, lang, filters)
+    return await arender(request, 'library/index.html', {'grid': grid, 'lang': lang, 'sidebar': sidebar})
+
+
+@cache_headers(public=True, max_age=settings.BOOK_DETAIL_MAX_AGE)
+@async_condition(etag_func=book_etag, last_modified_func=book_last_modified)
+async def book_detail(request, pk):
+    lang = get_lang(request)
+    try:
+        book = await detail_books(lang).aget(pk=pk)
+    except Book.DoesNotExist:
+        raise Http404
+    await sync_to_async(apply_book_translations)([book], lang)
+    return JsonResponse(book_payload(book))
+
+
+@cache_headers(public=True, max_age=settings.BOOK_DETAIL_MAX_AGE)
+@async_condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
+async def book_details(request):
+    lang = get_lang(request)
+    try:
+        ids = get_book_ids(request)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    books = [book async for book in detail_books(lang).filter(pk__in=ids)]
+    await sync_to_async(apply_book_translations)(books, lang)
+    return JsonResponse({'items': {str(book.pk): book_payload(book) for book in books}})
+
+
+async def _cart_items(user, lang):
+    cart, _ = await Cart.objects.aget_or_create(user=user)
+    items = [item async for item in cart.items.select_related('book')]
+    if lang != 'ru':
+        translated = await atranslate_many([item.book.title for item in items], lang)
+        for item in items:
+            item.book.title = translated[item.book.title]
+    return cart, items
+
+
+@login_required
+async def view_cart(request):
+    lang = get_lang(request)
+    cart, items = await _cart_items(await request.auser(), lang)
+    return await arender(request, 'library/cart.html', {'cart': cart, 'items': items, 'lang': lang})
+
+
+@login_required
+async def add_to_cart(request, book_id):
+    """Добавить книгу в корзину (количество из POST/GET 'quantity')."""
+    if not await sync_to_async(add_item)(await request.auser(), book_id, get_quantity(request)):
+        raise Http404
+    return redirect('view_cart')
+
+
+@login_required
+@require_http_methods(["POST", "GET"])
+async def remove_from_cart(request, item_id):
+    user = await request.auser()
+    deleted, _ = await CartItem.objects.filter(pk=item_id, cart__user=user).adelete()
+    if not deleted:
+        raise Http404
+    return redirect('view_cart')
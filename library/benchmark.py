@@ -0,0 +1,324 @@
+"""
+Нагрузочный прогон всех маршрутов library/urls.py.
+
+`seed()` наполняет БД синтетическим каталогом, пользователями, корзинами
+и историей выдачи; `SCENARIOS` описывает по запросу на каждый маршрут
+(от имени анонима, пользователя или администратора); `run()` выполняет
+их тестовым клиентом в несколько потоков и считает время и SQL-запросы.
+Запускается командой `manage.py bench_site`.
+"""
+
+import json
+import os
+import random
+import statistics
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.contrib.auth.models import Group, User
+from django.db import connection
+from django.test import Client
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
+from . import profiling
+from .cart import add_item
+from .models import Book, BorrowEvent, Cart, CartItem
+from .roles import ADMIN_GROUP
+from .stats import rebuild_rollup
+
+PASSWORD = 'bench-password'
+
+AUTHORS = ['Лев Толстой', 'Фёдор Достоевский', 'Антон Чехов', 'Анна Ахматова', 'Иван Бунин',
+           'Михаил Булгаков', 'Николай Гоголь', 'Марина Цветаева', 'Иван Тургенев', 'Борис Пастернак']
+PUBLISHERS = ['Эксмо', 'АСТ', 'Азбука', 'Махаон', 'Питер', 'Речь']
+WORDS = ['Война', 'мир', 'сад', 'дом', 'дорога', 'ночь', 'город', 'река', 'зима', 'письма',
+         'повесть', 'записки', 'сон', 'тень', 'берег', 'песня']
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+@contextmanager
+def throwaway_database(workdir):
+    """Временная тестовая БД на время прогона; SQLite — файлом в `workdir`,
+    чтобы потоки работали с общей базой, а не с in-memory копиями."""
+    old_name = connection.settings_dict['NAME']
+    if connection.vendor == 'sqlite':
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+    try:
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def seed(books=500, users=20, cart_items=5, borrow_months=12, rng=None):
+    """Синтетические данные; возвращает объект с пользователями и id книг."""
+    rng = rng or random.Random(0)
+    Book.objects.bulk_create([
+        Book(
+            title=' '.join(rng.sample(WORDS, 3)).capitalize() + f' {i}',
+            author=rng.choice(AUTHORS),
+            year=rng.randint(1850, 2024),
+            publisher=rng.choice(PUBLISHERS),
+            description=' '.join(rng.choices(WORDS, k=40)),
+        )
+        for i in range(books)
+    ], batch_size=500)
+    book_ids = list(Book.objects.order_by('pk').values_list('pk', flat=True))
+
+    admin = User.objects.create_user('bench_admin', password=PASSWORD, is_staff=True)
+    Group.objects.get_or_create(name=ADMIN_GROUP)[0].user_set.add(admin)
+    target = User.objects.create_user('bench_target', password=PASSWORD)
+    readers = [User.objects.create_user(f'bench_user_{i}', password=PASSWORD) for i in range(users)]
+
+    carts = Cart.objects.bulk_create([Cart(user=u) for u in readers])
+    CartItem.objects.bulk_create([
+        CartItem(cart=cart, book_id=book_id, quantity=rng.randint(1, 3))
+        for cart in carts
+        for book_id in rng.sample(book_ids, min(cart_items, len(book_ids)))
+    ])
+
+    now = timezone.now()
+    BorrowEvent.objects.bulk_create([
+        BorrowEvent(user=rng.choice(readers), book_id=rng.choice(book_ids),
+                    created_at=now - timedelta(days=rng.randint(0, borrow_months * 30)))
+        for _ in range(users * borrow_months)
+    ], batch_size=500)
+    rebuild_rollup()
+    return SimpleNamespace(admin=admin, target=target, users=readers, book_ids=book_ids)
+
+
+Scenario = namedtuple('Scenario', 'label url_name role method build')
+
+
+def _get(path):
+    return lambda ctx: (path, {})
+
+
+def _new_cart_item(ctx):
+    add_item(ctx.user, ctx.book(), 1)
+    return CartItem.objects.filter(cart__user=ctx.user).latest('pk').pk
+
+
+def _book_to_delete(ctx):
+    return Book.objects.create(title='Удаляемая книга', author='Bench', year=2000,
+                               publisher='Bench', description='').pk
+
+
+def _relogin(ctx):
+    ctx.client.force_login(ctx.user)
+    return '/logout/', {}
+
+
+def _profile_name(ctx):
+    # один профилированный запрос, чтобы было что скачивать
+    if not profiling.list_profiles():
+        ctx.client.get('/', HTTP_X_PROFILE=profiling.make_token(ctx.user))
+    return profiling.list_profiles()[0]['name']
+
+
+def _checkout(ctx):
+    add_item(ctx.user, ctx.book(), 1)
+    return '/cart/checkout/', {}
+
+
+def _batch(ctx):
+    ops = [{'op': 'add', 'book': ctx.book(), 'quantity': 1} for _ in range(3)]
+    return '/cart/batch/', {'data': json.dumps({'ops': ops}), 'content_type': 'application/json'}
+
+
+def _details(lang):
+    # как предзагрузка на главной: карточки целой страницы каталога
+    def build(ctx):
+        ids = sorted({ctx.book() for _ in range(24)})
+        return f'/book/details/?ids={",".join(map(str, ids))}{lang}', {}
+    return build
+
+
+SCENARIOS = [
+    Scenario('index', 'index', 'anon', 'get', _get('/')),
+    Scenario('index[en]', 'index', 'anon', 'get', _get('/?lang=en')),
+    Scenario('index[user,year]', 'index', 'user', 'get', _get('/?sort=-year')),
+    Scenario('index[filtered]', 'index', 'anon', 'get', _get('/?author=Антон Чехов&year_from=1900&sort=-year')),
+    Scenario('search', 'search', 'anon', 'get', _get('/search/?q=дорога')),
+    Scenario('search_suggest', 'search_suggest', 'anon', 'get', _get('/search/suggest/?q=до')),
+    Scenario('stat_page', 'stat_page', 'user', 'get', _get('/stat/')),
+    Scenario('itemuse_json', 'itemuse_json', 'user', 'get', _get('/stat/itemuse')),
+    Scenario('register', 'register', 'anon', 'get', _get('/register/')),
+    Scenario('login', 'login', 'anon', 'get', _get('/login/')),
+    Scenario('logout', 'logout', 'user', 'get', _relogin),
+    Scenario('add_book', 'add_book', 'admin', 'get', _get('/book/add/')),
+    Scenario('edit_book', 'edit_book', 'admin', 'get', lambda ctx: (f'/book/{ctx.book()}/edit/', {})),
+    Scenario('delete_book', 'delete_book', 'admin', 'get', lambda ctx: (f'/book/{_book_to_delete(ctx)}/delete/', {})),
+    Scenario('book_detail', 'book_detail', 'anon', 'get', lambda ctx: (f'/book/{ctx.book()}/detail/', {})),
+    Scenario('book_detail[en]', 'book_detail', 'anon', 'get', lambda ctx: (f'/book/{ctx.book()}/detail/?lang=en', {})),
+    Scenario('book_details', 'book_details', 'anon', 'get', _details('')),
+    Scenario('book_details[en]', 'book_details', 'anon', 'get', _details('&lang=en')),
+    Scenario('view_cart', 'view_cart', 'user', 'get', _get('/cart/')),
+    Scenario('view_cart[en]', 'view_cart', 'user', 'get', _get('/cart/?lang=en')),
+    Scenario('add_to_cart', 'add_to_cart', 'user', 'post', lambda ctx: (f'/cart/add/{ctx.book()}/', {})),
+    Scenario('remove_from_cart', 'remove_from_cart', 'user', 'post', lambda ctx: (f'/cart/remove/{_new_cart_item(ctx)}/', {})),
+    Scenario('checkout_cart', 'checkout_cart', 'user', 'post', _checkout),
+    Scenario('cart_batch', 'cart_batch', 'user', 'post', _batch),
+    Scenario('admin_users_list', 'admin_users_list', 'admin', 'get', _get('/manage/users/')),
+    Scenario('admin_user_cart', 'admin_user_cart', 'admin', 'get',
+             lambda ctx: (f'/manage/user/{ctx.fixture.users[0].pk}/cart/', {})),
+    Scenario('admin_promote_user', 'admin_promote_user', 'admin', 'get',
+             lambda ctx: (f'/manage/user/{ctx.fixture.target.pk}/promote/', {})),
+    Scenario('metrics_json', 'metrics_json', 'admin', 'get', _get('/manage/metrics/')),
+    Scenario('export_books', 'export_books', 'admin', 'get', _get('/manage/export/books/?lang=en')),
+    Scenario('export_carts', 'export_carts', 'admin', 'get', _get('/manage/export/carts/')),
+    Scenario('profiles_list', 'profiles_list', 'admin', 'get', _get('/manage/profiles/')),
+    Scenario('profile_download', 'profile_download', 'admin', 'get',
+             lambda ctx: (f'/manage/profiles/{_profile_name(ctx)}.txt', {})),
+]
+
+
+def url_names():
+    from .urls import urlpatterns
+    return {p.name for p in urlpatterns if getattr(p, 'name', None)}
+
+
+def missing_routes():
+    """Маршруты без сценария — новый view нужно добавить в SCENARIOS."""
+    return sorted(url_names() - {s.url_name for s in SCENARIOS})
+
+
+def load_replay(path, role='user'):
+    """Запросы из JSONL: {"method", "path", "role"?, "body"?}; подходят и строки лога library.perf."""
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(data, dict) or not str(data.get('path', '')).startswith('/'):
+                continue
+            body = data.get('body')
+            kwargs = {}
+            if body is not None:
+                kwargs = {'data': body if isinstance(body, str) else json.dumps(body),
+                          'content_type': data.get('content_type', 'application/json')}
+            try:
+                label = 'replay:' + (resolve(data['path'].split('?')[0]).url_name or '?')
+            except Resolver404:
+                label = 'replay:unresolved'
+            entries.append(Scenario(label, None, data.get('role', role), data.get('method', 'get').lower(),
+                                    lambda ctx, p=data['path'], k=kwargs: (p, k)))
+    return entries
+
+
+class Worker:
+    """Клиенты одного потока: свой на каждый сценарий (logout не разлогинивает остальные)."""
+
+    def __init__(self, fixture, index, seed_value):
+        self.fixture = fixture
+        self.rng = random.Random(seed_value + index)
+        self.user_for = {
+            'anon': None,
+            'user': fixture.users[index % len(fixture.users)],
+            'admin': fixture.admin,
+        }
+        self.clients = {}
+
+    def client(self, scenario):
+        key = (scenario.label, scenario.role)
+        if key not in self.clients:
+            client = Client(raise_request_exception=False)
+            if self.user_for[scenario.role] is not None:
+                client.force_login(self.user_for[scenario.role])
+            self.clients[key] = client
+        return self.clients[key]
+
+    def request(self, scenario):
+        client = self.client(scenario)
+        ctx = SimpleNamespace(fixture=self.fixture, client=client, user=self.user_for[scenario.role],
+                              book=lambda: self.rng.choice(self.fixture.book_ids))
+        path, kwargs = scenario.build(ctx)
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(count):
+            response = getattr(client, scenario.method)(path, **kwargs)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+        elapsed = time.perf_counter() - started
+        return response.status_code, elapsed, queries
+
+
+def summarize(samples, seconds):
+    """Сводка по списку (статус, секунды, число SQL-запросов)."""
+    latencies = [s[1] for s in samples]
+    queries = [s[2] for s in samples]
+    statuses = Counter(s[0] for s in samples)
+    return {
+        'requests': len(samples),
+        'errors': sum(n for status, n in statuses.items() if status >= 400),
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+        'req_per_s': round(len(samples) / seconds, 1) if seconds else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+        'queries_mean': round(statistics.mean(queries), 2),
+        'queries_max': max(queries),
+    }
+
+
+def _drive(workers, jobs, warmup=()):
+    """Раздать запросы потокам по кругу; вернуть образцы и общее время."""
+    def work(worker, part):
+        try:
+            # первый запрос клиента пишет роли в сессию и греет кэши — не считаем
+            for scenario in warmup:
+                worker.request(scenario)
+            samples = []
+            for scenario in part:
+                status, elapsed, queries = worker.request(scenario)
+                samples.append((scenario.label, status, elapsed, len(queries)))
+            return samples
+        finally:
+            connection.close()
+
+    shares = [jobs[i::len(workers)] for i in range(len(workers))]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(workers)) as pool:
+        samples = [sample for part in pool.map(work, workers, shares) for sample in part]
+    return samples, time.perf_counter() - started
+
+
+def run(fixture, scenarios, iterations=20, concurrency=1, warmup=1, seed_value=0):
+    """Каждый сценарий `iterations` раз подряд; {label: сводка}."""
+    workers = [Worker(fixture, i, seed_value) for i in range(concurrency)]
+    results = {}
+    for scenario in scenarios:
+        samples, elapsed = _drive(workers, [scenario] * iterations, [scenario] * warmup)
+        results[scenario.label] = summarize([s[1:] for s in samples], elapsed)
+    return results
+
+
+def replay(fixture, entries, concurrency=1, seed_value=0):
+    """Записанный трафик в исходном порядке; сводка по маршрутам и общая ('total')."""
+    workers = [Worker(fixture, i, seed_value) for i in range(concurrency)]
+    samples, elapsed = _drive(workers, entries)
+    results = {'total': summarize([s[1:] for s in samples], elapsed)}
+    for label in sorted({s[0] for s in samples}):
+        results[label] = summarize([s[1:] for s in samples if s[0] == label], None)
+    return results
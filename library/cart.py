@@ -0,0 +1,135 @@
+"""
+Атомарные операции с корзиной.
+
+Количество меняется в самой БД (`INSERT ... ON CONFLICT DO UPDATE` или
+`UPDATE ... SET quantity = quantity + n`), а не чтением и записью
+в Python, поэтому одновременные клики не теряют обновления. Обычное
+добавление — один запрос, если корзина уже есть.
+"""
+
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import MAX_ID, Book, Cart, CartItem
+
+
+def _upsert_sql(connection):
+    item = connection.ops.quote_name(CartItem._meta.db_table)
+    cart = connection.ops.quote_name(Cart._meta.db_table)
+    book = connection.ops.quote_name(Book._meta.db_table)
+    # INSERT ... SELECT: строка вставляется, только если есть и корзина, и книга
+    return f"""
+        INSERT INTO {item} (cart_id, book_id, quantity, added_at)
+        SELECT c.id, %s, %s, %s FROM {cart} c
+        WHERE c.user_id = %s AND EXISTS (SELECT 1 FROM {book} b WHERE b.id = %s)
+        ON CONFLICT (cart_id, book_id) DO UPDATE SET quantity =
+            CASE WHEN {item}.quantity + %s < 1 THEN 1 ELSE {item}.quantity + %s END
+    """
+
+
+def _upsert(user_id, book_id, qty):
+    """Один запрос; 0 — нет корзины или книги."""
+    connection = connections[router.db_for_write(CartItem)]
+    if not connection.features.supports_update_conflicts_with_target:
+        updated = CartItem.objects.filter(cart__user_id=user_id, book_id=book_id).update(
+            quantity=Greatest(F('quantity') + qty, 1),
+        )
+        if updated:
+            return updated
+        cart_id = Cart.objects.filter(user_id=user_id).values_list('id', flat=True).first()
+        if cart_id is None or not Book.objects.filter(pk=book_id).exists():
+            return 0
+        try:
+            with transaction.atomic(using=connection.alias):
+                CartItem.objects.create(cart_id=cart_id, book_id=book_id, quantity=max(1, qty))
+        except IntegrityError:
+            # одновременный клик уже вставил строку
+            return _upsert(user_id, book_id, qty)
+        return 1
+    with connection.cursor() as cursor:
+        cursor.execute(_upsert_sql(connection), [book_id, max(1, qty), timezone.now(), user_id, book_id, qty, qty])
+        return cursor.rowcount
+
+
+def add_item(user, book_id, qty=1):
+    """Добавить `qty` экземпляров книги. False — книги нет."""
+    if not 1 <= book_id <= MAX_ID:
+        return False
+    if _upsert(user.pk, book_id, qty):
+        return True
+    # первый раз: корзины ещё нет
+    Cart.objects.get_or_create(user=user)
+    return bool(_upsert(user.pk, book_id, qty))
+
+
+def set_item(cart, book_id, qty):
+    """Задать количество (0 и меньше — убрать книгу)."""
+    if qty < 1:
+        remove_item(cart, book_id)
+        return
+    CartItem.objects.bulk_create(
+        [CartItem(cart=cart, book_id=book_id, quantity=qty)],
+        update_conflicts=True,
+        unique_fields=['cart', 'book'],
+        update_fields=['quantity'],
+    )
+
+
+def remove_item(cart, book_id):
+    CartItem.objects.filter(cart=cart, book_id=book_id).delete()
+
+
+BATCH_OPS = ('add', 'remove', 'set')
+MAX_BATCH_OPS = 100
+# сколько экземпляров одной книги можно добавить или задать за одну операцию
+MAX_QUANTITY = 99
+
+
+def parse_ops(payload):
+    """Проверить тело batch-запроса; ValueError с описанием ошибки."""
+    ops = payload.get('ops') if isinstance(payload, dict) else None
+    if not isinstance(ops, list) or not ops:
+        raise ValueError('"ops" must be a non-empty list')
+    if len(ops) > MAX_BATCH_OPS:
+        raise ValueError(f'at most {MAX_BATCH_OPS} ops per request')
+    parsed = []
+    for i, op in enumerate(ops):
+        if not isinstance(op, dict) or op.get('op') not in BATCH_OPS:
+            raise ValueError(f'ops[{i}]: "op" must be one of {", ".join(BATCH_OPS)}')
+        book_id, qty = op.get('book'), op.get('quantity', 1)
+        if not isinstance(book_id, int) or isinstance(book_id, bool) or not 1 <= book_id <= MAX_ID:
+            raise ValueError(f'ops[{i}]: "book" must be a positive integer id')
+        if not isinstance(qty, int) or isinstance(qty, bool):
+            raise ValueError(f'ops[{i}]: "quantity" must be an integer')
+        if op['op'] != 'remove' and not 1 <= qty <= MAX_QUANTITY:
+            raise ValueError(f'ops[{i}]: "quantity" must be between 1 and {MAX_QUANTITY}')
+        parsed.append((op['op'], book_id, qty))
+    return parsed
+
+
+def apply_batch(user, ops):
+    """Выполнить операции одной транзакцией; вернуть итоговое содержимое корзины.
+
+    Несуществующие книги — ValueError, и ни одна операция не применяется.
+    """
+    book_ids = {book_id for op, book_id, _ in ops if op != 'remove'}
+    missing = book_ids - set(Book.objects.filter(pk__in=book_ids).values_list('pk', flat=True))
+    if missing:
+        raise ValueError(f'unknown books: {", ".join(map(str, sorted(missing)))}')
+
+    with transaction.atomic():
+        cart, _ = Cart.objects.get_or_create(user=user)
+        for op, book_id, qty in ops:
+            if op == 'add':
+                _upsert(user.pk, book_id, qty)
+            elif op == 'set':
+                set_item(cart, book_id, qty)
+            else:
+                remove_item(cart, book_id)
+        items = list(cart.items.order_by('added_at', 'id').values('book_id', 'quantity'))
+    return {
+        'items': [{'book': i['book_id'], 'quantity': i['quantity']} for i in items],
+        'count': sum(i['quantity'] for i in items),
+    }
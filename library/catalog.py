@@ -0,0 +1,98 @@
+"""
+Фильтры каталога и счётчики фасетов для боковой панели.
+
+Фильтры (`?author=`, `?publisher=`, `?year_from=`, `?year_to=`) — точные
+совпадения и диапазон, чтобы страница читалась по составным индексам
+Book (author/publisher/year + id, см. models.py) так же, как без фильтра.
+
+Фасеты (авторы, издательства, десятилетия) считаются GROUP BY по текущей
+выборке без собственного измерения — как в обычном фасетном поиске — и
+кэшируются по версии каталога: любое изменение книги меняет версию
+(signals.py), и старые счётчики перестают запрашиваться.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, IntegerField
+from django.db.models.functions import Cast
+
+from .models import Book
+from .translation import translate_many
+from .versioning import make_etag, request_catalog_version
+
+FILTER_PARAMS = ('author', 'publisher', 'year_from', 'year_to')
+FACETS = ('author', 'publisher', 'decade')
+# сколько значений фасета показывать (самые частые)
+FACET_LIMIT = getattr(settings, 'CATALOG_FACET_LIMIT', 15)
+
+
+def _year(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_filters(params):
+    """Фильтры из GET-параметров; пустые и некорректные значения отбрасываются."""
+    filters = {}
+    for name in ('author', 'publisher'):
+        value = params.get(name, '').strip()[:255]
+        if value:
+            filters[name] = value
+    for name in ('year_from', 'year_to'):
+        year = _year(params.get(name))
+        if year is not None:
+            filters[name] = year
+    return filters
+
+
+def filters_key(filters):
+    return make_etag(*(f'{name}={filters.get(name, "")}' for name in FILTER_PARAMS))
+
+
+def apply_filters(queryset, filters, exclude=None):
+    """Отфильтровать книги; `exclude` — фасет, чьё измерение не учитывать."""
+    if 'author' in filters and exclude != 'author':
+        queryset = queryset.filter(author=filters['author'])
+    if 'publisher' in filters and exclude != 'publisher':
+        queryset = queryset.filter(publisher=filters['publisher'])
+    if exclude != 'decade':
+        if 'year_from' in filters:
+            queryset = queryset.filter(year__gte=filters['year_from'])
+        if 'year_to' in filters:
+            queryset = queryset.filter(year__lte=filters['year_to'])
+    return queryset
+
+
+def _facet_rows(facet, filters):
+    books = apply_filters(Book.objects.all(), filters, exclude=facet)
+    if facet == 'decade':
+        # целочисленное деление: 1987 -> 1980
+        books = books.annotate(value=Cast(F('year') / 10, IntegerField()) * 10)
+        rows = books.values('value').annotate(count=Count('id')).order_by('-value')
+    else:
+        rows = books.values(value=F(facet)).annotate(count=Count('id')).order_by('-count', 'value')
+    return [(row['value'], row['count']) for row in rows[:FACET_LIMIT]]
+
+
+def facet_counts(request, filters, lang='ru'):
+    """{'author': [(значение, подпись, число), ...], 'publisher': ..., 'decade': ...} из кэша.
+
+    Подписи авторов переводятся на `lang`, значения остаются исходными —
+    по ним и фильтруем.
+    """
+    version, _ = request_catalog_version(request)
+    key = f'library:facets:{version}:{lang}:{filters_key(filters)}'
+    facets = cache.get(key)
+    if facets is None:
+        rows = {facet: _facet_rows(facet, filters) for facet in FACETS}
+        labels = {}
+        if lang != 'ru':
+            labels = translate_many([value for value, _ in rows['author']], lang)
+        facets = {
+            facet: [(value, labels.get(value, value), count) for value, count in facet_rows]
+            for facet, facet_rows in rows.items()
+        }
+        cache.set(key, facets, settings.GRID_CACHE_TIMEOUT)
+    return facets
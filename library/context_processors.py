@@ -0,0 +1,9 @@
+from .roles import get_roles, is_admin
+
+
+def roles(request):
+    """Роли пользователя для шаблонов (те же, что проверяют views)."""
+    return {
+        'roles': get_roles(request),
+        'is_library_admin': is_admin(request),
+    }
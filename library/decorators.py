@@ -1,32 +1,91 @@
 from functools import wraps
-from django.core.exceptions import PermissionDenied
+from asgiref.sync import iscoroutinefunction, sync_to_async
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import redirect
-from django.urls import reverse
+from django.shortcuts import render
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from .roles import is_admin
 
 
 def admin_required(view_func):
     """Decorator to require that the user is authenticated and an admin.
 
-    Admin is considered either `user.is_staff` or membership of group named 'admin'.
-    Raises `PermissionDenied` for authenticated non-admins; unauthenticated users
-    are redirected by `login_required` behavior.
+    Admin is considered either `user.is_staff` or membership of group named 'admin'
+    (see `library.roles`, resolved once per request). Authenticated non-admins get
+    the `admin_required.html` page with status 403; unauthenticated users are
+    redirected by `login_required` behavior.
     """
     @login_required
     @wraps(view_func)
     def _wrapped(request, *args, **kwargs):
-        user = request.user
-        try:
-            is_admin = bool(getattr(user, 'is_staff', False) or user.groups.filter(name='admin').exists())
-        except Exception:
-            is_admin = False
-
-            if not is_admin:
-                try:
-                    url = reverse('admin_required')
-                    return redirect(f"{url}?next={request.path}")
-                except Exception:
-                    raise PermissionDenied
+        if not is_admin(request):
+            return render(request, 'library/admin_required.html', {
+                'lang': request.GET.get('lang', 'ru'),
+                'next': request.path,
+            }, status=403)
         return view_func(request, *args, **kwargs)
 
     return _wrapped
+
+
+def cache_headers(public=False, max_age=0):
+    """Проставить Cache-Control/Vary/Content-Language, в том числе на ответы 304.
+
+    Ставится снаружи `condition()`, чтобы заголовки попадали и в ответы,
+    которые `condition()` возвращает без вызова view. Язык передаётся в
+    `?lang=`, поэтому прокси и так хранит версии разных языков отдельно.
+    Страницы, зависящие от пользователя (`public=False`), варьируются по Cookie.
+    Работает и с async view.
+    """
+    def patch(request, response):
+        if public:
+            patch_cache_control(response, public=True, max_age=max_age)
+        else:
+            patch_cache_control(response, private=True, max_age=max_age, must_revalidate=True)
+            patch_vary_headers(response, ('Cookie',))
+        response.headers.setdefault('Content-Language', request.GET.get('lang', 'ru'))
+        return response
+
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def _async_wrapped(request, *args, **kwargs):
+                return patch(request, await view_func(request, *args, **kwargs))
+            return _async_wrapped
+
+        @wraps(view_func)
+        def _wrapped(request, *args, **kwargs):
+            return patch(request, view_func(request, *args, **kwargs))
+        return _wrapped
+    return decorator
+
+
+def async_condition(etag_func=None, last_modified_func=None):
+    """`condition()` для async view.
+
+    Django вызывает etag/last_modified синхронно прямо в цикле событий,
+    а наши функции ходят в БД. Здесь они считаются в потоке заранее,
+    а `condition()` получает уже готовые значения.
+    """
+    def precomputed(attr):
+        return lambda request, *args, **kwargs: getattr(request, attr)
+
+    def compute(request, *args, **kwargs):
+        request._condition_etag = etag_func(request, *args, **kwargs) if etag_func else None
+        request._condition_last_modified = (
+            last_modified_func(request, *args, **kwargs) if last_modified_func else None
+        )
+
+    def decorator(view_func):
+        conditional = condition(
+            etag_func=precomputed('_condition_etag'),
+            last_modified_func=precomputed('_condition_last_modified'),
+        )(view_func)
+
+        @wraps(view_func)
+        async def _wrapped(request, *args, **kwargs):
+            await sync_to_async(compute)(request, *args, **kwargs)
+            return await conditional(request, *args, **kwargs)
+        return _wrapped
+    return decorator
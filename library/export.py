@@ -0,0 +1,104 @@
+"""
+Потоковая выгрузка каталога и корзин в CSV/JSONL.
+
+Строки читаются `.values().iterator(chunk_size=...)` и сразу
+сериализуются, поэтому ни queryset, ни готовый файл не держатся в памяти.
+Переводы берутся из `BookTranslation` одним LEFT JOIN (FilteredRelation);
+если перевода ещё нет, отдаётся оригинал — переводчик при выгрузке
+не вызывается.
+"""
+
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, FilteredRelation, Q
+from django.db.models.functions import Coalesce
+
+from .models import Book, CartItem
+
+EXPORT_CHUNK_SIZE = 2000
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# имя колонки -> путь в ORM
+BOOK_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'author': 'author',
+    'year': 'year',
+    'publisher': 'publisher',
+    'description': 'description',
+    'cover': 'cover',
+    'updated_at': 'updated_at',
+}
+CART_FIELDS = {
+    'user_id': 'cart__user_id',
+    'username': 'cart__user__username',
+    'book_id': 'book_id',
+    'title': 'book__title',
+    'author': 'book__author',
+    'quantity': 'quantity',
+    'added_at': 'added_at',
+}
+# поля, у которых есть перевод в BookTranslation
+TRANSLATED = {'title', 'author', 'description'}
+
+
+def parse_fields(value, available):
+    """Список колонок из `?fields=a,b`; неизвестные имена — ValueError."""
+    if not value:
+        return list(available)
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in available]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def _values(queryset, fields, paths, lang, book_path=''):
+    """Queryset словарей с колонками `fields`, переведёнными на `lang`."""
+    exprs = {}
+    translated = lang != 'ru' and TRANSLATED & set(fields)
+    if translated:
+        queryset = queryset.annotate(tr=FilteredRelation(
+            f'{book_path}translations', condition=Q(**{f'{book_path}translations__lang': lang}),
+        ))
+    for name in fields:
+        if translated and name in TRANSLATED:
+            exprs[f'x_{name}'] = Coalesce(F(f'tr__{name}'), F(paths[name]))
+        else:
+            exprs[f'x_{name}'] = F(paths[name])
+    # values() с выражениями не может брать имена, совпадающие с полями модели
+    return queryset.values(**exprs)
+
+
+def book_rows(fields, lang='ru'):
+    qs = _values(Book.objects.order_by('id'), fields, BOOK_FIELDS, lang)
+    return qs.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def cart_rows(fields, lang='ru'):
+    qs = _values(CartItem.objects.order_by('cart__user_id', 'id'), fields, CART_FIELDS, lang, book_path='book__')
+    return qs.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+class _Echo:
+    """Псевдофайл для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def stream(rows, fields, fmt):
+    """Генератор строк файла для StreamingHttpResponse."""
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield '\ufeff' + writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow([row[f'x_{f}'] for f in fields])
+    else:
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+        for row in rows:
+            yield encoder.encode({f: row[f'x_{f}'] for f in fields}) + '\n'
@@ -1,5 +1,6 @@
 from django import forms
 from .models import Book
+from .images import schedule_process_cover
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 
@@ -13,9 +14,15 @@ class BookForm(forms.ModelForm):
             'year': forms.NumberInput(attrs={'class': 'form-control'}),
             'publisher': forms.TextInput(attrs={'class': 'form-control'}),
             'description': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
-            'cover': forms.ClearableFileInput(attrs={'class': 'form-control'}),
+            'cover': forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': 'image/*'}),
         }
 
+    def save(self, commit=True):
+        book = super().save(commit)
+        if commit and 'cover' in self.changed_data:
+            schedule_process_cover(book)
+        return book
+
 class RegisterForm(UserCreationForm):
     email = forms.EmailField()
 
@@ -0,0 +1,213 @@
+"""
+Производные версии обложек: уменьшенные копии в современных форматах,
+размеры оригинала и крошечный размытый placeholder.
+
+`build_derivatives` работает только с файлами и не трогает ORM, поэтому
+её можно запускать в пуле процессов (см. команду `backfill_covers`).
+После сохранения книги производные строятся в фоновом потоке
+(`schedule_process_cover`), а не в запросе.
+"""
+
+import base64
+import hashlib
+import io
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from PIL import Image, ImageFilter, ImageOps, features
+
+from . import metrics
+
+DERIVED_DIR = 'covers/derived'
+
+# формат -> (имя для Pillow, расширение, MIME, параметры сохранения)
+FORMATS = {
+    'avif': ('AVIF', 'avif', 'image/avif', {'quality': 50}),
+    'webp': ('WEBP', 'webp', 'image/webp', {'quality': 75, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg', {'quality': 80, 'optimize': True, 'progressive': True}),
+}
+# jpeg всегда нужен как запасной вариант для <img src>
+FALLBACK_FORMAT = 'jpeg'
+
+PLACEHOLDER_SIZE = 16
+
+
+def cover_variants():
+    """Имя варианта -> ширина в пикселях."""
+    return dict(getattr(settings, 'COVER_VARIANTS', {'thumb': 200, 'modal': 600}))
+
+
+def cover_formats():
+    """Форматы из `COVER_FORMATS`, которые поддерживает установленный Pillow."""
+    wanted = getattr(settings, 'COVER_FORMATS', ['avif', 'webp', 'jpeg'])
+    formats = [f for f in wanted if f in FORMATS and (f == 'jpeg' or features.check(f))]
+    if FALLBACK_FORMAT not in formats:
+        formats.append(FALLBACK_FORMAT)
+    return formats
+
+
+def derived_stem(name):
+    """Базовое имя производных файлов для обложки `name` (covers/foo.png -> foo_png)."""
+    return Path(name).name.replace('.', '_')
+
+
+def _placeholder(image):
+    tiny = image.copy()
+    tiny.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    tiny = tiny.filter(ImageFilter.GaussianBlur(1))
+    buf = io.BytesIO()
+    tiny.save(buf, 'JPEG', quality=40)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buf.getvalue()).decode('ascii')
+
+
+def build_derivatives(source_path, media_root, stem, variants, formats):
+    """Сгенерировать варианты обложки и вернуть поля для `Book`.
+
+    Файлы пишутся в `media_root/covers/derived/<stem>-<variant>.<ext>`.
+    """
+    os.makedirs(os.path.join(media_root, DERIVED_DIR), exist_ok=True)
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+
+    width, height = image.size
+    result = {}
+    by_width = {}
+    for variant, target_width in variants.items():
+        w = min(target_width, width)
+        h = max(1, round(height * w / width))
+        if w in by_width:
+            # оригинал уже, чем вариант: файлы той же ширины не дублируем
+            result[variant] = dict(by_width[w])
+            continue
+        resized = image if w == width else image.resize((w, h), Image.Resampling.LANCZOS)
+        files = {}
+        for fmt in formats:
+            pil_format, ext, _, options = FORMATS[fmt]
+            rel = f'{DERIVED_DIR}/{stem}-{variant}.{ext}'
+            target = os.path.join(media_root, rel)
+            # уникальное имя: одну и ту же обложку могут обрабатывать два процесса сразу
+            tmp = f'{target}.{uuid.uuid4().hex}.part'
+            resized.save(tmp, pil_format, **options)
+            os.replace(tmp, target)
+            files[fmt] = rel
+        result[variant] = by_width[w] = {'width': w, 'height': h, 'files': files}
+
+    return {
+        'cover_width': width,
+        'cover_height': height,
+        'cover_placeholder': _placeholder(image),
+        'cover_variants': result,
+    }
+
+
+def ingest_cover_file(source_path, media_root, variants, formats):
+    """Положить локальный файл в контентно-адресуемое хранилище и построить производные.
+
+    Как и `build_derivatives`, не использует ORM и годится для пула процессов.
+    Возвращает поля `Book`, включая `cover`.
+    """
+    from .storage import ContentAddressedStorage
+
+    digest = hashlib.sha256()
+    with open(source_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    name = ContentAddressedStorage.hashed_name(f'covers/{Path(source_path).name}', digest.hexdigest())
+    target = os.path.join(media_root, name)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f'{target}.{uuid.uuid4().hex}.part'
+        shutil.copyfile(source_path, tmp)
+        os.replace(tmp, target)
+
+    fields = build_derivatives(target, media_root, derived_stem(name), variants, formats)
+    fields['cover'] = name
+    return fields
+
+
+EMPTY_COVER_FIELDS = {
+    'cover_width': None,
+    'cover_height': None,
+    'cover_placeholder': '',
+    'cover_variants': {},
+}
+
+
+def process_cover(book):
+    """Пересчитать производные обложки книги и сохранить их в БД.
+
+    Обновление идёт через `update()`, чтобы не вызывать повторно
+    post_save (и перевод книги).
+    """
+    from django.utils import timezone
+    from .models import Book
+    from .versioning import bump_catalog_version
+
+    if book.cover:
+        # такой же файл уже обработан для другой книги (контентная адресация)
+        fields = (
+            Book.objects.filter(cover=book.cover.name)
+            .exclude(pk=book.pk)
+            .exclude(cover_variants={})
+            .values(*EMPTY_COVER_FIELDS)
+            .first()
+        )
+        if fields is None:
+            fields = build_derivatives(
+                book.cover.path,
+                settings.MEDIA_ROOT,
+                derived_stem(book.cover.name),
+                cover_variants(),
+                cover_formats(),
+            )
+    else:
+        fields = dict(EMPTY_COVER_FIELDS)
+    for name, value in fields.items():
+        setattr(book, name, value)
+    book.updated_at = timezone.now()
+    Book.objects.filter(pk=book.pk).update(updated_at=book.updated_at, **fields)
+    bump_catalog_version()
+    return fields
+
+
+_cover_executor = None
+_cover_lock = threading.Lock()
+
+
+def _run_process_cover(book_id, cover):
+    from django.db import connections
+    from .models import Book
+
+    try:
+        book = Book.objects.filter(pk=book_id).first()
+        # обложку успели заменить — её обработает следующая задача
+        if book is not None and (book.cover.name or '') == cover:
+            process_cover(book)
+    except Exception:
+        metrics.incr('covers.process_errors')
+    finally:
+        connections.close_all()
+
+
+def schedule_process_cover(book):
+    """Построить производные обложки в фоне после коммита.
+
+    Пока они не готовы, сетка показывает оригинал (`Book.cover_thumb`).
+    При `COVER_PROCESSING_ASYNC = False` обработка выполняется сразу.
+    """
+    global _cover_executor
+    if not getattr(settings, 'COVER_PROCESSING_ASYNC', True):
+        process_cover(book)
+        return
+
+    with _cover_lock:
+        if _cover_executor is None:
+            _cover_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='book-covers')
+    book_id, cover = book.pk, book.cover.name or ''
+    transaction.on_commit(lambda: _cover_executor.submit(_run_process_cover, book_id, cover))
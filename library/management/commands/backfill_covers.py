@@ -0,0 +1,78 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from library.images import build_derivatives, cover_formats, cover_variants, derived_stem
+from library.models import Book
+from library.versioning import bump_catalog_version
+
+FIELDS = ['cover_width', 'cover_height', 'cover_placeholder', 'cover_variants', 'updated_at']
+
+
+class Command(BaseCommand):
+    help = 'Сгенерировать производные обложек (миниатюры, WebP/AVIF, placeholder) для существующих книг.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Пересоздать и для книг, у которых варианты уже есть.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Число процессов.')
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        books = Book.objects.exclude(cover='').exclude(cover__isnull=True)
+        if not options['force']:
+            books = books.filter(cover_variants={})
+        books = books.only('id', 'cover').order_by('id')
+
+        variants = cover_variants()
+        formats = cover_formats()
+        batch_size = options['batch_size']
+        done = failed = 0
+
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            batch = []
+            for book in books.iterator(chunk_size=batch_size):
+                batch.append(book)
+                if len(batch) >= batch_size:
+                    ok, bad = self._process(pool, batch, variants, formats)
+                    done, failed = done + ok, failed + bad
+                    batch = []
+            if batch:
+                ok, bad = self._process(pool, batch, variants, formats)
+                done, failed = done + ok, failed + bad
+
+        if done:
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f'Обработано: {done}, ошибок: {failed}'))
+
+    def _process(self, pool, batch, variants, formats):
+        futures = {
+            pool.submit(
+                build_derivatives,
+                book.cover.path,
+                settings.MEDIA_ROOT,
+                derived_stem(book.cover.name),
+                variants,
+                formats,
+            ): book
+            for book in batch
+        }
+        updated = []
+        failed = 0
+        for future in as_completed(futures):
+            book = futures[future]
+            try:
+                fields = future.result()
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f'{book.pk} {book.cover.name}: {exc}')
+                continue
+            for name, value in fields.items():
+                setattr(book, name, value)
+            book.updated_at = timezone.now()
+            updated.append(book)
+        Book.objects.bulk_update(updated, FIELDS)
+        self.stdout.write(f'+{len(updated)}')
+        return len(updated), failed
@@ -0,0 +1,214 @@
+import json
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from library import benchmark, oidc_backend
+from library.benchmark import percentile
+
+
+class _Server(ThreadingHTTPServer):
+    # очередь побольше: при backlog 5 шторм логинов упирается в повторы SYN, а не в IdP
+    request_queue_size = 256
+    daemon_threads = True
+
+
+class StandInIdP:
+    """Локальная замена Keycloak: /token, /certs, /userinfo с заданной задержкой.
+
+    Код авторизации — «номер пользователя:nonce»; ID-токен подписывается
+    текущим RSA-ключом, `rotate()` выпускает новый ключ с новым kid. Как и
+    realm Keycloak по умолчанию, JWKS содержит ещё ключ шифрования RSA-OAEP.
+    """
+
+    def __init__(self, latency=0.0, id_token_claims=True):
+        self.latency = latency
+        self.id_token_claims = id_token_claims
+        self.hits = Counter()
+        self._lock = threading.Lock()
+        self._keys = []
+        self.rotate()
+        self.enc_jwk = self._public_jwk(kid='bench-enc', alg='RSA-OAEP', use='enc')
+        self.server = _Server(('127.0.0.1', 0), self._handler())
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @staticmethod
+    def _public_jwk(key=None, **fields):
+        key = key or rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(key.public_key()))
+        jwk.update(fields)
+        return jwk
+
+    def rotate(self):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = self._public_jwk(key, kid=f'bench-{len(self._keys) + 1}', alg='RS256', use='sig')
+        with self._lock:
+            self._keys.append((jwk, key))
+
+    @staticmethod
+    def claims(index):
+        return {
+            'sub': f'bench-{index}',
+            'email': f'reader{index}@example.org',
+            'given_name': f'Reader{index}',
+            'family_name': 'Bench',
+            'preferred_username': f'reader{index}',
+        }
+
+    def _token(self, code):
+        index, nonce = code.split(':', 1)
+        claims = {'nonce': nonce, 'aud': 'bench', 'iss': self.url, 'exp': int(time.time()) + 300}
+        claims.update(self.claims(index) if self.id_token_claims else {'sub': f'bench-{index}'})
+        jwk, key = self._keys[-1]
+        id_token = jwt.encode(claims, key, algorithm='RS256', headers={'kid': jwk['kid']})
+        return {'id_token': id_token, 'access_token': f'access-{index}', 'token_type': 'Bearer'}
+
+    def _handler(self):
+        idp = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, data):
+                body = json.dumps(data).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _serve(self, endpoint):
+                with idp._lock:
+                    idp.hits[endpoint] += 1
+                if idp.latency:
+                    time.sleep(idp.latency)
+
+            def do_POST(self):
+                form = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+                self._serve('token')
+                self._reply(idp._token(form['code'][0]))
+
+            def do_GET(self):
+                if self.path.startswith('/certs'):
+                    self._serve('certs')
+                    self._reply({'keys': [idp.enc_jwk] + [jwk for jwk, _ in idp._keys]})
+                else:
+                    self._serve('userinfo')
+                    index = self.headers['Authorization'].rsplit('-', 1)[1]
+                    self._reply(idp.claims(index))
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class Command(BaseCommand):
+    help = (
+        'Шторм логинов через KeycloakOIDCBackend против локального IdP: логины/с, задержка, '
+        'запросы к IdP и SQL на логин — без кэша (как mozilla_django_oidc) и с кэшем JWKS/claims.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200)
+        parser.add_argument('--users', type=int, default=50, help='Разных пользователей (повторные логины обновляют их).')
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--latency', type=float, default=0.02, help='Задержка ответа IdP, секунд.')
+        parser.add_argument('--rotate-every', type=int, default=0, help='Менять ключ IdP каждые N логинов.')
+        parser.add_argument('--mode', choices=['uncached', 'cached', 'both'], default='both')
+
+    def handle(self, *args, **options):
+        self.options = options
+        modes = ['uncached', 'cached'] if options['mode'] == 'both' else [options['mode']]
+        workdir = tempfile.mkdtemp(prefix='bench_oidc_')
+        setup_test_environment()
+        results = []
+        try:
+            with benchmark.throwaway_database(workdir):
+                for mode in modes:
+                    results.append(self._run(mode))
+        finally:
+            teardown_test_environment()
+            shutil.rmtree(workdir, ignore_errors=True)
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def _run(self, mode):
+        idp = StandInIdP(latency=self.options['latency'])
+        cache_settings = {} if mode == 'cached' else {'OIDC_JWKS_CACHE_TTL': 0, 'OIDC_ID_TOKEN_CLAIMS': None}
+        oidc_backend.reset_jwks_cache()
+        factory = RequestFactory()
+        rotated = threading.Lock()
+
+        def login(n):
+            if self.options['rotate_every'] and n and n % self.options['rotate_every'] == 0:
+                with rotated:
+                    idp.rotate()
+            nonce = f'nonce-{n}'
+            request = factory.get('/oidc/callback/', {'code': f'{n % self.options["users"]}:{nonce}', 'state': 's'})
+            request.session = {}
+            queries = []
+
+            def count(execute, sql, params, many, context):
+                queries.append(sql)
+                return execute(sql, params, many, context)
+
+            started = time.perf_counter()
+            try:
+                with connection.execute_wrapper(count):
+                    user = oidc_backend.KeycloakOIDCBackend().authenticate(request, nonce=nonce)
+            finally:
+                connection.close()
+            return time.perf_counter() - started, len(queries), user is not None
+
+        try:
+            with override_settings(
+                OIDC_OP_TOKEN_ENDPOINT=f'{idp.url}/token',
+                OIDC_OP_JWKS_ENDPOINT=f'{idp.url}/certs',
+                OIDC_OP_USER_ENDPOINT=f'{idp.url}/userinfo',
+                OIDC_TIMEOUT=10,
+                **cache_settings,
+            ):
+                # первый проход создаёт пользователей — меряем повторные логины
+                with ThreadPoolExecutor(max_workers=self.options['concurrency']) as pool:
+                    list(pool.map(login, range(self.options['users'])))
+                idp.hits.clear()
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=self.options['concurrency']) as pool:
+                    samples = list(pool.map(login, range(self.options['logins'])))
+                elapsed = time.perf_counter() - started
+        finally:
+            idp.close()
+
+        latencies = [s[0] for s in samples]
+        logins = len(samples)
+        return {
+            'mode': mode,
+            'logins': logins,
+            'failed': sum(1 for s in samples if not s[2]),
+            'concurrency': self.options['concurrency'],
+            'idp_latency_ms': self.options['latency'] * 1000,
+            'seconds': round(elapsed, 3),
+            'logins_per_s': round(logins / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+            'mean_ms': round(statistics.mean(latencies) * 1000, 1),
+            'idp_requests': dict(idp.hits),
+            'idp_requests_per_login': round(sum(idp.hits.values()) / logins, 2),
+            'db_queries_per_login': round(statistics.mean(s[1] for s in samples), 2),
+        }
@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from library import benchmark, translation
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогнать все маршруты library/urls.py на синтетической тестовой БД с FakeTranslator: '
+        'req/s, p50/p95/p99 и SQL-запросы на запрос. Результат в JSON (--output) для сравнения '
+        'между коммитами (--compare).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=500)
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--iterations', type=int, default=20, help='Запросов на сценарий.')
+        parser.add_argument('--concurrency', type=int, default=1, help='Потоков-клиентов.')
+        parser.add_argument('--warmup', type=int, default=1, help='Неучитываемых запросов на поток.')
+        parser.add_argument('--latency', type=float, default=0.0, help='Задержка FakeTranslator, секунд.')
+        parser.add_argument('--only', action='append', default=[], help='Только сценарии с этой подстрокой.')
+        parser.add_argument('--replay', help='JSONL с запросами ({"method", "path", "role"?, "body"?}).')
+        parser.add_argument('--replay-role', default='user', choices=['anon', 'user', 'admin'])
+        parser.add_argument('--output', help='Куда записать результаты (JSON).')
+        parser.add_argument('--compare', help='JSON прошлого прогона для сравнения.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        missing = benchmark.missing_routes()
+        if missing:
+            self.stderr.write(self.style.WARNING(f'Нет сценариев для маршрутов: {", ".join(missing)}'))
+        scenarios = [s for s in benchmark.SCENARIOS
+                     if not options['only'] or any(part in s.label for part in options['only'])]
+        entries = benchmark.load_replay(options['replay'], options['replay_role']) if options['replay'] else []
+        if not scenarios and not entries:
+            raise CommandError('Нечего запускать.')
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        workdir = tempfile.mkdtemp(prefix='bench_site_')
+        perf_logger = logging.getLogger('library.perf')
+        perf_level = perf_logger.level
+        perf_logger.setLevel(logging.WARNING)
+        setup_test_environment()
+        translation.set_translator(translation.FakeTranslator(latency=options['latency']))
+        translation.memory_cache.clear()
+        # снимки статистики и профили пишутся во временный каталог, а не в MEDIA_ROOT
+        media = os.path.join(workdir, 'media')
+        try:
+            with benchmark.throwaway_database(workdir), override_settings(
+                BOOK_TRANSLATION_ASYNC=False, MEDIA_ROOT=media, PROFILE_DIR=os.path.join(media, 'profiles'),
+            ):
+                fixture = benchmark.seed(options['books'], options['users'])
+                report = {
+                    'meta': {
+                        'commit': git_commit(),
+                        'created': timezone.now().isoformat(),
+                        'python': platform.python_version(),
+                        'django': django.get_version(),
+                        'database': connection.vendor,
+                        'async_views': settings.ASYNC_VIEWS,
+                        'options': {k: options[k] for k in (
+                            'books', 'users', 'iterations', 'concurrency', 'warmup', 'latency', 'seed')},
+                    },
+                    'routes': benchmark.run(fixture, scenarios, options['iterations'],
+                                            options['concurrency'], options['warmup'], options['seed']),
+                }
+                if entries:
+                    report['replay'] = benchmark.replay(fixture, entries, options['concurrency'], options['seed'])
+        finally:
+            translation.set_translator(None)
+            translation.memory_cache.clear()
+            teardown_test_environment()
+            perf_logger.setLevel(perf_level)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self._print(report['routes'], baseline and baseline.get('routes'))
+        if 'replay' in report:
+            self.stdout.write('')
+            self._print(report['replay'], baseline and baseline.get('replay'))
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Результаты записаны в {options["output"]}'))
+
+    def _print(self, results, baseline=None):
+        header = f'{"scenario":<24} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8} {"errors":>6}'
+        if baseline:
+            header += f' {"Δp50":>8} {"Δqueries":>9}'
+        self.stdout.write(header)
+        for label, r in results.items():
+            line = (f'{label:<24} {r["req_per_s"] or "":>8} {r["p50_ms"]:>8} {r["p95_ms"]:>8} '
+                    f'{r["p99_ms"]:>8} {r["queries_mean"]:>8} {r["errors"]:>6}')
+            old = (baseline or {}).get(label)
+            if old:
+                line += f' {r["p50_ms"] - old["p50_ms"]:>+8.2f} {r["queries_mean"] - old["queries_mean"]:>+9.2f}'
+            style = self.style.ERROR if r['errors'] else None
+            self.stdout.write(style(line) if style else line)
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from library import translation
+from library.benchmark import percentile
+from library.models import TranslationCacheEntry
+
+
+class SyncOnlyTranslator:
+    """FakeTranslator без `atranslate` — как translatepy: async-клиент уходит в пул потоков."""
+
+    def __init__(self, translator):
+        self.translator = translator
+
+    def translate(self, text, destination_language, *args, **kwargs):
+        return self.translator.translate(text, destination_language, *args, **kwargs)
+
+
+MODES = ['thread', 'executor', 'native']
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнить пропускную способность перевода на локальном FakeTranslator с заданной задержкой: '
+        'пул потоков (sync views), async-клиент поверх пула потоков (async views с translatepy, '
+        'у которого нет async API) и async-клиент с собственным atranslate.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Сколько «запросов» выполнить.')
+        parser.add_argument('--concurrency', type=int, default=50, help='Одновременных запросов.')
+        parser.add_argument('--strings', type=int, default=10, help='Новых строк на запрос (промахи кэша).')
+        parser.add_argument('--latency', type=float, default=0.05, help='Задержка переводчика, секунд.')
+        parser.add_argument('--lang', default='en')
+        parser.add_argument('--mode', choices=MODES + ['all'], default='all')
+
+    def handle(self, *args, **options):
+        self.options = options
+        translator = translation.FakeTranslator(latency=options['latency'])
+        translation.breaker.reset()
+        self.hashes = []
+        results = []
+        try:
+            modes = MODES if options['mode'] == 'all' else [options['mode']]
+            for mode in modes:
+                translation.set_translator(SyncOnlyTranslator(translator) if mode == 'executor' else translator)
+                translation.memory_cache.clear()
+                calls_before = translator.calls
+                requests = self._requests()
+                started = time.perf_counter()
+                latencies = self._run_threads(requests) if mode == 'thread' else asyncio.run(self._run_async(requests))
+                elapsed = time.perf_counter() - started
+                results.append({
+                    'mode': mode,
+                    'requests': len(requests),
+                    'concurrency': options['concurrency'],
+                    'seconds': round(elapsed, 3),
+                    'req_per_s': round(len(requests) / elapsed, 1),
+                    'p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+                    'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+                    'mean_ms': round(statistics.mean(latencies) * 1000, 1),
+                    'translator_calls': translator.calls - calls_before,
+                })
+        finally:
+            translation.set_translator(None)
+            translation.memory_cache.clear()
+            target_lang = translation.get_target_lang(options['lang'])
+            for start in range(0, len(self.hashes), translation.DB_CHUNK_SIZE):
+                TranslationCacheEntry.objects.filter(
+                    lang=target_lang, source_hash__in=self.hashes[start:start + translation.DB_CHUNK_SIZE],
+                ).delete()
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def _requests(self):
+        # каждая строка уникальна, чтобы каждый запрос шёл к переводчику
+        run = uuid.uuid4().hex[:8]
+        requests = [
+            [f'bench {run} {i} {j}' for j in range(self.options['strings'])]
+            for i in range(self.options['requests'])
+        ]
+        self.hashes.extend(translation.text_hash(t) for texts in requests for t in texts)
+        return requests
+
+    def _one_sync(self, texts):
+        started = time.perf_counter()
+        try:
+            translation.lookup_many(texts, self.options['lang'], budget=None)
+        finally:
+            connection.close()
+        return time.perf_counter() - started
+
+    def _run_threads(self, requests):
+        # как sync-воркер: поток на запрос, переводы — через общий пул TRANSLATION_MAX_WORKERS
+        with ThreadPoolExecutor(max_workers=self.options['concurrency']) as pool:
+            return list(pool.map(self._one_sync, requests))
+
+    async def _run_async(self, requests):
+        limit = asyncio.Semaphore(self.options['concurrency'])
+
+        async def one(texts):
+            async with limit:
+                started = time.perf_counter()
+                await translation.alookup_many(texts, self.options['lang'], budget=None)
+                return time.perf_counter() - started
+
+        return await asyncio.gather(*(one(texts) for texts in requests))
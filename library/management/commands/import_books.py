@@ -0,0 +1,253 @@
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from library.forms import BookForm
+from library.images import cover_formats, cover_variants, ingest_cover_file
+from library.models import Book
+from library.storage import release_cover
+from library.versioning import bump_catalog_version
+
+
+class ImportBookForm(BookForm):
+    """Те же правила, что и в форме add_book/edit_book, но без загрузки файла."""
+
+    class Meta(BookForm.Meta):
+        fields = ['title', 'author', 'year', 'publisher', 'description']
+
+    def _post_clean(self):
+        # существующий естественный ключ здесь не ошибка, а обновление (upsert в _write_batch),
+        # к тому же проверка ограничения стоила бы запроса на каждую строку
+        self.instance.validate_constraints = lambda exclude=None: None
+        super()._post_clean()
+
+
+UPDATE_FIELDS = ['publisher', 'description', 'source_hash', 'updated_at']
+COVER_FIELDS = ['cover', 'cover_width', 'cover_height', 'cover_placeholder', 'cover_variants']
+# SQLite ограничивает число параметров в запросе
+LOOKUP_CHUNK = 300
+
+
+def read_rows(stream, fmt, skip_until=0):
+    """Построчно читать CSV/JSONL, выдавая (номер строки, dict).
+
+    Строки до `skip_until` включительно пропускаются; JSONL при этом не разбирается.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            if reader.line_num > skip_until:
+                yield reader.line_num, row
+    else:
+        for line_no, line in enumerate(stream, 1):
+            if line_no <= skip_until:
+                continue
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield line_no, exc
+                continue
+            yield line_no, row
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоковый импорт книг из CSV/JSONL: валидация по правилам BookForm, пакетная запись '
+        'с upsert по (title, author, year), параллельная обработка обложек и продолжение после сбоя.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл CSV или JSONL ("-" — stdin).')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='По умолчанию — по расширению файла.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Процессы для обработки обложек.')
+        parser.add_argument('--covers-dir', default='.', help='Базовый каталог для относительных путей обложек.')
+        parser.add_argument('--checkpoint', help='Файл контрольной точки (по умолчанию <path>.checkpoint).')
+        parser.add_argument('--resume', action='store_true', help='Пропустить строки, уже записанные прошлым запуском.')
+        parser.add_argument('--errors', help='Куда писать отклонённые строки (JSONL).')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        from_stdin = path == '-'
+        checkpoint = options['checkpoint'] or (None if from_stdin else f'{path}.checkpoint')
+        if options['resume'] and not checkpoint:
+            raise CommandError('--resume требует файл контрольной точки (--checkpoint)')
+
+        skip_until = 0
+        if options['resume'] and os.path.exists(checkpoint):
+            with open(checkpoint, encoding='utf-8') as f:
+                skip_until = json.load(f).get('line', 0)
+            self.stdout.write(f'Продолжаем после строки {skip_until}')
+
+        self.covers_dir = options['covers_dir']
+        self.variants = cover_variants()
+        self.formats = cover_formats()
+        self.errors_file = open(options['errors'], 'a', encoding='utf-8') if options['errors'] else None
+        self.stats = {'read': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'invalid': 0}
+        self.started = time.monotonic()
+
+        stream = sys.stdin if from_stdin else open(path, encoding='utf-8-sig', newline='')
+        pool = ProcessPoolExecutor(max_workers=options['workers'])
+        try:
+            batch = []
+            last_line = skip_until
+            for line_no, row in read_rows(stream, fmt, skip_until):
+                last_line = line_no
+                self.stats['read'] += 1
+                batch.append((line_no, row))
+                if len(batch) >= options['batch_size']:
+                    self._write_batch(batch, pool)
+                    self._save_checkpoint(checkpoint, line_no)
+                    batch = []
+            if batch:
+                self._write_batch(batch, pool)
+                self._save_checkpoint(checkpoint, last_line)
+        finally:
+            pool.shutdown()
+            if not from_stdin:
+                stream.close()
+            if self.errors_file:
+                self.errors_file.close()
+
+        if self.stats['created'] or self.stats['updated']:
+            bump_catalog_version()
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self._progress(final=True)
+        self.stdout.write('Переводы новых книг: manage.py translate_books (или по мере просмотра каталога)')
+
+    # --- разбор и валидация ---
+
+    def _reject(self, line_no, errors):
+        self.stats['invalid'] += 1
+        if self.errors_file:
+            self.errors_file.write(json.dumps({'line': line_no, 'errors': errors}, ensure_ascii=False) + '\n')
+        elif self.stats['invalid'] <= 20:
+            self.stderr.write(f'строка {line_no}: {errors}')
+
+    def _validate(self, batch):
+        """Вернуть {natural key: (строка, данные, путь к обложке)}; дубликаты — последний выигрывает."""
+        valid = {}
+        for line_no, row in batch:
+            if not isinstance(row, dict):
+                self._reject(line_no, str(row))
+                continue
+            form = ImportBookForm(data=row)
+            if not form.is_valid():
+                self._reject(line_no, form.errors.get_json_data())
+                continue
+            data = form.cleaned_data
+            cover = (row.get('cover') or '').strip()
+            if cover:
+                cover = os.path.join(self.covers_dir, cover)
+                if not os.path.isfile(cover):
+                    self._reject(line_no, {'cover': f'файл не найден: {cover}'})
+                    continue
+            valid[tuple(data[f] for f in Book.NATURAL_KEY)] = (line_no, data, cover or None)
+        return valid
+
+    def _ingest_covers(self, valid, pool):
+        # один файл обложки у нескольких книг обрабатывается один раз
+        futures = {}
+        for _, _, cover in valid.values():
+            if cover and cover not in futures:
+                futures[cover] = pool.submit(ingest_cover_file, cover, settings.MEDIA_ROOT, self.variants, self.formats)
+        results = {}
+        for key, (line_no, _, cover) in valid.items():
+            if not cover:
+                continue
+            try:
+                results[key] = futures[cover].result()
+            except Exception as exc:
+                self.stderr.write(f'строка {line_no}: обложка не обработана: {exc}')
+        return results
+
+    def _existing(self, keys):
+        titles = sorted({key[0] for key in keys})
+        found = {}
+        for start in range(0, len(titles), LOOKUP_CHUNK):
+            qs = Book.objects.filter(title__in=titles[start:start + LOOKUP_CHUNK]).only(
+                'id', 'cover', 'publisher', 'description', 'source_hash', *Book.NATURAL_KEY,
+            )
+            for book in qs:
+                key = tuple(getattr(book, f) for f in Book.NATURAL_KEY)
+                if key in keys:
+                    found[key] = book
+        return found
+
+    # --- запись ---
+
+    def _write_batch(self, batch, pool):
+        valid = self._validate(batch)
+        if not valid:
+            self._progress()
+            return
+        covers = self._ingest_covers(valid, pool)
+        released = []
+
+        with transaction.atomic():
+            # прочитанные строки нужны только для статистики и освобождения старых обложек:
+            # запись идёт upsert'ом по уникальному ключу, так что параллельный импорт
+            # той же книги обновит её, а не создаст дубликат
+            existing = self._existing(valid.keys())
+            plain, with_cover = [], []
+            created = updated = 0
+            for key, (_, data, _) in valid.items():
+                cover = covers.get(key)
+                book = Book(**data, **(cover or {}))
+                book.source_hash = book.compute_source_hash()
+                old = existing.get(key)
+                cover_changed = cover and (old is None or cover['cover'] != old.cover.name)
+                if old is None:
+                    created += 1
+                elif cover_changed or (old.publisher, old.description, old.source_hash) != (
+                    book.publisher, book.description, book.source_hash,
+                ):
+                    updated += 1
+                    if cover_changed and old.cover.name:
+                        released.append(old.cover.name)
+                else:
+                    self.stats['unchanged'] += 1
+                    continue
+                # без новой обложки поля обложки у существующей книги не трогаем
+                (with_cover if cover_changed else plain).append(book)
+
+            for books, fields in ((plain, UPDATE_FIELDS), (with_cover, UPDATE_FIELDS + COVER_FIELDS)):
+                Book.objects.bulk_create(
+                    books, batch_size=500, update_conflicts=True,
+                    unique_fields=Book.NATURAL_KEY, update_fields=fields,
+                )
+            for name in released:
+                transaction.on_commit(lambda name=name: release_cover(name))
+
+        self.stats['created'] += created
+        self.stats['updated'] += updated
+        self._progress()
+
+    def _save_checkpoint(self, checkpoint, line_no):
+        if not checkpoint:
+            return
+        tmp = f'{checkpoint}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'line': line_no}, f)
+        os.replace(tmp, checkpoint)
+
+    def _progress(self, final=False):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        s = self.stats
+        line = (
+            f"прочитано {s['read']}, создано {s['created']}, обновлено {s['updated']}, "
+            f"без изменений {s['unchanged']}, отклонено {s['invalid']} — {s['read'] / elapsed:.0f} строк/с"
+        )
+        self.stdout.write(self.style.SUCCESS(line) if final else line)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from library.translation import memory_cache, purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Удалить устаревшие записи из кэша переводов (старше TRANSLATION_CACHE_TTL).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Очистить таблицу кэша полностью.')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            from library.models import TranslationCacheEntry
+            deleted, _ = TranslationCacheEntry.objects.all().delete()
+        else:
+            deleted = purge_expired()
+        memory_cache.clear()
+        self.stdout.write(self.style.SUCCESS(f'Удалено записей: {deleted}'))
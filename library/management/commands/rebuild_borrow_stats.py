@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from library.models import MonthlyBorrowStat
+from library.stats import rebuild_rollup
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать помесячные агрегаты выдач (MonthlyBorrowStat) из BorrowEvent.'
+
+    def handle(self, *args, **options):
+        rebuild_rollup()
+        self.stdout.write(self.style.SUCCESS(f'Месяцев в агрегате: {MonthlyBorrowStat.objects.count()}'))
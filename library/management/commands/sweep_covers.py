@@ -0,0 +1,61 @@
+import os
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from library.images import DERIVED_DIR, derived_stem
+from library.models import Book
+from library.storage import cover_storage, discard_file, sweep_grace
+
+
+class Command(BaseCommand):
+    help = 'Удалить файлы обложек и производных, на которые не ссылается ни одна книга.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет удалено.')
+        parser.add_argument(
+            '--grace', type=int, default=None,
+            help='Не трогать файлы моложе N секунд (по умолчанию COVER_SWEEP_GRACE).',
+        )
+
+    def handle(self, *args, **options):
+        root = Path(cover_storage.path('covers'))
+        if not root.is_dir():
+            self.stdout.write('Каталог covers/ не найден')
+            return
+
+        referenced = set()
+        stems = set()
+        for name in Book.objects.exclude(cover='').exclude(cover__isnull=True).values_list('cover', flat=True).iterator(chunk_size=2000):
+            referenced.add(name)
+            stems.add(derived_stem(name))
+
+        grace = sweep_grace() if options['grace'] is None else options['grace']
+        deadline = time.time() - grace
+        media_root = Path(cover_storage.location)
+        removed = freed = 0
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = Path(dirpath) / filename
+                name = path.relative_to(media_root).as_posix()
+                if name.startswith(DERIVED_DIR + '/'):
+                    if filename.rsplit('-', 1)[0] in stems:
+                        continue
+                elif name in referenced:
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                if stat.st_mtime > deadline:
+                    continue
+                if options['dry_run']:
+                    self.stdout.write(name)
+                elif not discard_file(name, grace):
+                    continue
+                removed += 1
+                freed += stat.st_size
+
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(f'{action} файлов: {removed}, {freed / 1024 / 1024:.1f} МБ'))
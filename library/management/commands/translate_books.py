@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from library.models import Book
+from library.translation import refresh_book_translations, translation_languages
+
+
+class Command(BaseCommand):
+    help = 'Заполнить/обновить BookTranslation для всех книг (устаревшие определяются по source_hash).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lang', action='append', help='Язык (можно несколько). По умолчанию TRANSLATION_LANGUAGES.')
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        langs = options['lang'] or translation_languages()
+        batch_size = options['batch_size']
+        ids = list(Book.objects.order_by('pk').values_list('pk', flat=True))
+        saved = 0
+        for start in range(0, len(ids), batch_size):
+            saved += refresh_book_translations(ids[start:start + batch_size], langs)
+            self.stdout.write(f'{min(start + batch_size, len(ids))}/{len(ids)}')
+        self.stdout.write(self.style.SUCCESS(f'Сохранено переводов: {saved}'))
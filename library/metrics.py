@@ -0,0 +1,130 @@
+"""
+Простые in-process счётчики для диагностики производительности.
+
+Значения живут в памяти текущего процесса и сбрасываются при рестарте.
+"""
+
+import bisect
+import contextvars
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+_timings = {}
+_histograms = {}
+
+# Границы корзин гистограмм, миллисекунды (последняя — всё, что больше)
+HISTOGRAM_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def incr(name, value=1):
+    """Увеличить счётчик `name` на `value`."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, seconds):
+    """Учесть длительность операции `name` (count/total/max)."""
+    with _lock:
+        t = _timings.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+        t['count'] += 1
+        t['total'] += seconds
+        t['max'] = max(t['max'], seconds)
+
+
+def histogram(name, value_ms):
+    """Учесть значение `value_ms` в гистограмме `name`."""
+    index = bisect.bisect_left(HISTOGRAM_BUCKETS, value_ms)
+    with _lock:
+        h = _histograms.get(name)
+        if h is None:
+            h = _histograms[name] = {'count': 0, 'sum': 0.0, 'buckets': [0] * (len(HISTOGRAM_BUCKETS) + 1)}
+        h['count'] += 1
+        h['sum'] += value_ms
+        h['buckets'][index] += 1
+
+
+def _quantile(buckets, count, q):
+    """Оценка квантиля: верхняя граница корзины, в которую он попадает."""
+    rank = q * count
+    seen = 0
+    for i, n in enumerate(buckets):
+        seen += n
+        if seen >= rank and n:
+            return HISTOGRAM_BUCKETS[i] if i < len(HISTOGRAM_BUCKETS) else float('inf')
+    return None
+
+
+def timing(name):
+    with _lock:
+        return dict(_timings.get(name, {'count': 0, 'total': 0.0, 'max': 0.0}))
+
+
+def get(name):
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot():
+    """Копия всех счётчиков для отдачи в JSON."""
+    with _lock:
+        timings = {
+            name: {
+                'count': t['count'],
+                'avg_ms': round(t['total'] / t['count'] * 1000, 3) if t['count'] else 0,
+                'max_ms': round(t['max'] * 1000, 3),
+            }
+            for name, t in sorted(_timings.items())
+        }
+        histograms = {
+            name: {
+                'count': h['count'],
+                'avg_ms': round(h['sum'] / h['count'], 3) if h['count'] else 0,
+                'p50_ms': _quantile(h['buckets'], h['count'], 0.5),
+                'p95_ms': _quantile(h['buckets'], h['count'], 0.95),
+                'p99_ms': _quantile(h['buckets'], h['count'], 0.99),
+                'buckets': {
+                    f'le_{bound}': n for bound, n in zip(HISTOGRAM_BUCKETS + ('inf',), h['buckets']) if n
+                },
+            }
+            for name, h in sorted(_histograms.items())
+        }
+        return {'counters': dict(sorted(_counters.items())), 'timings': timings, 'histograms': histograms}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timings.clear()
+        _histograms.clear()
+
+
+# --- Замеры текущего запроса (заполняет PerformanceMiddleware) ---
+
+
+class RequestTimings:
+    """Суммы времени и числа операций по категориям (db, translator, template)."""
+
+    def __init__(self):
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, count=1):
+        with self._lock:
+            total = self.totals.setdefault(name, [0, 0.0])
+            total[0] += count
+            total[1] += seconds
+
+    def get(self, name):
+        count, seconds = self.totals.get(name, (0, 0.0))
+        return count, seconds
+
+
+current_request = contextvars.ContextVar('library_request_timings', default=None)
+
+
+def add_request_timing(name, seconds, count=1):
+    """Добавить замер к текущему запросу, если его инструментирует middleware."""
+    timings = current_request.get()
+    if timings is not None:
+        timings.add(name, seconds, count)
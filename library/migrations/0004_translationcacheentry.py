@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:21
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0003_cart_cartitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranslationCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_hash', models.CharField(max_length=64)),
+                ('lang', models.CharField(max_length=8)),
+                ('text', models.TextField()),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'unique_together': {('source_hash', 'lang')},
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:22
+
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_source_hash(apps, schema_editor):
+    Book = apps.get_model('library', 'Book')
+    books = list(Book.objects.only('id', 'title', 'author', 'description'))
+    for book in books:
+        source = '\x1f'.join((book.title, book.author, book.description))
+        book.source_hash = hashlib.sha256(source.encode('utf-8')).hexdigest()
+    Book.objects.bulk_update(books, ['source_hash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0004_translationcacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='source_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.CreateModel(
+            name='BookTranslation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lang', models.CharField(max_length=8)),
+                ('title', models.CharField(max_length=255)),
+                ('author', models.CharField(max_length=255)),
+                ('description', models.TextField()),
+                ('source_hash', models.CharField(max_length=64)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='translations', to='library.book')),
+            ],
+            options={
+                'unique_together': {('book', 'lang')},
+            },
+        ),
+        migrations.RunPython(fill_source_hash, migrations.RunPython.noop),
+    ]
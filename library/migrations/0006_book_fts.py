@@ -0,0 +1,76 @@
+from django.db import migrations
+
+# Схема зафиксирована здесь, а не импортируется из library.search:
+# миграция должна работать и после того, как модуль поиска изменится.
+FTS_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS library_book_fts USING fts5(
+        title, author, publisher, description,
+        content='library_book', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS library_book_fts_ai AFTER INSERT ON library_book BEGIN
+        INSERT INTO library_book_fts(rowid, title, author, publisher, description)
+        VALUES (new.id, new.title, new.author, new.publisher, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS library_book_fts_ad AFTER DELETE ON library_book BEGIN
+        INSERT INTO library_book_fts(library_book_fts, rowid, title, author, publisher, description)
+        VALUES ('delete', old.id, old.title, old.author, old.publisher, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS library_book_fts_au
+    AFTER UPDATE OF title, author, publisher, description ON library_book BEGIN
+        INSERT INTO library_book_fts(library_book_fts, rowid, title, author, publisher, description)
+        VALUES ('delete', old.id, old.title, old.author, old.publisher, old.description);
+        INSERT INTO library_book_fts(rowid, title, author, publisher, description)
+        VALUES (new.id, new.title, new.author, new.publisher, new.description);
+    END
+    """,
+    "INSERT INTO library_book_fts(library_book_fts) VALUES ('rebuild')",
+]
+
+DROP_FTS = [
+    'DROP TRIGGER IF EXISTS library_book_fts_ai',
+    'DROP TRIGGER IF EXISTS library_book_fts_ad',
+    'DROP TRIGGER IF EXISTS library_book_fts_au',
+    'DROP TABLE IF EXISTS library_book_fts',
+]
+
+
+def fts5_available(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+
+
+def create_fts(apps, schema_editor):
+    if not fts5_available(schema_editor.connection):
+        return
+    for statement in FTS_SCHEMA:
+        schema_editor.execute(statement)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_FTS:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0005_book_source_hash_booktranslation'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0006_book_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='cover_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='cover_placeholder',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='cover_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='cover_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:28
+
+import library.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0007_book_cover_derivatives'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='cover',
+            field=models.ImageField(blank=True, null=True, storage=library.storage.get_cover_storage, upload_to='covers/'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0009_book_updated_at_catalogversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['title', 'author', 'year'], name='book_natural_key_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:21
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def create_catalog_version(apps, schema_editor):
+    # строка каталога есть всегда: версия каталога и переводов читается одним запросом
+    CatalogVersion = apps.get_model('library', 'CatalogVersion')
+    CatalogVersion.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0012_book_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranslationVersion',
+            fields=[
+                ('lang', models.CharField(max_length=10, primary_key=True, serialize=False)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(create_catalog_version, migrations.RunPython.noop),
+    ]
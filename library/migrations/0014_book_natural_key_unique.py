@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:59
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicates(apps, schema_editor):
+    # дубликаты сливать вслепую нельзя (на книги ссылаются корзины): пусть их разберут вручную
+    Book = apps.get_model('library', 'Book')
+    duplicates = list(
+        Book.objects.values_list('title', 'author', 'year')
+        .annotate(n=Count('id')).filter(n__gt=1)[:10]
+    )
+    if duplicates:
+        raise RuntimeError(f'Книги с одинаковым (title, author, year): {duplicates}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0013_translationversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='book',
+            name='book_natural_key_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='book',
+            constraint=models.UniqueConstraint(fields=('title', 'author', 'year'), name='book_natural_key'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def enable_wal(apps, schema_editor):
+    # режим WAL сохраняется в файле базы: достаточно включить его один раз при деплое
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
+
+
+class Migration(migrations.Migration):
+    # journal_mode нельзя сменить внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('library', '0014_book_natural_key_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(enable_wal, migrations.RunPython.noop, atomic=False),
+    ]
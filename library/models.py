@@ -1,9 +1,17 @@
+import hashlib
+
 from django.db import models
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from .storage import get_cover_storage
 
 User = get_user_model()
 
+# наибольший id, который помещается в INTEGER SQLite (и bigint других СУБД)
+MAX_ID = 2 ** 63 - 1
+
 
 class Book(models.Model):
     title = models.CharField(max_length=255)
@@ -11,11 +19,132 @@ class Book(models.Model):
     year = models.PositiveIntegerField()
     publisher = models.CharField(max_length=255)
     description = models.TextField()
-    cover = models.ImageField(upload_to='covers/', blank=True, null=True)
+    cover = models.ImageField(upload_to='covers/', storage=get_cover_storage, blank=True, null=True)
+    # размеры оригинала, размытый placeholder и производные файлы (см. images.py)
+    cover_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    cover_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    cover_placeholder = models.TextField(blank=True, editable=False)
+    cover_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # sha256 переводимых полей — по нему находим устаревшие BookTranslation
+    source_hash = models.CharField(max_length=64, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    # естественный ключ книги: по нему import_books делает upsert
+    NATURAL_KEY = ('title', 'author', 'year')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['title', 'author', 'year'], name='book_natural_key'),
+        ]
+        indexes = [
+            # фильтры и сортировки каталога (catalog.py, pagination.BOOK_SORTS):
+            # поле фильтра/сортировки + id, чтобы keyset-страница читалась по индексу без сортировки
+            models.Index(fields=['author', 'id'], name='book_author_idx'),
+            models.Index(fields=['author', 'year', 'id'], name='book_author_year_idx'),
+            models.Index(fields=['publisher', 'id'], name='book_publisher_idx'),
+            models.Index(fields=['year', 'id'], name='book_year_idx'),
+            models.Index(fields=['title', 'id'], name='book_title_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def cover_variant_url(self, variant, fmt):
+        path = (self.cover_variants or {}).get(variant, {}).get('files', {}).get(fmt)
+        return self.cover.storage.url(path) if path else None
+
+    def cover_sources(self, fallback=False):
+        """`<source>` для `<picture>`: [{'type': MIME, 'srcset': 'url 200w, ...'}].
+
+        Дескриптор — настоящая ширина файла; варианты одной ширины (оригинал
+        уже самого большого варианта) попадают в srcset один раз.
+        `fallback=True` возвращает только jpeg-вариант для самого `<img>`.
+        """
+        from .images import FALLBACK_FORMAT, FORMATS
+
+        sources = {}
+        variants = sorted((self.cover_variants or {}).values(), key=lambda v: v['width'])
+        for variant in variants:
+            for fmt, path in variant.get('files', {}).items():
+                if (fmt == FALLBACK_FORMAT) != fallback:
+                    continue
+                sources.setdefault(fmt, {}).setdefault(variant['width'], self.cover.storage.url(path))
+        return [
+            {'type': FORMATS[fmt][2], 'srcset': ', '.join(f'{url} {w}w' for w, url in urls.items())}
+            for fmt, urls in sources.items()
+        ]
+
+    @property
+    def cover_fallback_srcset(self):
+        sources = self.cover_sources(fallback=True)
+        return sources[0]['srcset'] if sources else ''
+
+    @property
+    def cover_thumb(self):
+        """URL и размеры миниатюры для сетки (или оригинала, если вариантов нет)."""
+        from .images import FALLBACK_FORMAT
+
+        thumb = (self.cover_variants or {}).get('thumb')
+        if thumb:
+            return {'url': self.cover_variant_url('thumb', FALLBACK_FORMAT), 'width': thumb['width'], 'height': thumb['height']}
+        return {'url': self.cover.url, 'width': self.cover_width, 'height': self.cover_height}
+
+    def compute_source_hash(self):
+        source = '\x1f'.join((self.title, self.author, self.description))
+        return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+    def save(self, *args, **kwargs):
+        self.source_hash = self.compute_source_hash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'source_hash' not in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'source_hash'}
+        super().save(*args, **kwargs)
+
+
+class BookTranslation(models.Model):
+    """Перевод полей книги, заполняется после сохранения `Book`."""
+    book = models.ForeignKey(Book, related_name='translations', on_delete=models.CASCADE)
+    lang = models.CharField(max_length=8)
+    title = models.CharField(max_length=255)
+    author = models.CharField(max_length=255)
+    description = models.TextField()
+    source_hash = models.CharField(max_length=64)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('book', 'lang')
+
+    def __str__(self):
+        return f"{self.book_id}:{self.lang}"
+
+
+class CatalogVersion(models.Model):
+    """Счётчик версий каталога (одна строка).
+
+    Увеличивается при любом изменении книг; по нему строятся ETag/Last-Modified
+    каталога и ключи его кэшей для всех воркеров сразу.
+    """
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"v{self.version}"
+
+
+class TranslationVersion(models.Model):
+    """Счётчик версий сохранённых переводов книг (строка на язык).
+
+    Увеличивается при обновлении BookTranslation языка; на него смотрят только
+    фрагменты с переведённым текстом (сетка, ETag каталога на этом языке),
+    поэтому фасеты и другие кэши каталога не сбрасываются.
+    """
+    lang = models.CharField(max_length=10, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.lang}:v{self.version}"
+
 
 class Cart(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -36,3 +165,48 @@ class CartItem(models.Model):
 
     def __str__(self):
         return f"{self.book.title} x{self.quantity} ({self.cart.user.username})"
+
+
+class TranslationCacheEntry(models.Model):
+    """Общий для всех воркеров кэш переводов translatepy."""
+    source_hash = models.CharField(max_length=64)
+    lang = models.CharField(max_length=8)
+    text = models.TextField()
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        unique_together = ('source_hash', 'lang')
+
+    def __str__(self):
+        return f"{self.lang}:{self.source_hash[:12]}"
+
+
+class BorrowEvent(models.Model):
+    """Факт выдачи книги: пишется при оформлении корзины."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='borrow_events', on_delete=models.CASCADE)
+    book = models.ForeignKey(Book, related_name='borrow_events', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.book_id} x{self.quantity}"
+
+
+class MonthlyBorrowStat(models.Model):
+    """Агрегат выдач за месяц, обновляется вместе с событиями."""
+    month = models.DateField(unique=True)
+    borrowers = models.PositiveIntegerField(default=0)
+    books = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.month:%m.%Y}: {self.borrowers}"
+
+
+class MonthlyBorrower(models.Model):
+    """Кто уже брал книги в этом месяце — для подсчёта уникальных людей без пересчёта истории."""
+    month = models.DateField()
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('month', 'user')
+
@@ -1,9 +1,49 @@
 """
 Custom OIDC Authentication Backend для поддержки Keycloak с дополнительными возможностями.
+
+Ключи JWKS кэшируются в процессе (`OIDC_JWKS_CACHE_TTL`) и перечитываются
+раньше срока, только если пришёл токен с неизвестным `kid` (ротация ключей
+в IdP). Загрузка идёт вне блокировки, одна на все потоки: остальные логины
+ждут её результата, а не очереди к IdP. Ключи шифрования (`"use": "enc"`)
+и ключи с неподдерживаемым алгоритмом пропускаются. Userinfo не запрашивается, если ID-токен уже содержит
+`OIDC_ID_TOKEN_CLAIMS`; в пользователя записываются только изменившиеся поля.
 """
 
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+import jwt
+import requests
+from django.conf import settings
+from django.core.exceptions import SuspiciousOperation
+from django.utils.encoding import smart_str
 from mozilla_django_oidc.auth import OIDCAuthenticationBackend
 
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# поля пользователя, которые синхронизируются из claims
+USER_CLAIMS = {
+    'first_name': 'given_name',
+    'last_name': 'family_name',
+    'email': 'email',
+}
+
+_jwks_lock = threading.Lock()
+_jwks = {'url': None, 'keys': [], 'fetched': 0.0, 'unknown': set(), 'loading': None}
+
+
+def reset_jwks_cache():
+    with _jwks_lock:
+        _jwks.update(url=None, keys=[], fetched=0.0, unknown=set(), loading=None)
+
+
+def _has_kid(keys, kid):
+    return any(jwk.get('kid') == kid for jwk, _ in keys)
+
 
 class KeycloakOIDCBackend(OIDCAuthenticationBackend):
     """
@@ -16,29 +56,128 @@ class KeycloakOIDCBackend(OIDCAuthenticationBackend):
         Переопределяем метод создания пользователя для сохранения дополнительной информации.
         """
         user = super().create_user(claims)
-
-        user.first_name = claims.get('given_name', '')
-        user.last_name = claims.get('family_name', '')
-        user.email = claims.get('email', '')
-        user.save()
+        changed = self._apply_claims(user, claims)
+        if changed:
+            user.save(update_fields=changed)
 
         return user
 
     def update_user(self, user, claims):
         """
-        Переопределяем метод обновления пользователя для синхронизации данных из Keycloak.
+        Синхронизация данных из Keycloak: записываются только изменившиеся поля.
         """
-        user.first_name = claims.get('given_name', '')
-        user.last_name = claims.get('family_name', '')
-        user.email = claims.get('email', '')
-        user.save()
+        changed = self._apply_claims(user, claims)
+        if changed:
+            user.save(update_fields=changed)
+        metrics.incr('oidc.user_updated' if changed else 'oidc.user_unchanged')
 
         return user
 
+    @staticmethod
+    def _apply_claims(user, claims):
+        changed = []
+        for field, claim in USER_CLAIMS.items():
+            value = claims.get(claim, '')
+            if getattr(user, field) != value:
+                setattr(user, field, value)
+                changed.append(field)
+        return changed
+
     def get_userinfo(self, access_token, id_token, payload):
         """
-        Получаем информацию о пользователе из ID токена и/или userinfo эндпоинта.
+        Claims из ID-токена (он уже проверен), если в нём есть всё нужное;
+        иначе — запрос к userinfo эндпоинту.
         """
-        user_info = super().get_userinfo(access_token, id_token, payload)
+        required = getattr(settings, 'OIDC_ID_TOKEN_CLAIMS', None)
+        if required and payload and all(payload.get(claim) for claim in required):
+            metrics.incr('oidc.userinfo_skipped')
+            return payload
+        metrics.incr('oidc.userinfo_fetched')
+        return super().get_userinfo(access_token, id_token, payload)
+
+    def _fetch_jwks(self):
+        response = requests.get(
+            self.OIDC_OP_JWKS_ENDPOINT,
+            verify=self.get_settings("OIDC_VERIFY_SSL", True),
+            timeout=self.get_settings("OIDC_TIMEOUT", None),
+            proxies=self.get_settings("OIDC_PROXY", None),
+        )
+        response.raise_for_status()
+        metrics.incr('oidc.jwks_fetched')
+        # ключи разбираются один раз при загрузке, а не на каждый логин
+        keys = []
+        for jwk in response.json()['keys']:
+            if jwk.get('use', 'sig') != 'sig':
+                continue
+            try:
+                keys.append((jwk, jwt.PyJWK(jwk)))
+            except jwt.PyJWKError as exc:
+                # например, RSA-OAEP без "use" — токены им не подписываются
+                logger.debug('Пропущен ключ JWKS %s: %s', jwk.get('kid'), exc)
+        return keys
+
+    def _jwks_stale(self, kid):
+        ttl = getattr(settings, 'OIDC_JWKS_CACHE_TTL', 3600)
+        min_refresh = getattr(settings, 'OIDC_JWKS_MIN_REFRESH', 60)
+        age = time.monotonic() - _jwks['fetched']
+        if _jwks['url'] != self.OIDC_OP_JWKS_ENDPOINT or age >= ttl:
+            return True
+        if kid is None or _has_kid(_jwks['keys'], kid):
+            return False
+        # первый неизвестный kid — перечитать сразу, повторный — не чаще min_refresh
+        return kid not in _jwks['unknown'] or age >= min_refresh
+
+    def _cached_jwks(self, kid=None):
+        """Ключи из кэша; `kid` — ключа с таким kid нет, перечитать JWKS.
+
+        Первый неизвестный kid перечитывает ключи сразу (ротация в IdP);
+        kid, которого нет и после перечитывания, — не чаще `OIDC_JWKS_MIN_REFRESH`.
+        Пока один поток загружает ключи, остальные ждут его результата.
+        """
+        while True:
+            with _jwks_lock:
+                if not self._jwks_stale(kid):
+                    return _jwks['keys']
+                loading = _jwks['loading']
+                if loading is None:
+                    loading = _jwks['loading'] = Future()
+                    break
+            # загрузка уже идёт в другом потоке: дождаться и проверить заново
+            loading.result()
+
+        try:
+            keys = self._fetch_jwks()
+        except BaseException as exc:
+            with _jwks_lock:
+                _jwks['loading'] = None
+            loading.set_exception(exc)
+            raise
+        with _jwks_lock:
+            if len(_jwks['unknown']) > 100:
+                _jwks['unknown'].clear()
+            _jwks.update(url=self.OIDC_OP_JWKS_ENDPOINT, keys=keys, fetched=time.monotonic(), loading=None)
+            if kid is not None and not _has_kid(keys, kid):
+                _jwks['unknown'].add(kid)
+        loading.set_result(keys)
+        return keys
+
+    def _match_jwk(self, keys, header):
+        # тот же отбор, что в mozilla_django_oidc: kid (если OIDC_VERIFY_KID) и alg
+        match = None
+        for jwk, key in keys:
+            if self.get_settings("OIDC_VERIFY_KID", True) and jwk.get("kid") != smart_str(header.get("kid")):
+                continue
+            if "alg" in jwk and jwk["alg"] != smart_str(header.get("alg")):
+                continue
+            match = key
+        return match
 
-        return user_info
+    def retrieve_matching_jwk(self, token):
+        """Ключ подписи из кэша JWKS; неизвестный kid — повод перечитать ключи."""
+        header = jwt.get_unverified_header(token)
+        key = self._match_jwk(self._cached_jwks(), header)
+        if key is None:
+            key = self._match_jwk(self._cached_jwks(kid=smart_str(header.get('kid'))), header)
+        if key is None:
+            raise SuspiciousOperation("Could not find a valid JWKS.")
+        return key
@@ -0,0 +1,157 @@
+"""
+Keyset (cursor) пагинация.
+
+В отличие от OFFSET, стоимость выборки страницы не зависит от её номера:
+запрос всегда читает `size + 1` строк по индексу, начиная с курсора.
+Курсор — значения полей сортировки последней (или первой) строки страницы,
+закодированные в base64. Курсор приходит от клиента, поэтому значения
+проверяются по типам полей сортировки: испорченный курсор даёт первую
+страницу, а не ошибку в ORM.
+"""
+
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+# Сортировки каталога: имя -> поля ORDER BY (последнее поле уникально)
+BOOK_SORTS = {
+    'id': ('id',),
+    '-id': ('-id',),
+    'title': ('title', 'id'),
+    'author': ('author', 'id'),
+    'year': ('year', 'id'),
+    '-year': ('-year', '-id'),
+}
+DEFAULT_SORT = 'id'
+
+
+def encode_cursor(values):
+    # DjangoJSONEncoder: даты — в ISO 8601, их разбирает field.to_python
+    raw = json.dumps(values, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _clean_value(field, value):
+    if value is None or isinstance(value, (bool, list, dict)):
+        raise ValidationError('некорректное значение курсора')
+    value = field.to_python(value)
+    # в том числе диапазон целых для БД: SQLite не примет число больше 2**63
+    field.run_validators(value)
+    return value
+
+
+def decode_cursor(cursor, fields):
+    """Раскодировать курсор для полей сортировки `fields`.
+
+    None, если курсор повреждён или не подходит к сортировке (другая длина,
+    значение не того типа).
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(values, list) or len(values) != len(fields):
+        return None
+    try:
+        return [_clean_value(field, value) for field, value in zip(fields, values)]
+    except (ValidationError, TypeError, ValueError):
+        return None
+
+
+def _field_name(order):
+    return order.lstrip('-')
+
+
+def _ordering_fields(model, ordering):
+    return [model._meta.get_field(_field_name(order)) for order in ordering]
+
+
+def _after_q(ordering, values, reverse=False):
+    """Условие «строго после курсора» для составного ключа сортировки.
+
+    Для (a, b) по возрастанию: a > va OR (a = va AND b > vb).
+    """
+    q = Q()
+    for i, order in enumerate(ordering):
+        descending = order.startswith('-') != reverse
+        lookup = 'lt' if descending else 'gt'
+        step = Q(**{f'{_field_name(order)}__{lookup}': values[i]})
+        for prev_order, prev_value in zip(ordering[:i], values[:i]):
+            step &= Q(**{_field_name(prev_order): prev_value})
+        q |= step
+    return q
+
+
+def _reverse_ordering(ordering):
+    return tuple(o[1:] if o.startswith('-') else f'-{o}' for o in ordering)
+
+
+class KeysetPage:
+    def __init__(self, items, ordering, has_next, has_prev):
+        self.items = items
+        self.ordering = ordering
+        self.has_next = has_next
+        self.has_prev = has_prev
+
+    def _cursor(self, obj):
+        return encode_cursor([getattr(obj, _field_name(o)) for o in self.ordering])
+
+    @property
+    def next_cursor(self):
+        if not self.has_next or not self.items:
+            return None
+        return self._cursor(self.items[-1])
+
+    @property
+    def prev_cursor(self):
+        if not self.has_prev or not self.items:
+            return None
+        return self._cursor(self.items[0])
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _page_queryset(queryset, ordering, size, after, before):
+    """Запрос страницы: (queryset из size + 1 строк, курсоры, идём ли назад)."""
+    fields = _ordering_fields(queryset.model, ordering)
+    after_values = decode_cursor(after, fields)
+    before_values = decode_cursor(before, fields)
+    if before_values is not None:
+        qs = queryset.filter(_after_q(ordering, before_values, reverse=True))
+        return qs.order_by(*_reverse_ordering(ordering))[:size + 1], after_values, True
+    qs = queryset
+    if after_values is not None:
+        qs = qs.filter(_after_q(ordering, after_values))
+    return qs.order_by(*ordering)[:size + 1], after_values, False
+
+
+def _make_page(rows, ordering, size, after_values, backwards):
+    if backwards:
+        return KeysetPage(rows[:size][::-1], ordering, has_next=True, has_prev=len(rows) > size)
+    return KeysetPage(rows[:size], ordering, has_next=len(rows) > size, has_prev=after_values is not None)
+
+
+def keyset_paginate(queryset, ordering, size, after=None, before=None):
+    """Вернуть страницу `queryset`, упорядоченного по `ordering`.
+
+    `after` — курсор следующей страницы, `before` — предыдущей.
+    Без курсоров возвращается первая страница.
+    """
+    qs, after_values, backwards = _page_queryset(queryset, ordering, size, after, before)
+    return _make_page(list(qs), ordering, size, after_values, backwards)
+
+
+async def akeyset_paginate(queryset, ordering, size, after=None, before=None):
+    """Async-версия `keyset_paginate` (для async views)."""
+    qs, after_values, backwards = _page_queryset(queryset, ordering, size, after, before)
+    return _make_page([obj async for obj in qs], ordering, size, after_values, backwards)
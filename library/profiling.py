@@ -0,0 +1,181 @@
+"""
+Профилирование отдельных запросов по требованию администратора.
+
+Запрос профилируется, если в нём есть подписанный токен (`?_profile=`
+или заголовок `X-Profile`) и его делает тот администратор, для
+которого токен выписан. Используется pyinstrument, если он установлен,
+иначе cProfile. Результаты лежат в `PROFILE_DIR` (по умолчанию
+MEDIA_ROOT/profiles) и доступны на /manage/profiles/.
+
+Async-запросы (`aprofile_request`) профилируются в потоке цикла событий:
+pyinstrument относит время к корутине запроса, а cProfile видит и другие
+запросы этого цикла и не видит ORM в потоках sync_to_async.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import time
+import uuid
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+from .roles import is_admin
+
+PROFILE_PARAM = '_profile'
+PROFILE_HEADER = 'X-Profile'
+TOKEN_SALT = 'library.profiling'
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:  # pragma: no cover - необязательная зависимость
+    SamplingProfiler = None
+
+
+def profile_dir():
+    return Path(getattr(settings, 'PROFILE_DIR', os.path.join(settings.MEDIA_ROOT, 'profiles')))
+
+
+def make_token(user):
+    return signing.dumps({'u': user.pk}, salt=TOKEN_SALT)
+
+
+def requested_token(request):
+    return request.GET.get(PROFILE_PARAM) or request.headers.get(PROFILE_HEADER)
+
+
+def token_valid(token, request):
+    try:
+        data = signing.loads(token, salt=TOKEN_SALT, max_age=getattr(settings, 'PROFILE_TOKEN_MAX_AGE', 3600))
+    except signing.BadSignature:
+        return False
+    user = request.user
+    return user.is_authenticated and data.get('u') == user.pk and is_admin(request)
+
+
+def _clean_url(request):
+    # токен в сохранённых метаданных не нужен
+    query = request.GET.copy()
+    query.pop(PROFILE_PARAM, None)
+    return request.path + ('?' + query.urlencode() if query else '')
+
+
+def _profile_name(request):
+    match = getattr(request, 'resolver_match', None)
+    route = re.sub(r'[^\w-]', '_', match.url_name or 'view') if match else 'unresolved'
+    # случайный суффикс: в DEBUG папка MEDIA_ROOT раздаётся как статика
+    return f'{timezone.now():%Y%m%d-%H%M%S}-{route}-{uuid.uuid4().hex[:12]}'
+
+
+def _start_profiler():
+    if SamplingProfiler is not None:
+        profiler = SamplingProfiler()
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return profiler
+
+
+def _stop_profiler(profiler):
+    # cProfile останавливается в том же потоке, где запущен
+    if SamplingProfiler is not None:
+        profiler.stop()
+    else:
+        profiler.disable()
+
+
+def _profile_files(profiler):
+    """({расширение: содержимое}, название профилировщика)."""
+    if SamplingProfiler is not None:
+        return {'html': profiler.output_html()}, 'pyinstrument'
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(60)
+    return {'prof': profiler, 'txt': summary.getvalue()}, 'cProfile'
+
+
+def profile_request(get_response, request):
+    """Выполнить запрос под профилировщиком и сохранить результат."""
+    started = time.perf_counter()
+    profiler = _start_profiler()
+    try:
+        response = get_response(request)
+    finally:
+        _stop_profiler(profiler)
+    return _save_profile(request, response, profiler, (time.perf_counter() - started) * 1000)
+
+
+async def aprofile_request(get_response, request):
+    """Async-версия `profile_request`; файлы пишутся вне цикла событий."""
+    started = time.perf_counter()
+    profiler = _start_profiler()
+    try:
+        response = await get_response(request)
+    finally:
+        _stop_profiler(profiler)
+    return await sync_to_async(_save_profile)(request, response, profiler, (time.perf_counter() - started) * 1000)
+
+
+def _save_profile(request, response, profiler, total_ms):
+    files, kind = _profile_files(profiler)
+    name = _profile_name(request)
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    for ext, content in files.items():
+        path = directory / f'{name}.{ext}'
+        if ext == 'prof':
+            content.dump_stats(path)
+        else:
+            path.write_text(content, encoding='utf-8')
+    meta = {
+        'name': name,
+        'created': timezone.now().isoformat(),
+        'method': request.method,
+        'url': _clean_url(request),
+        'lang': request.GET.get('lang', 'ru'),
+        'status': response.status_code,
+        'total_ms': round(total_ms, 2),
+        'profiler': kind,
+        'user': request.user.get_username(),
+        'files': sorted(files),
+    }
+    (directory / f'{name}.json').write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding='utf-8')
+    prune_profiles()
+    response['X-Profile-Id'] = name
+    return response
+
+
+def list_profiles():
+    """Метаданные сохранённых профилей, новые первыми."""
+    directory = profile_dir()
+    if not directory.is_dir():
+        return []
+    profiles = []
+    for path in sorted(directory.glob('*.json'), reverse=True):
+        try:
+            profiles.append(json.loads(path.read_text(encoding='utf-8')))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def profile_file(name, ext):
+    """Путь к файлу профиля или None (имя проверяется, чтобы не выйти из каталога)."""
+    if not re.fullmatch(r'[\w-]+', name) or ext not in ('prof', 'txt', 'html'):
+        return None
+    path = profile_dir() / f'{name}.{ext}'
+    return path if path.is_file() else None
+
+
+def prune_profiles():
+    keep = getattr(settings, 'PROFILE_KEEP', 50)
+    for meta in list_profiles()[keep:]:
+        for path in profile_dir().glob(f"{meta['name']}.*"):
+            path.unlink(missing_ok=True)
@@ -0,0 +1,80 @@
+"""
+Роли пользователя, вычисленные один раз на запрос.
+
+Роли — имена групп пользователя плюс 'staff'/'superuser' по флагам
+`User`. Флаги приходят вместе с `request.user`, а группы кэшируются в
+сессии (`ROLES_SESSION_CACHE`), поэтому обычный запрос проверяет права
+без обращений к БД.
+
+Группы в сессии помечены версией из кэша Django; при изменении членства
+(m2m_changed, см. signals.py) версия пользователя меняется после коммита
+и сессионная копия перестаёт совпадать. Версия — случайная строка: если
+ключ пропал из кэша (перезапуск, вытеснение), новая версия не совпадёт ни
+с одной старой сессией. Версию должны видеть все процессы, поэтому по
+умолчанию сессионный кэш включён только с общим бэкендом кэша (settings.py).
+"""
+
+import secrets
+
+from django.conf import settings
+from django.core.cache import cache
+
+ADMIN_GROUP = 'admin'
+SESSION_KEY = 'library_roles'
+
+
+def _version_key(user_id):
+    return f'library:roles:{user_id}'
+
+
+def roles_version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # add(): если другой процесс успел записать версию, берём его
+        cache.add(key, secrets.token_hex(8), None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_roles(*user_ids):
+    """Сбросить сохранённые в сессиях роли пользователей."""
+    cache.set_many({_version_key(user_id): secrets.token_hex(8) for user_id in user_ids}, None)
+
+
+def _user_groups(request, user):
+    use_session = getattr(settings, 'ROLES_SESSION_CACHE', False) and hasattr(request, 'session')
+    version = roles_version(user.pk) if use_session else None
+    if use_session:
+        stored = request.session.get(SESSION_KEY)
+        if stored and stored.get('user') == user.pk and stored.get('v') == version:
+            return stored['groups']
+    groups = list(user.groups.values_list('name', flat=True))
+    if use_session:
+        request.session[SESSION_KEY] = {'user': user.pk, 'v': version, 'groups': groups}
+    return groups
+
+
+def get_roles(request):
+    """frozenset ролей текущего пользователя (кэшируется на запросе)."""
+    if not hasattr(request, '_roles'):
+        user = request.user
+        roles = set()
+        if user.is_authenticated:
+            roles.update(_user_groups(request, user))
+            if user.is_staff:
+                roles.add('staff')
+            if user.is_superuser:
+                roles.add('superuser')
+        request._roles = frozenset(roles)
+    return request._roles
+
+
+def has_role(request, role):
+    return role in get_roles(request)
+
+
+def is_admin(request):
+    """Администратор библиотеки: `is_staff` или группа 'admin'."""
+    roles = get_roles(request)
+    return 'staff' in roles or ADMIN_GROUP in roles
@@ -0,0 +1,54 @@
+"""
+Маршрутизация запросов к БД: чтение каталога — на реплику, остальное — на основную.
+
+Реплика подключается, если в DATABASES есть алиас `replica` (см.
+DATABASE_REPLICA_NAME в settings). На неё уходят только чтения каталога
+и статистики (index, book_detail, book_details, поиск, /stat/); корзины, пользователи
+и сессии, а также все записи идут в `default`.
+
+Чтобы запрос видел свои же записи, после первой записи и внутри
+transaction.atomic() чтение тоже идёт в `default`; привязка сбрасывается
+в начале каждого запроса (signals.py).
+"""
+
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = 'replica'
+# модели, чтение которых можно отдавать реплике
+REPLICA_MODELS = {
+    ('library', 'book'),
+    ('library', 'booktranslation'),
+    ('library', 'catalogversion'),
+    ('library', 'monthlyborrowstat'),
+}
+
+_pinned = ContextVar('library_db_pinned', default=False)
+
+
+def unpin():
+    _pinned.set(False)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if REPLICA_ALIAS not in settings.DATABASES or _pinned.get():
+            return None
+        if (model._meta.app_label, model._meta.model_name) not in REPLICA_MODELS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return REPLICA_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _pinned.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплика — копия основной базы
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db != REPLICA_ALIAS
@@ -0,0 +1,129 @@
+"""
+Полнотекстовый поиск по книгам на SQLite FTS5.
+
+Индекс `library_book_fts` — external content таблица поверх `library_book`
+(сами тексты не дублируются). Синхронизацию делают триггеры, поэтому
+индекс обновляется и при `bulk_create`/`update()`, которые не шлют сигналов.
+На других СУБД поиск деградирует до `icontains`.
+"""
+
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+
+FTS_TABLE = 'library_book_fts'
+
+# Веса bm25 по колонкам: title, author, publisher, description
+BM25_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+FTS_SCHEMA = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, author, publisher, description,
+        content='library_book', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON library_book BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, author, publisher, description)
+        VALUES (new.id, new.title, new.author, new.publisher, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON library_book BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, publisher, description)
+        VALUES ('delete', old.id, old.title, old.author, old.publisher, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+    AFTER UPDATE OF title, author, publisher, description ON library_book BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, publisher, description)
+        VALUES ('delete', old.id, old.title, old.author, old.publisher, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, author, publisher, description)
+        VALUES (new.id, new.title, new.author, new.publisher, new.description);
+    END
+    """,
+]
+
+
+_fts5_compiled = None
+
+
+def fts_available(connection):
+    """Собран ли SQLite с FTS5 (результат кэшируется на процесс)."""
+    global _fts5_compiled
+    if connection.vendor != 'sqlite':
+        return False
+    if _fts5_compiled is None:
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA compile_options')
+            _fts5_compiled = any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+    return _fts5_compiled
+
+
+def install_fts(connection, rebuild=False):
+    """Создать FTS-таблицу и триггеры, если их нет.
+
+    SQLite при изменении схемы пересоздаёт `library_book` и теряет триггеры,
+    поэтому это вызывается и после каждого migrate (см. signals.py).
+    """
+    if not fts_available(connection):
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        exists = cursor.fetchone() is not None
+        for statement in FTS_SCHEMA:
+            cursor.execute(statement)
+        if rebuild or not exists:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def build_match_query(query):
+    """Превратить пользовательский ввод в выражение FTS5 MATCH.
+
+    Все слова обязательны; последнее ищется по префиксу (для type-ahead).
+    Слова берутся в кавычки, поэтому операторы FTS5 во вводе не работают.
+    """
+    terms = re.findall(r'\w+', query.lower())
+    if not terms:
+        return None
+    parts = [f'"{term}"' for term in terms]
+    parts[-1] += '*'
+    return ' '.join(parts)
+
+
+def search_book_ids(query, limit, offset=0):
+    """id книг по запросу, отсортированные по релевантности (bm25)."""
+    from .models import Book
+
+    match = build_match_query(query)
+    if match is None:
+        return []
+
+    connection = connections[router.db_for_read(Book)]
+    if not fts_available(connection):
+        q = Q()
+        for term in re.findall(r'\w+', query):
+            q &= Q(title__icontains=term) | Q(author__icontains=term) | Q(publisher__icontains=term)
+        return list(Book.objects.filter(q).order_by('id').values_list('id', flat=True)[offset:offset + limit])
+
+    weights = ', '.join(str(w) for w in BM25_WEIGHTS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s OFFSET %s',
+            [match, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_books(queryset, query, limit, offset=0):
+    """Книги из `queryset` по запросу в порядке релевантности."""
+    ids = search_book_ids(query, limit, offset)
+    books = queryset.in_bulk(ids)
+    return [books[pk] for pk in ids if pk in books]
@@ -1,4 +1,6 @@
-from django.db.models.signals import post_migrate
+from django.core.signals import request_started
+from django.db import connections, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 from django.contrib.auth.models import Group, Permission, User
 from django.contrib.contenttypes.models import ContentType
@@ -37,3 +39,112 @@ def create_groups_and_users(sender, **kwargs):
         user_group.user_set.add(normal_user)
     except Exception:
         pass
+
+
+@receiver(post_migrate)
+def ensure_book_fts(sender, using='default', **kwargs):
+    """Восстановить триггеры FTS, если миграция пересоздала library_book."""
+    if sender.name != 'library':
+        return
+    from .search import install_fts
+
+    try:
+        install_fts(connections[using])
+    except Exception:
+        pass
+
+
+@receiver(post_save, sender='library.Book')
+@receiver(post_delete, sender='library.Book')
+def bump_catalog_on_book_change(sender, raw=False, **kwargs):
+    """Любое изменение книги меняет ETag/Last-Modified каталога."""
+    if raw:
+        return
+    from .versioning import bump_catalog_version
+
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender='library.Book')
+def schedule_book_translations(sender, instance, raw=False, **kwargs):
+    """После сохранения книги (add_book, edit_book, админка) обновить её переводы."""
+    if raw:
+        return
+    from .translation import schedule_refresh
+
+    transaction.on_commit(lambda: schedule_refresh([instance.pk]))
+
+
+@receiver(pre_save, sender='library.Book')
+def remember_old_cover(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and 'cover' not in update_fields:
+        return
+    instance._old_cover = (
+        sender.objects.filter(pk=instance.pk).values_list('cover', flat=True).first()
+    )
+
+
+@receiver(post_save, sender='library.Book')
+def release_replaced_cover(sender, instance, raw=False, **kwargs):
+    """Обложку заменили или убрали — освободить старый файл, если он больше не нужен."""
+    old = getattr(instance, '_old_cover', None)
+    instance._old_cover = None
+    if raw or not old or old == instance.cover.name:
+        return
+    from .storage import release_cover
+
+    transaction.on_commit(lambda: release_cover(old))
+
+
+@receiver(post_delete, sender='library.Book')
+def release_deleted_cover(sender, instance, **kwargs):
+    name = instance.cover.name if instance.cover else None
+    if not name:
+        return
+    from .storage import release_cover
+
+    transaction.on_commit(lambda: release_cover(name))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_roles_on_membership_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Членство в группах изменилось (admin_promote_user, админка) — сбросить роли в сессиях."""
+    if not action.startswith('post_'):
+        return
+    from .roles import invalidate_roles
+
+    if not reverse:
+        user_ids = [instance.pk]
+    elif pk_set:
+        user_ids = list(pk_set)
+    else:
+        # group.user_set.clear(): участников запомнили в pre_clear
+        user_ids = list(getattr(instance, '_role_members', ()))
+    # после коммита: иначе параллельный запрос может сохранить в сессии
+    # ещё старые группы уже под новой версией
+    transaction.on_commit(lambda: invalidate_roles(*user_ids))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def remember_group_members(sender, instance, action, reverse, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._role_members = list(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Group)
+def invalidate_roles_on_group_delete(sender, instance, **kwargs):
+    from .roles import invalidate_roles
+
+    user_ids = list(instance.user_set.values_list('pk', flat=True))
+    transaction.on_commit(lambda: invalidate_roles(*user_ids))
+
+
+@receiver(request_started)
+def reset_replica_pin(sender, **kwargs):
+    """Новый запрос снова читает каталог с реплики (см. routers.py)."""
+    from .routers import unpin
+
+    unpin()
+
@@ -0,0 +1,45 @@
+// Кнопки «В корзину» без перезагрузки страницы: клики копятся и уходят
+// одним POST на /cart/batch/. Если запрос не удался — обычный переход по ссылке.
+(function() {
+    const script = document.currentScript;
+    const batchUrl = script.dataset.batchUrl;
+    const csrf = script.dataset.csrf;
+    const queue = new Map();
+    let timer = null;
+
+    function flush() {
+        timer = null;
+        const pending = Array.from(queue.entries());
+        queue.clear();
+        const ops = pending.map(([book, entry]) => ({op: 'add', book: book, quantity: entry.quantity}));
+        fetch(batchUrl, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json', 'X-CSRFToken': csrf},
+            body: JSON.stringify({ops: ops}),
+            credentials: 'same-origin',
+        }).then(res => {
+            if (!res.ok || res.redirected) throw new Error('cart batch failed');
+            return res.json();
+        }).then(() => {
+            pending.forEach(([, entry]) => {
+                entry.link.classList.replace('btn-success', 'btn-outline-success');
+                entry.link.textContent = '✓ ' + entry.label;
+            });
+        }).catch(() => {
+            window.location.href = pending[0][1].link.href;
+        });
+    }
+
+    document.querySelectorAll('.js-add-to-cart').forEach(link => {
+        const label = link.textContent.trim();
+        link.addEventListener('click', function(event) {
+            event.preventDefault();
+            const book = parseInt(this.dataset.book, 10);
+            const entry = queue.get(book) || {quantity: 0, link: this, label: label};
+            entry.quantity += 1;
+            queue.set(book, entry);
+            clearTimeout(timer);
+            timer = setTimeout(flush, 300);
+        });
+    });
+})();
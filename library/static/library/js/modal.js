@@ -4,7 +4,7 @@ document.querySelectorAll('.book-link').forEach(btn => {
         document.getElementById('modalAuthor').textContent = this.dataset.author;
         document.getElementById('modalYear').textContent = this.dataset.year;
         document.getElementById('modalPublisher').textContent = this.dataset.publisher;
-        document.getElementById('modalDescription').textContent = this.dataset.description;
+        document.getElementById('modalDescription').textContent = this.dataset.description || '';
         document.getElementById('modalCover').src = this.dataset.coverUrl || '';
     });
 });
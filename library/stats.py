@@ -0,0 +1,120 @@
+"""
+Статистика выдачи книг.
+
+Каждое оформление корзины пишет `BorrowEvent` и в той же транзакции
+увеличивает помесячный агрегат `MonthlyBorrowStat` через F() — история
+событий при чтении не сканируется. Уникальные люди за месяц считаются
+через `MonthlyBorrower`: счётчик растёт, только если строка (месяц,
+пользователь) была создана.
+
+`/stat/itemuse` отдаёт ответ из кэша процесса; пересчёт идёт под
+блокировкой (single-flight) и стоит одного запроса к агрегату.
+"""
+
+import datetime
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import metrics
+from .models import BorrowEvent, MonthlyBorrower, MonthlyBorrowStat
+
+STAT_MONTHS = 12
+
+_lock = threading.Lock()
+_cached = {'data': None, 'expires': 0.0, 'generation': 0}
+
+
+def month_start(moment=None):
+    return timezone.localdate(moment).replace(day=1)
+
+
+def record_checkout(user, items, moment=None):
+    """Записать выдачу позиций корзины `items` (CartItem) пользователю `user`."""
+    moment = moment or timezone.now()
+    month = month_start(moment)
+    events = [
+        BorrowEvent(user=user, book_id=item.book_id, quantity=item.quantity, created_at=moment)
+        for item in items
+    ]
+    if not events:
+        return []
+    with transaction.atomic():
+        BorrowEvent.objects.bulk_create(events)
+        _, new_borrower = MonthlyBorrower.objects.get_or_create(month=month, user=user)
+        MonthlyBorrowStat.objects.get_or_create(month=month)
+        MonthlyBorrowStat.objects.filter(month=month).update(
+            books=F('books') + sum(e.quantity for e in events),
+            borrowers=F('borrowers') + int(new_borrower),
+        )
+        transaction.on_commit(invalidate)
+    metrics.incr('stats.borrow_events', len(events))
+    return events
+
+
+def rebuild_rollup():
+    """Пересчитать агрегаты из событий целиком (восстановление, не для запросов)."""
+    with transaction.atomic():
+        MonthlyBorrower.objects.all().delete()
+        MonthlyBorrowStat.objects.all().delete()
+        events = BorrowEvent.objects.annotate(m=TruncMonth('created_at', output_field=DateField()))
+        MonthlyBorrower.objects.bulk_create(
+            [MonthlyBorrower(month=m, user_id=u) for m, u in events.values_list('m', 'user_id').distinct()],
+            batch_size=1000,
+        )
+        rows = events.values('m').annotate(borrowers=Count('user', distinct=True), books=Sum('quantity'))
+        MonthlyBorrowStat.objects.bulk_create(
+            [MonthlyBorrowStat(month=r['m'], borrowers=r['borrowers'], books=r['books']) for r in rows],
+        )
+    invalidate()
+
+
+def _last_months(count):
+    month = month_start()
+    months = []
+    for _ in range(count):
+        months.append(month)
+        month = (month - datetime.timedelta(days=1)).replace(day=1)
+    return months[::-1]
+
+
+def build_itemuse():
+    """Уникальные читатели по месяцам за последний год — 12 строк агрегата."""
+    months = _last_months(STAT_MONTHS)
+    values = dict(
+        MonthlyBorrowStat.objects.filter(month__gte=months[0]).values_list('month', 'borrowers')
+    )
+    return {'items': [{'date': m.strftime('%m.%Y'), 'value': values.get(m, 0)} for m in months]}
+
+
+def invalidate():
+    _cached['expires'] = 0.0
+
+
+def itemuse_stats(force=False):
+    """Данные для `/stat/itemuse`; одновременные промахи пересчитывает один поток."""
+    if not force and _cached['data'] is not None and time.monotonic() < _cached['expires']:
+        metrics.incr('stats.cache_hits')
+        return _cached['data']
+
+    generation = _cached['generation']
+    with _lock:
+        # пока ждали блокировку, другой поток уже всё пересчитал
+        if _cached['generation'] != generation and _cached['data'] is not None:
+            metrics.incr('stats.cache_hits')
+            return _cached['data']
+        metrics.incr('stats.cache_misses')
+        started = time.monotonic()
+        data = build_itemuse()
+        metrics.observe('stats.build', time.monotonic() - started)
+        _cached.update(
+            data=data,
+            expires=time.monotonic() + getattr(settings, 'STAT_CACHE_TTL', 60),
+            generation=generation + 1,
+        )
+        return data
@@ -0,0 +1,160 @@
+"""
+Контентно-адресуемое хранилище обложек.
+
+Файл сохраняется под именем sha256 своего содержимого
+(`covers/ab/abcdef....jpg`), поэтому одинаковые загрузки лежат на диске
+один раз. Число ссылок на файл — это число книг с таким `cover`;
+когда оно падает до нуля, файл и его производные удаляются
+(см. `release_cover` и сигналы в signals.py).
+
+Загрузка одинакового файла может идти параллельно с его освобождением:
+`_save` уже вернул существующее имя, а книга ещё не сохранена в БД и
+в счётчик ссылок не попала. Поэтому повторная загрузка обновляет mtime
+файла, а удаляются только файлы старше `COVER_SWEEP_GRACE` секунд —
+свежие остаются команде `sweep_covers`.
+"""
+
+import glob
+import hashlib
+import os
+import posixpath
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+from . import metrics
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    @staticmethod
+    def content_hash(content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        return digest.hexdigest()
+
+    @staticmethod
+    def hashed_name(name, digest):
+        directory = posixpath.dirname(name)
+        ext = Path(name).suffix.lower()
+        return posixpath.join(directory, digest[:2], f'{digest}{ext}')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, self.content_hash(content))
+        return super().save(name, content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # одинаковое имя означает одинаковое содержимое — суффиксы не нужны
+        return name
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            try:
+                # отмечаем использование, чтобы файл не удалили до сохранения книги
+                os.utime(full_path)
+            except FileNotFoundError:
+                pass  # файл как раз удаляют — запишем его заново
+            else:
+                metrics.incr('storage.dedup_hits')
+                return name
+
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        # пишем во временный файл и атомарно переименовываем: параллельная
+        # загрузка того же файла не увидит его недописанным
+        tmp_path = f'{full_path}.{uuid.uuid4().hex}.part'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return name
+
+
+cover_storage = ContentAddressedStorage()
+
+
+def get_cover_storage():
+    return cover_storage
+
+
+def cover_refcount(name, exclude_pk=None):
+    """Сколько книг ссылается на файл обложки `name`."""
+    from .models import Book
+
+    qs = Book.objects.filter(cover=name)
+    if exclude_pk is not None:
+        qs = qs.exclude(pk=exclude_pk)
+    return qs.count()
+
+
+def derived_files(name):
+    """Производные файлы обложки `name`, которые есть на диске."""
+    from .images import DERIVED_DIR, derived_stem
+
+    directory = Path(cover_storage.path(DERIVED_DIR))
+    if not directory.is_dir():
+        return []
+    return [f'{DERIVED_DIR}/{p.name}' for p in directory.glob(f'{glob.escape(derived_stem(name))}-*')]
+
+
+def sweep_grace():
+    return getattr(settings, 'COVER_SWEEP_GRACE', 3600)
+
+
+def discard_file(name, grace=None):
+    """Удалить файл хранилища, если его не трогали последние `grace` секунд.
+
+    Файл сначала переименовывается. `_save`, успевший обновить mtime до
+    этого, вернёт файл на место (mtime проверяется уже после переименования),
+    а после переименования просто запишет содержимое заново.
+    """
+    full_path = cover_storage.path(name)
+    trash = f'{full_path}.{uuid.uuid4().hex}.del'
+    cutoff = time.time() - (sweep_grace() if grace is None else grace)
+    try:
+        if os.path.getmtime(full_path) > cutoff:
+            return False
+        os.rename(full_path, trash)
+    except FileNotFoundError:
+        return False
+    if os.path.getmtime(trash) > cutoff:
+        os.replace(trash, full_path)
+        return False
+    os.unlink(trash)
+    return True
+
+
+def release_cover(name):
+    """Удалить файл обложки и его производные, если на него больше никто не ссылается.
+
+    Недавно загруженный файл не трогаем: его может ждать ещё не сохранённая
+    книга, а если нет — его уберёт `sweep_covers`.
+    """
+    if not name or cover_refcount(name) or not discard_file(name):
+        return False
+    for path in derived_files(name):
+        discard_file(path)
+    metrics.incr('storage.released')
+    return True
@@ -1,2 +1,1024 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import io
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.signals import request_started
+from django.http import JsonResponse, StreamingHttpResponse
+from django.db import OperationalError, connection
+from django.test import (
+    AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils import timezone
+from PIL import Image
+
+from . import benchmark, catalog, export, metrics, oidc_backend, profiling, stats, translation
+from .management.commands.bench_oidc import StandInIdP
+from .management.commands.bench_translation import SyncOnlyTranslator
+from .cart import MAX_QUANTITY, add_item
+from .images import DERIVED_DIR, build_derivatives, derived_stem
+from .models import MAX_ID, Book, BookTranslation, CartItem, MonthlyBorrowStat, TranslationCacheEntry
+from .pagination import BOOK_SORTS, encode_cursor, keyset_paginate
+from .roles import ADMIN_GROUP
+from .routers import REPLICA_ALIAS, ReplicaRouter
+from .search import search_book_ids
+from .storage import cover_storage, release_cover
+from .versioning import get_catalog_version
+from .views import annotated_users
+
+# Бюджеты на маршрут из library/urls.py: (SQL-запросов максимум, мс медианы).
+# Запросы меряются после первого (прогревочного) запроса клиента: он пишет роли
+# в сессию. Перед каждым замером кэш очищается — считается промах кэша фрагментов
+# и фасетов, иначе N+1 в шаблоне карточки не виден. Страницы с проверкой прав
+# читают группы пользователя из БД (ROLES_SESSION_CACHE выключен с LocMemCache,
+# см. settings.py). Время зависит от машины, поэтому проверяется только с
+# PERF_BUDGET_TIMES=1 и умножается на PERF_BUDGET_TIME_FACTOR.
+QUERY_BUDGETS = {
+    'index': (8, 150),
+    'search': (2, 150),
+    'search_suggest': (2, 100),
+    'stat_page': (3, 100),
+    'itemuse_json': (2, 100),
+    'register': (0, 100),
+    'login': (0, 100),
+    'logout': (4, 100),
+    'add_book': (3, 150),
+    'edit_book': (4, 150),
+    'delete_book': (8, 150),
+    'book_detail': (3, 150),
+    'book_details': (3, 150),
+    'view_cart': (5, 150),
+    'add_to_cart': (3, 100),
+    'remove_from_cart': (4, 100),
+    'checkout_cart': (9, 150),
+    'cart_batch': (8, 150),
+    'admin_users_list': (4, 250),
+    'admin_user_cart': (5, 150),
+    'admin_promote_user': (9, 150),
+    'metrics_json': (3, 100),
+    'export_books': (4, 500),
+    'export_carts': (4, 300),
+    'profiles_list': (3, 100),
+    'profile_download': (3, 100),
+}
+CHECK_TIMES = os.environ.get('PERF_BUDGET_TIMES') == '1'
+TIME_FACTOR = float(os.environ.get('PERF_BUDGET_TIME_FACTOR', 1))
+
+
+def counted(queries):
+    # TestCase оборачивает тест в транзакцию, и atomic() во view превращается
+    # в SAVEPOINT — в проде этих запросов нет
+    return [q for q in queries if 'SAVEPOINT' not in q[:30].upper()]
+
+
+class QueryBudgetTests(TestCase):
+    """Каждый сценарий benchmark.SCENARIOS укладывается в бюджет своего маршрута."""
+
+    REPEAT = 3
+
+    @classmethod
+    def setUpClass(cls):
+        # до super(): setUpTestData уже переводит книги
+        media = tempfile.mkdtemp(prefix='library_tests_')
+        cls.addClassCleanup(shutil.rmtree, media, ignore_errors=True)
+        cls.enterClassContext(override_settings(
+            BOOK_TRANSLATION_ASYNC=False, MEDIA_ROOT=media, PROFILE_DIR=os.path.join(media, 'profiles'),
+        ))
+        translation.set_translator(translation.FakeTranslator(latency=0))
+        cls.addClassCleanup(translation.set_translator, None)
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = benchmark.seed(books=200, users=20, cart_items=8)
+        # переводы готовы заранее: GET карточки меряется по пути чтения, без
+        # ленивого перевода и записи в BookTranslation
+        translation.refresh_book_translations(cls.fixture.book_ids)
+
+    def setUp(self):
+        cache.clear()
+        translation.memory_cache.clear()
+
+    def test_every_route_has_budget_and_scenario(self):
+        routes = benchmark.url_names()
+        self.assertEqual(sorted(routes - QUERY_BUDGETS.keys()), [], 'маршруты без бюджета')
+        self.assertEqual(sorted(QUERY_BUDGETS.keys() - routes), [], 'бюджеты несуществующих маршрутов')
+        self.assertEqual(benchmark.missing_routes(), [], 'маршруты без сценария в benchmark.SCENARIOS')
+
+    def test_query_and_time_budgets(self):
+        worker = benchmark.Worker(self.fixture, 0, 0)
+        for scenario in benchmark.SCENARIOS:
+            max_queries, max_ms = QUERY_BUDGETS[scenario.url_name]
+            with self.subTest(scenario.label):
+                worker.request(scenario)
+                runs = []
+                for _ in range(self.REPEAT):
+                    cache.clear()
+                    runs.append(worker.request(scenario))
+                for status, _, _ in runs:
+                    self.assertLess(status, 400, f'{scenario.label}: HTTP {status}')
+                worst = max((counted(queries) for _, _, queries in runs), key=len)
+                if len(worst) > max_queries:
+                    sql = '\n'.join(f'  {i}. {q}' for i, q in enumerate(worst, 1))
+                    self.fail(f'{scenario.label}: {len(worst)} SQL-запросов при бюджете {max_queries}:\n{sql}')
+                if not CHECK_TIMES:
+                    continue
+                elapsed_ms = statistics.median(elapsed for _, elapsed, _ in runs) * 1000
+                self.assertLessEqual(
+                    elapsed_ms, max_ms * TIME_FACTOR,
+                    f'{scenario.label}: {elapsed_ms:.1f} мс при бюджете {max_ms * TIME_FACTOR:.0f} мс',
+                )
+
+
+class OIDCBackendTests(TestCase):
+    def setUp(self):
+        self.idp = StandInIdP()
+        self.addCleanup(self.idp.close)
+        oidc_backend.reset_jwks_cache()
+        self.addCleanup(oidc_backend.reset_jwks_cache)
+        self.enterContext(override_settings(
+            OIDC_OP_TOKEN_ENDPOINT=f'{self.idp.url}/token',
+            OIDC_OP_JWKS_ENDPOINT=f'{self.idp.url}/certs',
+            OIDC_OP_USER_ENDPOINT=f'{self.idp.url}/userinfo',
+            OIDC_TIMEOUT=10,
+        ))
+
+    def login(self, index=1):
+        request = RequestFactory().get('/oidc/callback/', {'code': f'{index}:nonce', 'state': 's'})
+        request.session = {}
+        return oidc_backend.KeycloakOIDCBackend().authenticate(request, nonce='nonce')
+
+    def test_login_with_encryption_key_in_jwks(self):
+        # JWKS как у Keycloak: ключ RSA-OAEP "use": "enc" рядом с ключом подписи
+        user = self.login()
+        self.assertIsNotNone(user)
+        self.assertEqual(user.email, 'reader1@example.org')
+        kids = [jwk['kid'] for jwk, _ in oidc_backend._jwks['keys']]
+        self.assertEqual(kids, ['bench-1'])
+
+    def test_key_rotation_refreshes_jwks(self):
+        self.assertIsNotNone(self.login())
+        self.idp.rotate()
+        self.assertIsNotNone(self.login())
+        self.assertEqual(self.idp.hits['certs'], 2)
+
+    def test_concurrent_logins_fetch_jwks_once(self):
+        self.idp.latency = 0.2
+        backend = oidc_backend.KeycloakOIDCBackend()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: backend._cached_jwks(), range(8)))
+        self.assertEqual(self.idp.hits['certs'], 1)
+        self.assertTrue(all(keys is results[0] for keys in results))
+
+
+class RolesTests(TestCase):
+    """Разжалованный администратор теряет доступ, даже если роли лежат в его сессии."""
+
+    def setUp(self):
+        cache.clear()
+        self.group, _ = Group.objects.get_or_create(name=ADMIN_GROUP)
+        self.user = User.objects.create_user('librarian', password=benchmark.PASSWORD)
+        self.user.groups.add(self.group)
+        self.client.force_login(self.user)
+
+    def assertAdminPage(self, status):
+        self.assertEqual(self.client.get('/book/add/').status_code, status)
+
+    def test_session_roles_off_with_process_local_cache(self):
+        self.assertFalse(settings.ROLES_SESSION_CACHE)
+        self.assertAdminPage(200)
+        # другой воркер разжаловал пользователя: версия в этом процессе не изменилась
+        self.user.groups.remove(self.group)
+        self.assertAdminPage(403)
+
+    @override_settings(ROLES_SESSION_CACHE=True)
+    def test_demotion_invalidates_session_roles(self):
+        self.assertAdminPage(200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.remove(self.group)
+        self.assertAdminPage(403)
+
+    @override_settings(ROLES_SESSION_CACHE=True)
+    def test_lost_version_does_not_revive_session_roles(self):
+        self.assertAdminPage(200)
+        self.user.groups.remove(self.group)
+        # кэш перезапущен раньше, чем до него дошла новая версия
+        cache.clear()
+        self.assertAdminPage(403)
+
+
+class TranslationBreakerTests(TestCase):
+    """Переводчик медленнее бюджета запроса размыкает breaker, а опоздавшие ответы его не замыкают."""
+
+    BUDGET = 0.01
+
+    def setUp(self):
+        self.translator = translation.FakeTranslator(latency=0.1)
+        translation.set_translator(self.translator)
+        self.addCleanup(translation.set_translator, None)
+        translation.breaker.reset()
+        self.addCleanup(translation.breaker.reset)
+        translation.memory_cache.clear()
+
+    def drain(self):
+        # опоздавшие вызовы успевают завершиться в пуле
+        time.sleep(self.translator.latency * 2)
+
+    def assertRejects(self):
+        calls = self.translator.calls
+        self.assertEqual(translation.lookup_many(['ещё одна книга'], 'en', budget=self.BUDGET), {})
+        self.assertEqual(self.translator.calls, calls)
+
+    def test_slow_translator_trips_breaker(self):
+        for i in range(translation.breaker.threshold):
+            self.assertEqual(translation.lookup_many([f'книга {i}'], 'en', budget=self.BUDGET), {})
+            self.drain()
+        self.assertEqual(translation.breaker.state, translation.CircuitBreaker.OPEN)
+        self.assertRejects()
+
+    def use_pool(self, workers):
+        pool = ThreadPoolExecutor(max_workers=workers)
+        self.addCleanup(setattr, translation, '_pool', translation._pool)
+        self.addCleanup(pool.shutdown)
+        translation._pool = pool
+
+    def test_each_started_timed_out_call_is_a_failure(self):
+        texts = [f'книга {i}' for i in range(translation.breaker.threshold)]
+        self.use_pool(len(texts))
+        self.assertEqual(translation.lookup_many(texts, 'en', budget=self.BUDGET), {})
+        self.assertEqual(translation.breaker.state, translation.CircuitBreaker.OPEN)
+        self.drain()
+        self.assertEqual(translation.breaker.state, translation.CircuitBreaker.OPEN)
+
+    def test_queued_calls_are_not_failures(self):
+        # холодная страница: строк больше, чем потоков в пуле, провайдер здоров,
+        # но медленнее бюджета — до него дошли только два вызова
+        self.use_pool(2)
+        texts = [f'книга {i}' for i in range(translation.breaker.threshold * 4)]
+        self.assertEqual(translation.lookup_many(texts, 'en', budget=self.BUDGET), {})
+        self.drain()
+        self.assertEqual(self.translator.calls, 2)
+        self.assertEqual(translation.breaker.failures, 2)
+        self.assertEqual(translation.breaker.state, translation.CircuitBreaker.CLOSED)
+
+    @override_settings(TRANSLATION_ASYNC_CONCURRENCY=2)
+    def test_async_queued_calls_are_not_failures(self):
+        texts = [f'книга {i}' for i in range(translation.breaker.threshold * 4)]
+
+        async def request():
+            self.assertEqual(await translation.alookup_many(texts, 'en', budget=self.BUDGET), {})
+            await asyncio.sleep(self.translator.latency * 2)
+
+        async_to_sync(request)()
+        self.assertEqual(self.translator.calls, 2)
+        self.assertEqual(translation.breaker.failures, 2)
+        self.assertEqual(translation.breaker.state, translation.CircuitBreaker.CLOSED)
+
+    def test_late_result_fills_cache(self):
+        self.assertEqual(translation.lookup_many(['книга'], 'en', budget=self.BUDGET), {})
+        self.drain()
+        self.assertEqual(translation.breaker.failures, 1)
+        calls = self.translator.calls
+        self.assertEqual(translation.lookup_many(['книга'], 'en', budget=self.BUDGET), {'книга': '[en] книга'})
+        self.assertEqual(self.translator.calls, calls)
+
+    def test_async_slow_translator_trips_breaker(self):
+        async def requests():
+            for i in range(translation.breaker.threshold):
+                self.assertEqual(await translation.alookup_many([f'книга {i}'], 'en', budget=self.BUDGET), {})
+                await asyncio.sleep(self.translator.latency * 2)
+
+        async_to_sync(requests)()
+        self.assertEqual(translation.breaker.state, translation.CircuitBreaker.OPEN)
+        self.assertRejects()
+
+
+class TranslationCacheTests(TestCase):
+    """Переводчик вызывается только для строк, которых нет ни в памяти процесса, ни в БД."""
+
+    TEXTS = ['Война и мир', 'Лев Толстой', '']
+    EXPECTED = {'Война и мир': '[en] Война и мир', 'Лев Толстой': '[en] Лев Толстой', '': ''}
+
+    def setUp(self):
+        self.translator = translation.FakeTranslator(latency=0)
+        translation.set_translator(self.translator)
+        self.addCleanup(translation.set_translator, None)
+        translation.breaker.reset()
+        translation.memory_cache.clear()
+        self.addCleanup(translation.memory_cache.clear)
+
+    def test_miss_then_memory_and_db_hits(self):
+        self.assertEqual(translation.lookup_many(self.TEXTS, 'en'), self.EXPECTED)
+        self.assertEqual(self.translator.calls, 2)
+        self.assertEqual(TranslationCacheEntry.objects.count(), 2)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(translation.lookup_many(self.TEXTS, 'en'), self.EXPECTED)
+        # другой процесс: памяти нет, переводы читаются из таблицы одним запросом
+        translation.memory_cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(translation.lookup_many(self.TEXTS, 'en'), self.EXPECTED)
+        self.assertEqual(self.translator.calls, 2)
+
+    def test_source_language_is_not_translated(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(translation.lookup_many(self.TEXTS, 'ru'), dict(zip(self.TEXTS, self.TEXTS)))
+        self.assertEqual(self.translator.calls, 0)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = benchmark.seed(books=30, users=1, cart_items=1, borrow_months=1)
+
+    def pages(self, ordering, **cursor):
+        pks = []
+        while True:
+            page = keyset_paginate(Book.objects.all(), ordering, 7, **cursor)
+            pks.extend(book.pk for book in page)
+            if 'before' in cursor:
+                if page.prev_cursor is None:
+                    return pks
+                cursor = {'before': page.prev_cursor}
+            elif page.next_cursor is None:
+                return pks
+            else:
+                cursor = {'after': page.next_cursor}
+
+    def test_cursor_round_trip(self):
+        for sort, ordering in BOOK_SORTS.items():
+            with self.subTest(sort):
+                expected = list(Book.objects.order_by(*ordering).values_list('pk', flat=True))
+                self.assertEqual(self.pages(ordering), expected)
+                last = Book.objects.order_by(*ordering).last()
+                values = [getattr(last, o.lstrip('-')) for o in ordering]
+                # назад от последней книги: все остальные страницы в обратном порядке
+                backwards = self.pages(ordering, before=encode_cursor(values))
+                self.assertEqual(sorted(backwards), sorted(expected[:-1]))
+
+    def test_tampered_cursor_serves_first_page(self):
+        bad_values = [None, {}, [1], True, 2 ** 70, 'не число']
+        cases = [('id', [value]) for value in bad_values]
+        cases += [('year', [value, 1]) for value in bad_values] + [('year', [1999, 'abc']), ('year', [1, 2, 3])]
+        for sort, values in cases:
+            with self.subTest(sort=sort, values=values):
+                response = self.client.get('/', {'sort': sort, 'after': encode_cursor(values)})
+                self.assertEqual(response.status_code, 200)
+        for cursor in ['%%%', 'bm90IGpzb24', encode_cursor({'a': 1})]:
+            with self.subTest(cursor):
+                self.assertEqual(self.client.get('/', {'before': cursor}).status_code, 200)
+
+    def test_tampered_cursor_in_users_list(self):
+        self.client.force_login(self.fixture.admin)
+        for values in ([None], [{}], [123], [2 ** 70]):
+            with self.subTest(values):
+                response = self.client.get('/manage/users/', {'after': encode_cursor(values)})
+                self.assertEqual(response.status_code, 200)
+
+
+class AsyncTranslatorTests(TestCase):
+    def setUp(self):
+        translation.memory_cache.clear()
+        translation.breaker.reset()
+        self.addCleanup(translation.set_translator, None)
+
+    def test_translator_without_async_api_uses_pool(self):
+        # как translatepy: вызовы из цикла событий уходят в пул потоков
+        translator = translation.FakeTranslator(latency=0)
+        translation.set_translator(SyncOnlyTranslator(translator))
+        texts = ['первая', 'вторая']
+        result = async_to_sync(translation.atranslate_many)(texts, 'en')
+        self.assertEqual(result, {text: f'[en] {text}' for text in texts})
+        self.assertEqual(translator.calls, 2)
+
+
+@override_settings(BOOK_TRANSLATION_ASYNC=False)
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = benchmark.seed(books=10, users=1, cart_items=1, borrow_months=1)
+
+    def setUp(self):
+        cache.clear()
+        translation.memory_cache.clear()
+        translation.set_translator(translation.FakeTranslator(latency=0))
+        self.addCleanup(translation.set_translator, None)
+
+    def assertStatus(self, path, etag, status):
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, status)
+
+    def test_unchanged_catalog_answers_304(self):
+        response = self.client.get('/')
+        etag = response['ETag']
+        self.assertStatus('/', etag, 304)
+        # тот же ETag на другой странице каталога — другой ответ
+        self.assertStatus('/?sort=title', etag, 200)
+
+        book = Book.objects.get(pk=self.fixture.book_ids[0])
+        book.title = 'Новое название'
+        with self.captureOnCommitCallbacks(execute=True):
+            book.save()
+        self.assertStatus('/', etag, 200)
+
+    def test_translation_refresh_changes_only_its_language(self):
+        self.client.get('/?lang=en')  # переводы книг сохраняются прямо в запросе
+        ru, en = self.client.get('/')['ETag'], self.client.get('/?lang=en')['ETag']
+        self.assertStatus('/?lang=en', en, 304)
+        catalog = get_catalog_version()
+
+        book_id = self.fixture.book_ids[0]
+        BookTranslation.objects.filter(book_id=book_id, lang='en').delete()
+        self.assertEqual(translation.refresh_book_translations([book_id], ['en']), 1)
+
+        self.assertEqual(get_catalog_version(), catalog)
+        self.assertStatus('/', ru, 304)
+        self.assertStatus('/?lang=en', en, 200)
+
+
+class CatalogFilterTests(TestCase):
+    """Фильтры, сортировка и фасеты боковой панели каталога."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for title, author, publisher, year in [
+            ('Война и мир', 'Толстой', 'Дом', 1869),
+            ('Анна Каренина', 'Толстой', 'Вестник', 1877),
+            ('Игрок', 'Достоевский', 'Дом', 1866),
+            ('Три сестры', 'Чехов', 'Вестник', 1901),
+        ]:
+            Book.objects.create(title=title, author=author, publisher=publisher, year=year, description='')
+
+    def setUp(self):
+        cache.clear()
+
+    def index(self, **params):
+        response = self.client.get('/', params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def titles(self, **params):
+        return [book.title for book in self.index(**params).context['books']]
+
+    def facets(self, **params):
+        sidebar = self.index(**params).context['sidebar']
+        return {facet: [(item['label'], item['count']) for item in sidebar[facet]] for facet in catalog.FACETS}
+
+    def test_filter_combinations(self):
+        self.assertEqual(self.titles(author='Толстой'), ['Война и мир', 'Анна Каренина'])
+        self.assertEqual(self.titles(author='Толстой', publisher='Дом'), ['Война и мир'])
+        self.assertEqual(self.titles(year_from=1870, year_to=1901), ['Анна Каренина', 'Три сестры'])
+        self.assertEqual(self.titles(publisher='Вестник', year_to=1880), ['Анна Каренина'])
+        self.assertEqual(self.titles(sort='-year'), ['Три сестры', 'Анна Каренина', 'Война и мир', 'Игрок'])
+
+    def test_facet_counts(self):
+        self.assertEqual(self.facets(), {
+            'author': [('Толстой', 2), ('Достоевский', 1), ('Чехов', 1)],
+            'publisher': [('Вестник', 2), ('Дом', 2)],
+            'decade': [('1900–1909', 1), ('1870–1879', 1), ('1860–1869', 2)],
+        })
+        # фасет не сужается собственным фильтром, но учитывает остальные
+        self.assertEqual(self.facets(author='Толстой'), {
+            'author': [('Толстой', 2), ('Достоевский', 1), ('Чехов', 1)],
+            'publisher': [('Вестник', 1), ('Дом', 1)],
+            'decade': [('1870–1879', 1), ('1860–1869', 1)],
+        })
+
+    def test_invalid_values_are_ignored(self):
+        everything = ['Война и мир', 'Анна Каренина', 'Игрок', 'Три сестры']
+        self.assertEqual(self.titles(year_from='abc', year_to=''), everything)
+        self.assertEqual(self.titles(sort='password'), everything)
+        self.assertEqual(self.titles(year_to=10 ** 30), everything)
+        self.assertEqual(self.index(year_from='abc').context['sidebar']['filters'], {})
+
+
+class BookDetailsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = benchmark.seed(books=3, users=1, cart_items=0, borrow_months=1)
+
+    def test_known_and_unknown_ids(self):
+        a, b, _ = self.fixture.book_ids
+        response = self.client.get('/book/details/', {'ids': f'{a},{b},{a},{MAX_ID}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.json()['items']), sorted([str(a), str(b)]))
+
+    def test_invalid_ids_are_rejected(self):
+        for ids in ['', 'abc', '-1', '0', str(MAX_ID + 1), '9' * 23, '1.5']:
+            with self.subTest(ids):
+                response = self.client.get('/book/details/', {'ids': ids})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+
+@override_settings(BOOK_TRANSLATION_ASYNC=False)
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        translation.set_translator(translation.FakeTranslator(latency=0))
+        cls.addClassCleanup(translation.set_translator, None)
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        books = [
+            ('Война и мир', 'Лев Толстой', ''),
+            ('Анна Каренина', 'Лев Толстой', ''),
+            ('Идиот', 'Фёдор Достоевский', ''),
+            ('Братья Карамазовы', 'Фёдор Достоевский', 'Последний роман автора «Идиота»'),
+        ]
+        cls.pk = {}
+        for title, author, description in books:
+            cls.pk[title] = Book.objects.create(
+                title=title, author=author, year=1870, publisher='Русский вестник', description=description,
+            ).pk
+
+    def test_title_match_ranks_first(self):
+        self.assertEqual(search_book_ids('идиот', 10), [self.pk['Идиот'], self.pk['Братья Карамазовы']])
+
+    def test_last_word_is_a_prefix(self):
+        self.assertEqual(search_book_ids('карен', 10), [self.pk['Анна Каренина']])
+        self.assertEqual(sorted(search_book_ids('лев толст', 10)), sorted([self.pk['Война и мир'], self.pk['Анна Каренина']]))
+        # префикс только у последнего слова
+        self.assertEqual(search_book_ids('толст лев', 10), [])
+
+    def test_out_of_range_page_is_empty(self):
+        for page in [str(settings.SEARCH_MAX_PAGE + 1), '999999999999999999', '9' * 40]:
+            with self.subTest(page):
+                response = self.client.get('/search/', {'q': 'идиот', 'page': page})
+                self.assertEqual(response.status_code, 200)
+                self.assertNotContains(response, 'Идиот')
+
+    def test_search_page_has_no_catalog_sidebar(self):
+        response = self.client.get('/search/', {'q': 'идиот'})
+        self.assertTemplateUsed(response, 'library/search.html')
+        self.assertContains(response, 'Идиот')
+        self.assertNotContains(response, 'Анна Каренина')
+        # фасеты и сортировка каталога к результатам поиска не применяются
+        self.assertNotContains(response, 'name="sort"')
+
+
+class CartBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = benchmark.seed(books=5, users=1, cart_items=0, borrow_months=1)
+        cls.user = cls.fixture.users[0]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def batch(self, *ops):
+        return self.client.post('/cart/batch/', {'ops': list(ops)}, content_type='application/json')
+
+    def cart(self):
+        return dict(CartItem.objects.filter(cart__user=self.user).values_list('book_id', 'quantity'))
+
+    def test_ops_apply_in_order(self):
+        a, b, c = self.fixture.book_ids[:3]
+        response = self.batch(
+            {'op': 'add', 'book': a, 'quantity': 2},
+            {'op': 'add', 'book': a},
+            {'op': 'set', 'book': b, 'quantity': 5},
+            {'op': 'add', 'book': c},
+            {'op': 'remove', 'book': c},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'items': [{'book': a, 'quantity': 3}, {'book': b, 'quantity': 5}],
+            'count': 8,
+        })
+        self.assertEqual(self.cart(), {a: 3, b: 5})
+
+    def test_invalid_batch_changes_nothing(self):
+        a = self.fixture.book_ids[0]
+        cases = [
+            [{'op': 'add', 'book': a}, {'op': 'add', 'book': 10 ** 9}],
+            [{'op': 'add', 'book': a}, {'op': 'drop', 'book': a}],
+            [{'op': 'add', 'book': str(a)}],
+            [{'op': 'add', 'book': a, 'quantity': True}],
+            [{'op': 'add', 'book': 10 ** 20}],
+            [{'op': 'remove', 'book': 10 ** 20}],
+            [{'op': 'remove', 'book': 0}],
+            [{'op': 'add', 'book': a, 'quantity': 10 ** 20}],
+            [{'op': 'add', 'book': a, 'quantity': 0}],
+            [{'op': 'add', 'book': a, 'quantity': -1}],
+            [{'op': 'set', 'book': a, 'quantity': 0}],
+            [{'op': 'set', 'book': a, 'quantity': MAX_QUANTITY + 1}],
+            [],
+        ]
+        for ops in cases:
+            with self.subTest(ops):
+                self.assertEqual(self.batch(*ops).status_code, 400)
+                self.assertEqual(self.cart(), {})
+
+
+    def test_single_add_bounds(self):
+        a = self.fixture.book_ids[0]
+        self.assertEqual(self.client.post(f'/cart/add/{10 ** 20}/').status_code, 404)
+        self.client.post(f'/cart/add/{a}/', {'quantity': 10 ** 20})
+        self.assertEqual(self.cart(), {a: MAX_QUANTITY})
+
+
+class CartUpsertTests(TransactionTestCase):
+    """Одновременные добавления одной книги не теряют обновлений и не падают на unique."""
+
+    def test_concurrent_adds(self):
+        user = User.objects.create_user('reader', password=benchmark.PASSWORD)
+        book = Book.objects.bulk_create([Book(title='Книга', author='A', year=2000, publisher='P', description='')])[0]
+
+        def add(_):
+            try:
+                while True:
+                    try:
+                        return add_item(user, book.pk, 1)
+                    except OperationalError as exc:
+                        # тестовая БД в памяти (shared cache) не ждёт busy_timeout,
+                        # а сразу отвечает «table is locked»; запрос при этом не применён
+                        if 'locked' not in str(exc):
+                            raise
+                        time.sleep(0.001)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(add, range(32)))
+        self.assertTrue(all(results))
+        self.assertEqual(CartItem.objects.get(cart__user=user, book=book).quantity, 32)
+
+
+class BorrowStatsTests(TestCase):
+    """Помесячный агрегат выдач и кэш /stat/itemuse."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Книга', author='Автор', year=2000, publisher='Изд', description='')
+        cls.alice = User.objects.create_user('alice')
+        cls.bob = User.objects.create_user('bob')
+
+    def checkout(self, user, quantity, *moment):
+        moment = timezone.make_aware(datetime.datetime(*moment))
+        stats.record_checkout(user, [CartItem(book=self.book, quantity=quantity)], moment)
+
+    def rollup(self):
+        return list(MonthlyBorrowStat.objects.order_by('month').values_list('month', 'borrowers', 'books'))
+
+    def test_checkout_updates_rollup(self):
+        self.checkout(self.alice, 1, 2026, 1, 1, 0, 10)
+        self.checkout(self.alice, 2, 2026, 1, 31, 23, 50)
+        self.checkout(self.bob, 1, 2026, 1, 15)
+        self.checkout(self.alice, 3, 2026, 2, 1, 0, 5)
+        # повторная выдача тому же человеку в том же месяце не увеличивает число читателей
+        self.assertEqual(self.rollup(), [
+            (datetime.date(2026, 1, 1), 2, 4),
+            (datetime.date(2026, 2, 1), 1, 3),
+        ])
+
+    def test_rebuild_matches_incremental_rollup(self):
+        self.checkout(self.alice, 1, 2026, 1, 31, 23, 50)
+        self.checkout(self.bob, 2, 2026, 2, 1, 0, 5)
+        self.checkout(self.bob, 1, 2026, 2, 20)
+        incremental = self.rollup()
+        stats.rebuild_rollup()
+        self.assertEqual(self.rollup(), incremental)
+
+    def test_concurrent_misses_build_once(self):
+        stats.invalidate()
+        self.addCleanup(stats.invalidate)
+        calls = []
+        start = threading.Barrier(8)
+
+        def build():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'items': []}
+
+        def request(_):
+            start.wait()
+            return stats.itemuse_stats()
+
+        with mock.patch.object(stats, 'build_itemuse', build), ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(request, range(8)))
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(r is results[0] for r in results))
+
+
+async def loop_probe(request):
+    # тестовый async view: в каком цикле событий он выполнился и один SQL-запрос
+    return JsonResponse({'loop': id(asyncio.get_running_loop()), 'books': await Book.objects.acount()})
+
+
+def stream_probe(request):
+    # тестовый потоковый view: запрос к БД выполняется уже при отдаче тела
+    return StreamingHttpResponse(str(Book.objects.count()) for _ in range(1))
+
+
+urlpatterns = [path('probe/', loop_probe), path('stream/', stream_probe)]
+
+
+class CoverStorageTests(TestCase):
+    """Файлы обложек: освобождение и производные варианты."""
+
+    def setUp(self):
+        media = tempfile.mkdtemp(prefix='library_tests_')
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media, COVER_SWEEP_GRACE=3600))
+
+    def age(self, *names):
+        past = time.time() - 7200
+        for name in names:
+            os.utime(cover_storage.path(name), (past, past))
+
+    def test_release_skips_cover_reused_by_pending_upload(self):
+        name = cover_storage.save('covers/a.jpg', ContentFile(b'cover'))
+        derived = f'{DERIVED_DIR}/{derived_stem(name)}-thumb.jpg'
+        os.makedirs(cover_storage.path(DERIVED_DIR))
+        with open(cover_storage.path(derived), 'wb') as f:
+            f.write(b'thumb')
+        self.age(name, derived)
+
+        # та же обложка загружена снова, книга с ней ещё не сохранена
+        self.assertEqual(cover_storage.save('covers/b.jpg', ContentFile(b'cover')), name)
+        self.assertFalse(release_cover(name))
+        self.assertTrue(cover_storage.exists(name))
+        self.assertTrue(cover_storage.exists(derived))
+
+        self.age(name)
+        self.assertTrue(release_cover(name))
+        self.assertFalse(cover_storage.exists(name))
+        self.assertFalse(cover_storage.exists(derived))
+
+    def test_shared_cover_released_with_last_book(self):
+        name = cover_storage.save('covers/a.jpg', ContentFile(b'cover'))
+        # bulk_create: без сигналов, как import_books
+        first, second = Book.objects.bulk_create([
+            Book(title=title, author='A', year=2000, publisher='P', description='', cover=name)
+            for title in ('Первая', 'Вторая')
+        ])
+        self.age(name)
+        first.delete()
+        self.assertFalse(release_cover(name))
+        self.assertTrue(cover_storage.exists(name))
+        second.delete()
+        self.assertTrue(release_cover(name))
+        self.assertFalse(cover_storage.exists(name))
+
+    def test_srcset_uses_actual_widths_once(self):
+        source = os.path.join(settings.MEDIA_ROOT, 'small.png')
+        Image.new('RGB', (150, 220), 'white').save(source)
+        fields = build_derivatives(
+            source, settings.MEDIA_ROOT, 'small_png', {'thumb': 200, 'modal': 600}, ['webp', 'jpeg'],
+        )
+        self.assertEqual(fields['cover_variants']['thumb'], fields['cover_variants']['modal'])
+
+        book = Book(cover='covers/small.png', cover_variants=fields['cover_variants'])
+        srcsets = [source['srcset'] for source in book.cover_sources()] + [book.cover_fallback_srcset]
+        self.assertEqual(srcsets, [
+            f'{settings.MEDIA_URL}{DERIVED_DIR}/small_png-thumb.webp 150w',
+            f'{settings.MEDIA_URL}{DERIVED_DIR}/small_png-thumb.jpg 150w',
+        ])
+
+
+class UsersListTests(TestCase):
+    """Список пользователей для администраторов: счётчики, поиск и страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('zz-admin', is_staff=True)
+        cls.users = [User.objects.create_user(f'u{i:02}') for i in range(12)]
+        Group.objects.get_or_create(name=ADMIN_GROUP)[0].user_set.add(cls.users[0])
+        books = [
+            Book.objects.create(title=f'Книга {i}', author='Автор', year=2000, publisher='Изд', description='')
+            for i in range(2)
+        ]
+        add_item(cls.users[1], books[0].pk, 2)
+        add_item(cls.users[1], books[1].pk, 3)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def page(self, query=''):
+        response = self.client.get(f'/manage/users/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def test_annotated_counts(self):
+        users = {u.username: u for u in annotated_users()}
+        last_added = CartItem.objects.filter(cart__user=self.users[1]).latest('added_at').added_at
+        self.assertEqual((users['u01'].cart_items, users['u01'].last_activity), (5, last_added))
+        self.assertEqual((users['u02'].cart_items, users['u02'].last_activity), (0, None))
+        mine = {u.username for u in [self.admin, *self.users]}
+        self.assertEqual({name for name in mine if users[name].is_library_admin}, {'u00', 'zz-admin'})
+
+    def test_search_by_prefix(self):
+        self.assertEqual([u.username for u in self.page('q=u1')['users']], ['u10', 'u11'])
+        self.assertEqual(list(self.page('q=x')['users']), [])
+
+    def test_cursor_walks_every_user_once(self):
+        seen, query = [], 'size=5'
+        while query:
+            context = self.page(query)
+            seen += [u.username for u in context['users']]
+            query = context['next_query']
+        # кроме созданных здесь, в базе есть пользователи из post_migrate (signals.py)
+        self.assertEqual(seen, list(User.objects.order_by('username').values_list('username', flat=True)))
+        # назад с последней страницы — предыдущие пять
+        self.assertEqual([u.username for u in self.page(context['prev_query'])['users']], seen[5:10])
+
+    def test_query_count_does_not_grow_with_page(self):
+        everyone = User.objects.count()
+        with CaptureQueriesContext(connection) as small:
+            self.page('size=2')
+        with CaptureQueriesContext(connection) as large:
+            self.page(f'size={everyone}')
+        self.assertEqual(len(large), len(small))
+
+
+class ExportTests(TestCase):
+    """Потоковая выгрузка каталога и корзин для администраторов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('exporter', is_staff=True)
+        cls.reader = User.objects.create_user('reader')
+        cls.war = Book.objects.create(title='Война и мир', author='Толстой', year=1869, publisher='Изд', description='Роман')
+        cls.idiot = Book.objects.create(title='Идиот', author='Достоевский', year=1869, publisher='Изд', description='Роман')
+        BookTranslation.objects.create(
+            book=cls.war, lang='en', title='War and Peace', author='Tolstoy', description='Novel', source_hash='',
+        )
+        add_item(cls.reader, cls.idiot.pk, 2)
+
+    def export(self, what, **params):
+        self.client.force_login(self.admin)
+        return self.client.get(f'/manage/export/{what}/', params)
+
+    @staticmethod
+    def content(response):
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_admin_only(self):
+        self.assertEqual(self.client.get('/manage/export/books/').status_code, 302)
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.get('/manage/export/books/').status_code, 403)
+
+    def test_books_csv_with_selected_fields(self):
+        response = self.export('books', fields='id,title')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.reader(io.StringIO(self.content(response).lstrip('\ufeff'))))
+        self.assertEqual(rows, [['id', 'title'], [str(self.war.pk), 'Война и мир'], [str(self.idiot.pk), 'Идиот']])
+
+    def test_carts_jsonl(self):
+        response = self.export('carts', format='jsonl')
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['username'], 'reader')
+        self.assertEqual((rows[0]['book_id'], rows[0]['title'], rows[0]['quantity']), (self.idiot.pk, 'Идиот', 2))
+        self.assertEqual(set(rows[0]), set(export.CART_FIELDS))
+
+    def test_translated_columns_fall_back_to_original(self):
+        response = self.export('books', format='jsonl', lang='en', fields='title,author,year')
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual(rows, [
+            {'title': 'War and Peace', 'author': 'Tolstoy', 'year': 1869},
+            {'title': 'Идиот', 'author': 'Достоевский', 'year': 1869},
+        ])
+
+    def test_unknown_fields_and_formats_are_rejected(self):
+        self.assertEqual(self.export('books', fields='id,password').status_code, 400)
+        self.assertEqual(self.export('carts', fields='quantity,description').status_code, 400)
+        self.assertEqual(self.export('books', format='xml').status_code, 400)
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    """Чтение каталога идёт на реплику, пока запрос ничего не записал."""
+
+    def setUp(self):
+        # сам алиас не открывается: роутер только смотрит, настроен ли он
+        self.enterContext(mock.patch.dict(settings.DATABASES, {REPLICA_ALIAS: settings.DATABASES['default']}))
+        request_started.send(sender=None)
+        self.addCleanup(request_started.send, sender=None)
+        self.router = ReplicaRouter()
+
+    def test_catalog_reads_go_to_replica(self):
+        self.assertEqual(self.router.db_for_read(Book), REPLICA_ALIAS)
+        self.assertIsNone(self.router.db_for_read(CartItem))
+
+    def test_pinned_to_primary_after_write(self):
+        self.assertEqual(self.router.db_for_write(CartItem), 'default')
+        self.assertIsNone(self.router.db_for_read(Book))
+        # следующий запрос снова читает с реплики
+        request_started.send(sender=None)
+        self.assertEqual(self.router.db_for_read(Book), REPLICA_ALIAS)
+
+
+class ImportBooksTests(TestCase):
+    """import_books: пакеты, upsert по естественному ключу и продолжение после сбоя."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='library_tests_')
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+
+    def write(self, lines):
+        path = os.path.join(self.dir, 'books.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            for line in lines:
+                f.write((line if isinstance(line, str) else json.dumps(line, ensure_ascii=False)) + '\n')
+        return path
+
+    def run_import(self, path, *args):
+        errors = os.path.join(self.dir, 'errors.jsonl')
+        call_command('import_books', path, '--workers', '1', '--errors', errors, *args, stdout=io.StringIO())
+        if not os.path.exists(errors):
+            return []
+        with open(errors, encoding='utf-8') as f:
+            return [json.loads(line)['line'] for line in f]
+
+    @staticmethod
+    def row(n, **extra):
+        return {'title': f'Книга {n}', 'author': 'Автор', 'year': 2000, 'publisher': 'Изд', 'description': 'Опис', **extra}
+
+    def test_batches_and_duplicates(self):
+        path = self.write([
+            self.row(1), self.row(2), {'title': 'без автора'}, self.row(3),
+            self.row(1, description='новое'),
+        ])
+        self.assertEqual(self.run_import(path, '--batch-size', '2'), [3])
+        self.assertEqual(sorted(Book.objects.values_list('title', flat=True)), ['Книга 1', 'Книга 2', 'Книга 3'])
+        # строка 5 в другом пакете, чем строка 1: обновила ту же книгу
+        self.assertEqual(Book.objects.get(title='Книга 1').description, 'новое')
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+    def test_existing_book_is_updated(self):
+        book = Book.objects.create(**self.row(1))
+        old_hash = book.compute_source_hash()
+        self.run_import(self.write([self.row(1, publisher='Другое', description='Другое')]))
+        book.refresh_from_db()
+        self.assertEqual(Book.objects.count(), 1)
+        self.assertEqual((book.publisher, book.description), ('Другое', 'Другое'))
+        self.assertNotEqual(book.source_hash, old_hash)
+
+    def test_resume_skips_written_lines(self):
+        # первые две строки записал прошлый запуск: их не читают заново, даже битые
+        path = self.write(['{не json', self.row(1), self.row(2)])
+        with open(f'{path}.checkpoint', 'w', encoding='utf-8') as f:
+            json.dump({'line': 2}, f)
+        self.assertEqual(self.run_import(path, '--resume'), [])
+        self.assertEqual(list(Book.objects.values_list('title', flat=True)), ['Книга 2'])
+
+
+@override_settings(ROOT_URLCONF=__name__, PERF_INSTRUMENTATION=True)
+class AsyncMiddlewareTests(TestCase):
+    """Под ASGI цепочка middleware остаётся асинхронной: async view выполняется в цикле сервера."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('profiler', password=benchmark.PASSWORD, is_staff=True)
+
+    async def test_middleware_chain_stays_async(self):
+        # с DEBUG Django пишет в django.request о каждом middleware, которое пришлось адаптировать
+        with override_settings(DEBUG=True), self.assertNoLogs('django.request', 'DEBUG'):
+            response = await AsyncClient().get('/probe/')
+        self.assertEqual(response.json()['loop'], id(asyncio.get_running_loop()))
+        # SQL из потока sync_to_async попал в замеры PerformanceMiddleware
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+    async def test_profile_async_request(self):
+        media = tempfile.mkdtemp(prefix='library_tests_')
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        client = AsyncClient()
+        await client.aforce_login(self.admin)
+        with override_settings(PROFILE_DIR=media):
+            response = await client.get('/probe/', headers={'X-Profile': profiling.make_token(self.admin)})
+            self.assertEqual(response.status_code, 200)
+            names = [meta['name'] for meta in profiling.list_profiles()]
+        self.assertEqual(names, [response['X-Profile-Id']])
+
+    def test_metric_keys_use_known_languages(self):
+        metrics.reset()
+        self.client.get('/probe/', {'lang': 'en'})
+        self.client.get('/probe/', {'lang': 'xx-unknown'})
+        self.client.get('/probe/', {'lang': 'yy-unknown'})
+        langs = {key.split('.')[-2] for key in metrics.snapshot()['histograms']}
+        self.assertEqual(langs, {'en', 'other'})
+
+    def test_streaming_response_is_labelled(self):
+        metrics.reset()
+        response = self.client.get('/stream/')
+        self.assertEqual(b''.join(response.streaming_content), b'0')
+        self.assertIn('desc="streaming"', response['Server-Timing'])
+        self.assertEqual(metrics.snapshot()['histograms'], {})
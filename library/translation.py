@@ -0,0 +1,671 @@
+"""
+Слой перевода поверх translatepy с двухуровневым кэшем.
+
+Первый уровень — LRU в памяти процесса, второй — таблица
+`TranslationCacheEntry`, общая для всех воркеров. Ключ кэша —
+(sha256 исходного текста, целевой язык).
+"""
+
+import asyncio
+import datetime
+import hashlib
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import metrics
+
+# translatepy не знает код 'kz', казахский у него — 'kk'
+LANG_ALIASES = {'kz': 'kk'}
+SOURCE_LANG = 'ru'
+
+# SQLite ограничивает число параметров в запросе
+DB_CHUNK_SIZE = 500
+
+
+def get_target_lang(lang):
+    return LANG_ALIASES.get(lang, lang)
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """Потокобезопасный LRU с ограничением размера и TTL записей."""
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < timezone.now():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires_at = None
+        if self.ttl:
+            expires_at = timezone.now() + datetime.timedelta(seconds=self.ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                metrics.incr('translation.cache.evictions')
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+memory_cache = LRUCache(
+    getattr(settings, 'TRANSLATION_CACHE_SIZE', 10000),
+    getattr(settings, 'TRANSLATION_CACHE_TTL', None),
+)
+
+_translator = None
+_translator_lock = threading.Lock()
+
+
+def get_translator():
+    """Ленивое создание переводчика из `settings.TRANSLATOR_CLASS`."""
+    global _translator
+    if _translator is None:
+        with _translator_lock:
+            if _translator is None:
+                cls = import_string(getattr(settings, 'TRANSLATOR_CLASS', 'translatepy.Translator'))
+                _translator = cls()
+    return _translator
+
+
+def set_translator(translator):
+    """Подменить переводчик (для тестов и бенчмарков). None — вернуть настройки."""
+    global _translator
+    with _translator_lock:
+        _translator = translator
+
+
+class FakeTranslator:
+    """Локальная замена translatepy для тестов и бенчмарков.
+
+    Не ходит в сеть: ждёт `latency` секунд и возвращает `[lang] text`.
+    Включается через `TRANSLATOR_CLASS = 'library.translation.FakeTranslator'`.
+    В отличие от translatepy, умеет `atranslate` (нативный async API).
+    """
+
+    class Result:
+        def __init__(self, result):
+            self.result = result
+
+    def __init__(self, latency=None):
+        if latency is None:
+            latency = getattr(settings, 'FAKE_TRANSLATOR_LATENCY', 0.05)
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def translate(self, text, destination_language, *args, **kwargs):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self.Result(f'[{destination_language}] {text}')
+
+    async def atranslate(self, text, destination_language, *args, **kwargs):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.Result(f'[{destination_language}] {text}')
+
+
+class CircuitBreaker:
+    """Перестаёт обращаться к переводчику после серии ошибок.
+
+    После `threshold` ошибок подряд breaker размыкается на `cooldown`
+    секунд; затем пропускает один пробный вызов (half-open) и по его
+    результату снова замыкается или размыкается. Вызов, не уложившийся в
+    бюджет запроса, — тоже ошибка, даже если ответ потом пришёл.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                # пропускаем ровно один пробный вызов
+                self.state = self.HALF_OPEN
+                return True
+            metrics.incr('translation.breaker.rejected')
+            return False
+
+    def is_open(self):
+        """Разомкнут ли breaker прямо сейчас (без пробного вызова)."""
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self.opened_at < self.cooldown
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self, count=1):
+        with self._lock:
+            self.failures += count
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN:
+                    metrics.incr('translation.breaker.trips')
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def reset(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+
+
+breaker = CircuitBreaker(
+    getattr(settings, 'TRANSLATION_BREAKER_THRESHOLD', 5),
+    getattr(settings, 'TRANSLATION_BREAKER_COOLDOWN', 30),
+)
+
+_pool = None
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _translator_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'TRANSLATION_MAX_WORKERS', 8),
+                    thread_name_prefix='translator',
+                )
+    return _pool
+
+
+def _finished_in_time(deadline):
+    # опоздавший вызов уже засчитан ошибкой по таймауту (_translate_pending):
+    # его успех не должен замыкать breaker, результат идёт только в кэш
+    return deadline is None or time.monotonic() <= deadline
+
+
+def _call_translator(text, target_lang, deadline=None):
+    if not breaker.allow():
+        return None
+    metrics.incr('translation.calls')
+    try:
+        translated = get_translator().translate(text, target_lang).result
+    except Exception:
+        # translatepy может упасть на любом провайдере — показываем оригинал
+        metrics.incr('translation.errors')
+        if _finished_in_time(deadline):
+            breaker.record_failure()
+        return None
+    if _finished_in_time(deadline):
+        breaker.record_success()
+    return translated
+
+
+def _load_from_db(hashes, target_lang):
+    from .models import TranslationCacheEntry
+
+    found = {}
+    ttl = getattr(settings, 'TRANSLATION_CACHE_TTL', None)
+    hashes = list(hashes)
+    for start in range(0, len(hashes), DB_CHUNK_SIZE):
+        qs = TranslationCacheEntry.objects.filter(
+            lang=target_lang, source_hash__in=hashes[start:start + DB_CHUNK_SIZE]
+        )
+        if ttl:
+            qs = qs.filter(created_at__gte=timezone.now() - datetime.timedelta(seconds=ttl))
+        found.update(qs.values_list('source_hash', 'text'))
+    return found
+
+
+def _store_in_db(translated, target_lang):
+    from .models import TranslationCacheEntry
+
+    now = timezone.now()
+    entries = [
+        TranslationCacheEntry(source_hash=h, lang=target_lang, text=text, created_at=now)
+        for h, text in translated.items()
+    ]
+    TranslationCacheEntry.objects.bulk_create(
+        entries,
+        batch_size=DB_CHUNK_SIZE,
+        update_conflicts=True,
+        unique_fields=['source_hash', 'lang'],
+        update_fields=['text', 'created_at'],
+    )
+
+
+def _remember_late(future, key):
+    # перевод пришёл после дедлайна: запроса он уже не спасёт, но пригодится следующему
+    translated = None if future.cancelled() else future.result()
+    if translated is not None:
+        memory_cache.set(key, translated)
+
+
+def _translate_pending(pending, target_lang, budget):
+    """Перевести {hash: текст} параллельно в общем пуле потоков.
+
+    Размер пула ограничен `TRANSLATION_MAX_WORKERS`, поэтому одна страница
+    не может открыть к провайдеру больше соединений, чем задано. Ждём не
+    дольше `budget` секунд (None — без ограничения); всё, что не успело,
+    остаётся без перевода.
+    """
+    if breaker.is_open():
+        metrics.incr('translation.breaker.rejected', len(pending))
+        return {}
+
+    metrics.incr('translation.batches')
+    pool = _get_pool()
+    deadline = None if budget is None else time.monotonic() + budget
+    futures = {h: pool.submit(_call_translator, text, target_lang, deadline) for h, text in pending.items()}
+    _, not_done = wait(futures.values(), timeout=budget)
+
+    done = {}
+    for h, future in futures.items():
+        if future in not_done:
+            continue
+        translated = future.result()
+        if translated is not None:
+            done[h] = translated
+
+    if not_done:
+        metrics.incr('translation.timeouts', len(not_done))
+        # вызовы из очереди пула отменяются и к провайдеру не уходят — это не его
+        # ошибка; breaker считает только начатые вызовы, не успевшие к дедлайну
+        late = [(h, f) for h, f in futures.items() if f in not_done and not f.cancel()]
+        if late:
+            breaker.record_failure(len(late))
+        for h, future in late:
+            future.add_done_callback(lambda f, key=(h, target_lang): _remember_late(f, key))
+    return done
+
+
+def _split_cached(texts, target_lang):
+    """Разделить строки на найденные в памяти ({текст: перевод}) и остальные ({hash: текст})."""
+    result = {}
+    pending = {}
+    seen = set()
+    for text in texts:
+        if text in seen:
+            continue
+        seen.add(text)
+        if not text or target_lang == SOURCE_LANG:
+            result[text] = text
+            continue
+        h = text_hash(text)
+        cached = memory_cache.get((h, target_lang))
+        if cached is not None:
+            metrics.incr('translation.cache.memory_hits')
+            result[text] = cached
+        else:
+            pending[h] = text
+    return result, pending
+
+
+def _merge(found, pending, result, target_lang, pop=False):
+    """Перенести переводы {hash: перевод} в `result` и в память процесса."""
+    for h, translated in found.items():
+        memory_cache.set((h, target_lang), translated)
+        result[pending.pop(h) if pop else pending[h]] = translated
+
+
+def lookup_many(texts, lang, budget=None):
+    """Перевести набор строк на язык `lang`.
+
+    Возвращает словарь {исходный текст: перевод} только для строк,
+    которые удалось перевести за `budget` секунд (по умолчанию
+    `TRANSLATION_BUDGET`).
+    """
+    if budget is None:
+        budget = getattr(settings, 'TRANSLATION_BUDGET', None)
+    deadline = None if budget is None else time.monotonic() + budget
+    target_lang = get_target_lang(lang)
+    result, pending = _split_cached(texts, target_lang)
+    if not pending:
+        return result
+
+    found = _load_from_db(pending.keys(), target_lang)
+    metrics.incr('translation.cache.db_hits', len(found))
+    _merge(found, pending, result, target_lang, pop=True)
+
+    metrics.incr('translation.cache.misses', len(pending))
+    remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+    fresh = {}
+    if pending:
+        started = time.perf_counter()
+        fresh = _translate_pending(pending, target_lang, remaining)
+        metrics.add_request_timing('translator', time.perf_counter() - started, len(pending))
+    _merge(fresh, pending, result, target_lang)
+    if fresh:
+        _store_in_db(fresh, target_lang)
+
+    return result
+
+
+def translate_many(texts, lang, budget=None):
+    """Как `lookup_many`, но для непереведённых строк возвращает оригинал."""
+    texts = list(texts)
+    translated = lookup_many(texts, lang, budget)
+    return {text: translated.get(text, text) for text in texts}
+
+
+def translate(text, lang):
+    return translate_many([text], lang)[text]
+
+
+# --- Асинхронный клиент (для async views под ASGI) ---
+# Одновременные вызовы в цикле событий получает только переводчик с `atranslate`
+# (FakeTranslator). Вызовы translatepy уходят в общий пул `_get_pool()`: поток
+# запроса не занят, но к провайдеру по-прежнему не больше TRANSLATION_MAX_WORKERS.
+
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def _async_semaphore():
+    # asyncio.Semaphore привязан к циклу событий, поэтому свой на каждый цикл
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(getattr(settings, 'TRANSLATION_ASYNC_CONCURRENCY', 64))
+    return semaphore
+
+
+async def _acall_translator(text, target_lang, deadline=None, on_start=None):
+    async with _async_semaphore():
+        if not breaker.allow():
+            return None
+        if on_start is not None:
+            on_start()
+        metrics.incr('translation.calls')
+        translator = get_translator()
+        try:
+            if hasattr(translator, 'atranslate'):
+                response = await translator.atranslate(text, target_lang)
+            else:
+                # у translatepy нет async API — блокирующий вызов уходит в общий пул
+                loop = asyncio.get_running_loop()
+                response = await loop.run_in_executor(_get_pool(), translator.translate, text, target_lang)
+            translated = response.result
+        except Exception:
+            metrics.incr('translation.errors')
+            if _finished_in_time(deadline):
+                breaker.record_failure()
+            return None
+    if _finished_in_time(deadline):
+        breaker.record_success()
+    return translated
+
+
+async def _atranslate_pending(pending, target_lang, budget):
+    """Async-версия `_translate_pending`: одновременных вызовов не больше `TRANSLATION_ASYNC_CONCURRENCY`."""
+    if breaker.is_open():
+        metrics.incr('translation.breaker.rejected', len(pending))
+        return {}
+
+    metrics.incr('translation.batches')
+    deadline = None if budget is None else time.monotonic() + budget
+    started = set()
+    tasks = {
+        h: asyncio.ensure_future(_acall_translator(text, target_lang, deadline, on_start=lambda h=h: started.add(h)))
+        for h, text in pending.items()
+    }
+    _, not_done = await asyncio.wait(tasks.values(), timeout=budget)
+
+    done = {}
+    for h, task in tasks.items():
+        if task not in not_done and task.result() is not None:
+            done[h] = task.result()
+
+    if not_done:
+        metrics.incr('translation.timeouts', len(not_done))
+        # как в `_translate_pending`: ждавшие семафора вызовы отменяются и не считаются
+        late = [(h, t) for h, t in tasks.items() if t in not_done and h in started]
+        for h, task in tasks.items():
+            if task in not_done and h not in started:
+                task.cancel()
+        if late:
+            breaker.record_failure(len(late))
+        for h, task in late:
+            task.add_done_callback(lambda t, key=(h, target_lang): _remember_late(t, key))
+    return done
+
+
+async def alookup_many(texts, lang, budget=None):
+    """Async-версия `lookup_many`: ожидание переводчика не занимает поток."""
+    if budget is None:
+        budget = getattr(settings, 'TRANSLATION_BUDGET', None)
+    deadline = None if budget is None else time.monotonic() + budget
+    target_lang = get_target_lang(lang)
+    result, pending = _split_cached(texts, target_lang)
+    if not pending:
+        return result
+
+    found = await sync_to_async(_load_from_db)(list(pending), target_lang)
+    metrics.incr('translation.cache.db_hits', len(found))
+    _merge(found, pending, result, target_lang, pop=True)
+
+    metrics.incr('translation.cache.misses', len(pending))
+    remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+    fresh = {}
+    if pending:
+        started = time.perf_counter()
+        fresh = await _atranslate_pending(pending, target_lang, remaining)
+        metrics.add_request_timing('translator', time.perf_counter() - started, len(pending))
+    _merge(fresh, pending, result, target_lang)
+    if fresh:
+        await sync_to_async(_store_in_db)(fresh, target_lang)
+
+    return result
+
+
+async def atranslate_many(texts, lang, budget=None):
+    texts = list(texts)
+    translated = await alookup_many(texts, lang, budget)
+    return {text: translated.get(text, text) for text in texts}
+
+
+# --- Сохранённые переводы книг (BookTranslation) ---
+
+_refresh_executor = None
+_refresh_pending = set()
+_refresh_lock = threading.Lock()
+
+
+def translation_languages():
+    return list(getattr(settings, 'TRANSLATION_LANGUAGES', ['en', 'kz']))
+
+
+def refresh_book_translations(book_ids, langs=None):
+    """Перевести книги и сохранить результат в `BookTranslation`.
+
+    Книги, у которых перевод уже соответствует `source_hash`, пропускаются.
+    Книги, для которых переводчик вернул ошибку, остаются без перевода и
+    будут обновлены при следующем обращении.
+    """
+    from .models import Book, BookTranslation
+
+    langs = langs or translation_languages()
+    books = list(Book.objects.filter(pk__in=book_ids))
+    if not books:
+        return 0
+
+    fresh = set(
+        BookTranslation.objects.filter(book__in=books, lang__in=langs)
+        .values_list('book_id', 'lang', 'source_hash')
+    )
+    saved = 0
+    for lang in langs:
+        todo = [b for b in books if (b.pk, lang, b.source_hash) not in fresh]
+        if not todo:
+            continue
+        texts = []
+        for book in todo:
+            texts.extend((book.title, book.author, book.description))
+        translated = lookup_many(texts, lang, getattr(settings, 'TRANSLATION_REFRESH_BUDGET', 120))
+
+        rows = []
+        for book in todo:
+            fields = (book.title, book.author, book.description)
+            if not all(text in translated for text in fields):
+                continue
+            rows.append(BookTranslation(
+                book=book,
+                lang=lang,
+                title=translated[book.title],
+                author=translated[book.author],
+                description=translated[book.description],
+                source_hash=book.source_hash,
+            ))
+        BookTranslation.objects.bulk_create(
+            rows,
+            batch_size=DB_CHUNK_SIZE,
+            update_conflicts=True,
+            unique_fields=['book', 'lang'],
+            update_fields=['title', 'author', 'description', 'source_hash', 'updated_at'],
+        )
+        if rows:
+            # меняются только страницы на этом языке; фасеты и кэши каталога остаются
+            from .versioning import bump_translation_version
+            bump_translation_version(lang)
+        saved += len(rows)
+    return saved
+
+
+def _run_refresh(book_ids, langs):
+    from django.db import connections
+
+    try:
+        refresh_book_translations(book_ids, langs)
+    except Exception:
+        metrics.incr('translation.refresh_errors')
+    finally:
+        with _refresh_lock:
+            _refresh_pending.difference_update((pk, lang) for pk in book_ids for lang in langs)
+        connections.close_all()
+
+
+def schedule_refresh(book_ids, langs=None):
+    """Поставить обновление переводов в фоновую очередь.
+
+    Повторные запросы на книги, которые уже ждут обновления, игнорируются.
+    При `BOOK_TRANSLATION_ASYNC = False` перевод выполняется сразу.
+    """
+    global _refresh_executor
+    langs = list(langs or translation_languages())
+    if not getattr(settings, 'BOOK_TRANSLATION_ASYNC', True):
+        refresh_book_translations(book_ids, langs)
+        return
+
+    with _refresh_lock:
+        keys = {(pk, lang) for pk in book_ids for lang in langs} - _refresh_pending
+        if not keys:
+            return
+        _refresh_pending.update(keys)
+        if _refresh_executor is None:
+            _refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='book-translations')
+    ids = sorted({pk for pk, _ in keys})
+    _refresh_executor.submit(_run_refresh, ids, langs)
+
+
+def translations_prefetch(lang, fields=None):
+    """`Prefetch` для загрузки переводов языка `lang` одним запросом.
+
+    `fields` — какие переводимые поля загружать (по умолчанию все).
+    """
+    from django.db.models import Prefetch
+    from .models import BookTranslation
+
+    queryset = BookTranslation.objects.filter(lang=lang)
+    if fields is not None:
+        queryset = queryset.only('id', 'book_id', 'source_hash', *fields)
+    return Prefetch('translations', queryset=queryset, to_attr='lang_translations')
+
+
+def apply_book_translations(books, lang):
+    """Подставить сохранённые переводы в книги, загруженные с `translations_prefetch`.
+
+    Для книг без актуального перевода остаётся оригинальный текст,
+    а обновление ставится в очередь.
+    """
+    if lang == SOURCE_LANG or lang not in translation_languages():
+        return
+    stale = []
+    for book in books:
+        tr = next(iter(getattr(book, 'lang_translations', ())), None)
+        if tr is not None and tr.source_hash == book.source_hash:
+            deferred = tr.get_deferred_fields()
+            for field in ('title', 'author', 'description'):
+                if field not in deferred:
+                    setattr(book, field, getattr(tr, field))
+        else:
+            stale.append(book.pk)
+    if stale:
+        metrics.incr('translation.stale_books', len(stale))
+        schedule_refresh(stale, [lang])
+
+
+def purge_expired():
+    """Удалить из таблицы записи старше TTL. Возвращает число удалённых строк."""
+    from .models import TranslationCacheEntry
+
+    ttl = getattr(settings, 'TRANSLATION_CACHE_TTL', None)
+    if not ttl:
+        return 0
+    deadline = timezone.now() - datetime.timedelta(seconds=ttl)
+    deleted, _ = TranslationCacheEntry.objects.filter(created_at__lt=deadline).delete()
+    return deleted
+
+
+def cache_stats():
+    return {
+        'memory_size': len(memory_cache),
+        'memory_max_size': memory_cache.max_size,
+        'memory_hits': metrics.get('translation.cache.memory_hits'),
+        'db_hits': metrics.get('translation.cache.db_hits'),
+        'misses': metrics.get('translation.cache.misses'),
+        'translator_calls': metrics.get('translation.calls'),
+        'translator_batches': metrics.get('translation.batches'),
+        'translator_errors': metrics.get('translation.errors'),
+        'translator_timeouts': metrics.get('translation.timeouts'),
+        'breaker_state': breaker.state,
+        'breaker_trips': metrics.get('translation.breaker.trips'),
+        'breaker_rejected': metrics.get('translation.breaker.rejected'),
+    }
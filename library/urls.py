@@ -1,10 +1,15 @@
 from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
-from library import views
+from library import views, async_views
+
+# async-версии каталога и корзины — для запуска под ASGI (см. library/async_views.py)
+catalog_views = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
-    path('', views.index, name='index'),
+    path('', catalog_views.index, name='index'),
+    path('search/', views.search, name='search'),
+    path('search/suggest/', views.search_suggest, name='search_suggest'),
     path('stat/', views.stat_page, name='stat_page'),
     path('stat/itemuse', views.itemuse_json, name='itemuse_json'),
     path('register/', views.register_view, name='register'),
@@ -13,13 +18,21 @@ urlpatterns = [
     path('book/add/', views.add_book, name='add_book'),
     path('book/<int:pk>/edit/', views.edit_book, name='edit_book'),
     path('book/<int:pk>/delete/', views.delete_book, name='delete_book'),
-    path('book/<int:pk>/detail/', views.book_detail, name='book_detail'),
-    path('cart/', views.view_cart, name='view_cart'),
-    path('cart/add/<int:book_id>/', views.add_to_cart, name='add_to_cart'),
-    path('cart/remove/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
+    path('book/<int:pk>/detail/', catalog_views.book_detail, name='book_detail'),
+    path('book/details/', catalog_views.book_details, name='book_details'),
+    path('cart/', catalog_views.view_cart, name='view_cart'),
+    path('cart/add/<int:book_id>/', catalog_views.add_to_cart, name='add_to_cart'),
+    path('cart/remove/<int:item_id>/', catalog_views.remove_from_cart, name='remove_from_cart'),
+    path('cart/checkout/', views.checkout_cart, name='checkout_cart'),
+    path('cart/batch/', views.cart_batch, name='cart_batch'),
     path('manage/users/', views.admin_users_list, name='admin_users_list'),
     path('manage/user/<int:user_id>/cart/', views.admin_user_cart, name='admin_user_cart'),
     path('manage/user/<int:user_id>/promote/', views.admin_promote_user, name='admin_promote_user'),
+    path('manage/metrics/', views.metrics_json, name='metrics_json'),
+    path('manage/export/books/', views.export_books, name='export_books'),
+    path('manage/export/carts/', views.export_carts, name='export_carts'),
+    path('manage/profiles/', views.profiles_list, name='profiles_list'),
+    path('manage/profiles/<str:name>.<str:ext>', views.profile_download, name='profile_download'),
 ]
 
 if settings.DEBUG:
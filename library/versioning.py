@@ -0,0 +1,126 @@
+"""
+Версия каталога и условные GET-запросы (ETag / Last-Modified).
+
+Версия хранится в БД (`CatalogVersion`), а не в кэше процесса, чтобы все
+воркеры отдавали одинаковые ETag и сразу видели изменения. Сохранённые
+переводы книг версионируются отдельно по языкам (`TranslationVersion`):
+перевод новой книги меняет только страницы на этом языке.
+"""
+
+import hashlib
+
+from django.db.models import F, Max, Q, Subquery
+from django.utils import timezone
+
+from .models import Book, CatalogVersion, TranslationVersion
+from .roles import is_admin
+from .translation import translation_languages
+
+
+def bump_catalog_version():
+    """Отметить, что каталог изменился (книги или обложки)."""
+    now = timezone.now()
+    if not CatalogVersion.objects.filter(pk=1).update(version=F('version') + 1, updated_at=now):
+        CatalogVersion.objects.get_or_create(pk=1, defaults={'version': 1, 'updated_at': now})
+
+
+def bump_translation_version(lang):
+    """Отметить, что сохранённые переводы книг на `lang` изменились."""
+    now = timezone.now()
+    if not TranslationVersion.objects.filter(lang=lang).update(version=F('version') + 1, updated_at=now):
+        TranslationVersion.objects.get_or_create(lang=lang, defaults={'version': 1, 'updated_at': now})
+
+
+def get_catalog_version():
+    """(версия, время изменения) — одним запросом по первичному ключу."""
+    row = CatalogVersion.objects.filter(pk=1).values_list('version', 'updated_at').first()
+    return row or (0, None)
+
+
+def request_catalog_version(request):
+    """Версия каталога без переводов — для кэшей, не зависящих от BookTranslation (фасеты)."""
+    if not hasattr(request, '_catalog_version'):
+        request._catalog_version = get_catalog_version()
+    return request._catalog_version
+
+
+def _content_versions(lang):
+    # версия каталога и версия переводов языка одним запросом
+    translations = TranslationVersion.objects.filter(lang=lang)
+    row = (
+        CatalogVersion.objects.filter(pk=1)
+        .annotate(
+            tr_version=Subquery(translations.values('version')[:1]),
+            tr_updated=Subquery(translations.values('updated_at')[:1]),
+        )
+        .values_list('version', 'updated_at', 'tr_version', 'tr_updated')
+        .first()
+    )
+    if row is None:
+        # каталог ещё ни разу не менялся
+        row = (0, None) + (translations.values_list('version', 'updated_at').first() or (None, None))
+    return row
+
+
+def request_content_version(request):
+    """(версия, время изменения) того, что видно на языке запроса: каталог и его переводы.
+
+    Считается один раз на запрос: её используют ETag, Last-Modified и ключ сетки.
+    """
+    if not hasattr(request, '_content_version'):
+        lang = request.GET.get('lang', 'ru')
+        if lang not in translation_languages():
+            request._content_version = request_catalog_version(request)
+        else:
+            version, updated, tr_version, tr_updated = _content_versions(lang)
+            request._catalog_version = (version, updated)
+            request._content_version = (
+                f'{version}.{tr_version or 0}',
+                max(filter(None, (updated, tr_updated)), default=None),
+            )
+    return request._content_version
+
+
+def viewer_key(request):
+    """Чем страница каталога отличается для разных пользователей."""
+    user = request.user
+    if not user.is_authenticated:
+        return 'anon'
+    return 'staff' if is_admin(request) else 'user'
+
+
+def make_etag(*parts):
+    return hashlib.sha1('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+
+def catalog_etag(request, *args, **kwargs):
+    version, _ = request_content_version(request)
+    return make_etag('catalog', version, request.path, request.GET.urlencode(), viewer_key(request))
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    return request_content_version(request)[1]
+
+
+def _book_modified(request, pk):
+    if not hasattr(request, '_book_modified'):
+        lang = request.GET.get('lang', 'ru')
+        row = (
+            Book.objects.filter(pk=pk)
+            .annotate(tr_updated=Max('translations__updated_at', filter=Q(translations__lang=lang)))
+            .values_list('updated_at', 'tr_updated')
+            .first()
+        )
+        request._book_modified = max(filter(None, row)) if row else None
+    return request._book_modified
+
+
+def book_etag(request, pk, *args, **kwargs):
+    modified = _book_modified(request, pk)
+    if modified is None:
+        return None
+    return make_etag('book', pk, modified.isoformat(), request.GET.get('lang', 'ru'))
+
+
+def book_last_modified(request, pk, *args, **kwargs):
+    return _book_modified(request, pk)
@@ -2,48 +2,275 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
-from django.views.decorators.http import require_http_methods
-from .models import Book, Cart, CartItem
+from django.http import JsonResponse, StreamingHttpResponse, HttpResponseBadRequest, FileResponse
+from django.views.decorators.http import require_http_methods, condition
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from .models import MAX_ID, Book, Cart, CartItem
+from django.db.models import Exists, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 from .forms import BookForm
-from translatepy import Translator
+from . import metrics
+from .translation import translate_many, cache_stats, translations_prefetch, apply_book_translations
+from .pagination import BOOK_SORTS, DEFAULT_SORT, keyset_paginate
+from .search import search_books
+from .catalog import apply_filters, facet_counts, filters_key, parse_filters
+from .decorators import admin_required, cache_headers
+from .roles import ADMIN_GROUP
+from .stats import itemuse_stats, record_checkout
+from .cart import MAX_QUANTITY, add_item, apply_batch, parse_ops
+from . import export, profiling
+from .versioning import (
+    catalog_etag, catalog_last_modified, book_etag, book_last_modified,
+    request_content_version, viewer_key, make_etag,
+)
 import requests
 from django.conf import settings
 from urllib.parse import quote_plus
 from django.utils import timezone
-import datetime
-import random
 import json
-from pathlib import Path
-from django.core.exceptions import PermissionDenied
+import time
+from django.db import transaction
+from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from django.shortcuts import Http404
 
-translator = Translator()
+# Поля, которые нужны сетке каталога; description показывается только в модалке
+GRID_FIELDS = (
+    'id', 'title', 'author', 'year', 'publisher', 'source_hash',
+    'cover', 'cover_width', 'cover_height', 'cover_placeholder', 'cover_variants',
+)
+# Сортировка списка пользователей: username уникален, курсора по нему достаточно
+USER_ORDERING = ('username',)
+
 
 def get_lang(request):
     """Получить язык из GET параметра"""
     return request.GET.get('lang', 'ru')
 
 
+def get_page_size(request, default=None):
+    """Размер страницы из GET параметра `size` в пределах настроек."""
+    default = default or settings.CATALOG_PAGE_SIZE
+    try:
+        size = int(request.GET.get('size', default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, settings.CATALOG_MAX_PAGE_SIZE))
+
+
+def get_book_ids(request):
+    """id книг из GET параметра `ids` ("1,2,3"): без повторов, не больше страницы каталога."""
+    ids = []
+    for value in request.GET.get('ids', '').split(','):
+        value = value.strip()
+        if not value:
+            continue
+        if not value.isdecimal() or not 1 <= int(value) <= MAX_ID:
+            raise ValueError(f'некорректный id книги: {value[:20]}')
+        if int(value) not in ids:
+            ids.append(int(value))
+        if len(ids) > settings.CATALOG_MAX_PAGE_SIZE:
+            raise ValueError(f'не больше {settings.CATALOG_MAX_PAGE_SIZE} книг за запрос')
+    if not ids:
+        raise ValueError('не указаны id книг')
+    return ids
+
+
+def page_query(request, **params):
+    """Query string текущего запроса с заменой параметров (None — удалить)."""
+    query = request.GET.copy()
+    for key, value in params.items():
+        query.pop(key, None)
+        if value is not None:
+            query[key] = value
+    return query.urlencode()
+
+
+def render_book_grid(request, lang, books, next_query=None, prev_query=None, q=''):
+    return render_to_string('library/book_grid.html', {
+        'books': books,
+        'lang': lang,
+        'q': q,
+        'next_query': next_query,
+        'prev_query': prev_query,
+    }, request=request)
+
+
+def book_payload(book):
+    """JSON модального окна книги."""
+    return {
+        'title': book.title,
+        'author': book.author,
+        'year': book.year,
+        'publisher': book.publisher,
+        'description': book.description,
+        'cover_url': (book.cover_variant_url('modal', 'jpeg') or book.cover.url) if book.cover else '',
+        'cover_sources': {
+            fmt: url for fmt in ('avif', 'webp') if (url := book.cover_variant_url('modal', fmt))
+        } if book.cover else {},
+        'cover_placeholder': book.cover_placeholder,
+    }
+
+
+def get_quantity(request):
+    try:
+        qty = int(request.POST.get('quantity', request.GET.get('quantity', 1)))
+    except Exception:
+        return 1
+    # отрицательное количество уменьшает позицию (см. cart._upsert)
+    return max(-MAX_QUANTITY, min(qty, MAX_QUANTITY))
+
+
+def grid_books(lang, filters=None):
+    """Queryset карточек каталога с переводами языка `lang` и фильтрами боковой панели."""
+    books = apply_filters(Book.objects.only(*GRID_FIELDS), filters or {})
+    if lang != 'ru':
+        books = books.prefetch_related(translations_prefetch(lang, fields=('title', 'author')))
+    return books
+
+
+def grid_page_args(request):
+    """Аргументы `keyset_paginate` для страницы каталога: ordering, size, after, before."""
+    sort = request.GET.get('sort', DEFAULT_SORT)
+    if sort not in BOOK_SORTS:
+        sort = DEFAULT_SORT
+    return BOOK_SORTS[sort], get_page_size(request), request.GET.get('after'), request.GET.get('before')
+
+
+def render_page_grid(request, lang, page):
+    return render_book_grid(
+        request, lang, page.items,
+        next_query=page_query(request, after=page.next_cursor, before=None) if page.has_next else None,
+        prev_query=page_query(request, before=page.prev_cursor, after=None) if page.has_prev else None,
+    )
+
+
+def grid_cache_key(request, lang):
+    """Ключ фрагмента сетки: версия каталога и переводов, язык, страница, роль зрителя.
+
+    Версия каталога меняется при любом сохранении/удалении книги (сигналы
+    в signals.py), версия переводов — при обновлении BookTranslation языка,
+    поэтому старые фрагменты просто перестают запрашиваться и вытесняются
+    по таймауту.
+    """
+    version, _ = request_content_version(request)
+    page = make_etag(request.GET.get('sort', ''), request.GET.get('after', ''),
+                     request.GET.get('before', ''), get_page_size(request),
+                     filters_key(parse_filters(request.GET)))
+    return f'library:grid:{version}:{lang}:{viewer_key(request)}:{page}'
+
+
+FACET_TITLES = {
+    'author': {'ru': 'Авторы', 'en': 'Authors', 'kz': 'Авторлар'},
+    'publisher': {'ru': 'Издательства', 'en': 'Publishers', 'kz': 'Баспалар'},
+    'decade': {'ru': 'Десятилетия', 'en': 'Decades', 'kz': 'Онжылдықтар'},
+}
+
+
+def catalog_sidebar(request, lang, filters):
+    """Контекст боковой панели: фасеты со ссылками и текущие фильтры/сортировка."""
+    facets = facet_counts(request, filters, lang)
+
+    def link(**params):
+        return page_query(request, after=None, before=None, **params)
 
+    year_from, year_to = filters.get('year_from'), filters.get('year_to')
+    sidebar = {
+        'filters': filters,
+        'sort': request.GET.get('sort', DEFAULT_SORT),
+        'sorts': list(BOOK_SORTS),
+        'reset_query': link(author=None, publisher=None, year_from=None, year_to=None),
+    }
+    for facet in ('author', 'publisher'):
+        sidebar[facet] = [{
+            'label': label,
+            'count': count,
+            'active': filters.get(facet) == value,
+            'query': link(**{facet: None if filters.get(facet) == value else value}),
+        } for value, label, count in facets[facet]]
+    sidebar['decade'] = []
+    for value, _, count in facets['decade']:
+        active = year_from == value and year_to == value + 9
+        sidebar['decade'].append({
+            'label': f'{value}–{value + 9}',
+            'count': count,
+            'active': active,
+            'query': link(year_from=None, year_to=None) if active else link(year_from=value, year_to=value + 9),
+        })
+    sidebar['facet_groups'] = [
+        (FACET_TITLES[facet].get(lang, FACET_TITLES[facet]['en']), sidebar[facet]) for facet in FACET_TITLES
+    ]
+    return sidebar
 
+
+@cache_headers(max_age=0)
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
 def index(request):
-    books = Book.objects.all()
     lang = get_lang(request)
-    # Поддержка kazakh в translatepy
-    target_lang = lang
-    if lang == 'kz':
-        target_lang = 'kk'
+    filters = parse_filters(request.GET)
+    key = grid_cache_key(request, lang)
+    grid = cache.get(key)
+    if grid is not None:
+        metrics.incr('grid_cache.hits')
+    else:
+        metrics.incr('grid_cache.misses')
+        started = time.perf_counter()
+        page = keyset_paginate(grid_books(lang, filters), *grid_page_args(request))
+        apply_book_translations(page.items, lang)
+        grid = render_page_grid(request, lang, page)
+        metrics.observe('grid_cache.render', time.perf_counter() - started)
+        cache.set(key, grid, settings.GRID_CACHE_TIMEOUT)
+
+    return render(request, 'library/index.html', {
+        'grid': grid, 'lang': lang, 'sidebar': catalog_sidebar(request, lang, filters),
+    })
 
-    if target_lang != 'ru':
-        for book in books:
-            book.title = translator.translate(book.title, target_lang).result
-            book.author = translator.translate(book.author, target_lang).result
-            book.description = translator.translate(book.description, target_lang).result
 
-    return render(request, 'library/index.html', {'books': books, 'lang': lang})
+def search(request):
+    """Полнотекстовый поиск по каталогу (`?q=`), результаты по релевантности."""
+    lang = get_lang(request)
+    query = request.GET.get('q', '').strip()
+    size = get_page_size(request)
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except (TypeError, ValueError):
+        page = 1
+
+    books = Book.objects.only(*GRID_FIELDS)
+    if lang != 'ru':
+        books = books.prefetch_related(translations_prefetch(lang, fields=('title', 'author')))
+    # берём на одну книгу больше, чтобы узнать, есть ли следующая страница
+    if query and page <= settings.SEARCH_MAX_PAGE:
+        results = search_books(books, query, size + 1, (page - 1) * size)
+    else:
+        results = []
+    has_next = len(results) > size and page < settings.SEARCH_MAX_PAGE
+    results = results[:size]
+    apply_book_translations(results, lang)
+
+    grid = render_book_grid(
+        request, lang, results, q=query,
+        next_query=page_query(request, page=page + 1) if has_next else None,
+        prev_query=page_query(request, page=page - 1) if page > 1 else None,
+    )
+    return render(request, 'library/search.html', {'grid': grid, 'lang': lang, 'q': query})
+
+
+def search_suggest(request):
+    """Подсказки для поля поиска: первые совпадения по префиксу."""
+    lang = get_lang(request)
+    query = request.GET.get('q', '').strip()
+    books = Book.objects.only('id', 'title', 'author', 'source_hash')
+    if lang != 'ru':
+        books = books.prefetch_related(translations_prefetch(lang, fields=('title', 'author')))
+    results = search_books(books, query, settings.SEARCH_SUGGEST_LIMIT) if query else []
+    apply_book_translations(results, lang)
+    return JsonResponse({
+        'items': [{'id': b.id, 'title': b.title, 'author': b.author} for b in results],
+    })
+
 
 def register_view(request):
     lang = get_lang(request)
@@ -104,11 +331,9 @@ def logout_view(request):
 
     return redirect(f'/login/?lang={lang}')
 
-@login_required
+@admin_required
 def add_book(request):
     lang = get_lang(request)
-    if not request.user.groups.filter(name='admin').exists():
-        raise PermissionDenied
 
     if request.method == 'POST':
         form = BookForm(request.POST, request.FILES)
@@ -120,11 +345,9 @@ def add_book(request):
 
     return render(request, 'library/book_form.html', {'form': form, 'lang': lang})
 
-@login_required
+@admin_required
 def edit_book(request, pk):
     lang = get_lang(request)
-    if not request.user.groups.filter(name='admin').exists():
-        raise PermissionDenied
     book = get_object_or_404(Book, pk=pk)
     if request.method == 'POST':
         form = BookForm(request.POST, request.FILES, instance=book)
@@ -135,39 +358,44 @@ def edit_book(request, pk):
         form = BookForm(instance=book)
     return render(request, 'library/book_form.html', {'form': form, 'lang': lang})
 
-@login_required
+@admin_required
 def delete_book(request, pk):
-    if not request.user.groups.filter(name='admin').exists():
-        raise PermissionDenied
     book = get_object_or_404(Book, pk=pk)
     book.delete()
     return redirect('index')
 
+@cache_headers(public=True, max_age=settings.BOOK_DETAIL_MAX_AGE)
+@condition(etag_func=book_etag, last_modified_func=book_last_modified)
 def book_detail(request, pk):
-    book = get_object_or_404(Book, pk=pk)
     lang = get_lang(request)
+    book = get_object_or_404(detail_books(lang), pk=pk)
+    apply_book_translations([book], lang)
+    return JsonResponse(book_payload(book))
 
-    target_lang = lang
-    if lang == 'kz':
-        target_lang = 'kk'
 
-    title = book.title
-    author = book.author
-    description = book.description
+def detail_books(lang):
+    """Книги для карточки: с переводами на `lang` одним дополнительным запросом."""
+    books = Book.objects.all()
+    if lang != 'ru':
+        books = books.prefetch_related(translations_prefetch(lang))
+    return books
 
-    if target_lang != 'ru':
-        title = translator.translate(title, target_lang).result
-        author = translator.translate(author, target_lang).result
-        description = translator.translate(description, target_lang).result
 
-    return JsonResponse({
-        'title': title,
-        'author': author,
-        'year': book.year,
-        'publisher': book.publisher,
-        'description': description,
-        'cover_url': book.cover.url if book.cover else ''
-    })
+@cache_headers(public=True, max_age=settings.BOOK_DETAIL_MAX_AGE)
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
+def book_details(request):
+    """Карточки нескольких книг (`?ids=1,2,3`) одним запросом — для предзагрузки на странице.
+
+    Ответ: {"items": {"<id>": карточка как в book_detail}}; несуществующих id в нём нет.
+    """
+    lang = get_lang(request)
+    try:
+        ids = get_book_ids(request)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    books = list(detail_books(lang).filter(pk__in=ids))
+    apply_book_translations(books, lang)
+    return JsonResponse({'items': {str(book.pk): book_payload(book) for book in books}})
 
 @login_required
 def itemuse_json(request):
@@ -180,55 +408,10 @@ def itemuse_json(request):
          ... (12 элементов)
       ]
     }
+    Считается по агрегату `MonthlyBorrowStat` (см. stats.py); `?force=1` пересчитывает кэш.
     """
-    media_dir = Path(settings.MEDIA_ROOT)
-    media_dir.mkdir(parents=True, exist_ok=True)
-    out_path = media_dir / 'stat_itemuse.json'
-
     force = request.GET.get('force') in ('1', 'true', 'yes')
-
-    if out_path.exists() and not force:
-        try:
-            existing_text = out_path.read_text(encoding='utf-8')
-            data = json.loads(existing_text)
-            return JsonResponse(data)
-        except Exception:
-            pass
-
-    today = timezone.localdate()
-    year = today.year
-    month = today.month
-    items = []
-
-    for offset in range(11, -1, -1):
-        m = month - offset
-        y = year
-        while m <= 0:
-            m += 12
-            y -= 1
-        d = datetime.date(y, m, 1)
-        value = random.randint(50, 400)
-        items.append({
-            'date': d.strftime('%m.%Y'),
-            'value': value
-        })
-
-    out = {'items': items}
-
-    try:
-        existing = None
-        if out_path.exists():
-            try:
-                existing = out_path.read_text(encoding='utf-8')
-            except Exception:
-                existing = None
-        new_text = json.dumps(out, ensure_ascii=False, indent=2)
-        if existing != new_text:
-            out_path.write_text(new_text, encoding='utf-8')
-    except Exception:
-        pass
-
-    return JsonResponse(out)
+    return JsonResponse(itemuse_stats(force=force))
 
 
 @login_required
@@ -244,19 +427,8 @@ def stat_page(request):
 @login_required
 def add_to_cart(request, book_id):
     """Добавить книгу в корзину (количество из POST/GET 'quantity')."""
-    user = request.user
-    cart, _ = Cart.objects.get_or_create(user=user)
-    book = get_object_or_404(Book, pk=book_id)
-    try:
-        qty = int(request.POST.get('quantity', request.GET.get('quantity', 1)))
-    except Exception:
-        qty = 1
-
-    item, created = CartItem.objects.get_or_create(cart=cart, book=book, defaults={'quantity': qty})
-    if not created:
-        item.quantity = max(1, item.quantity + qty)
-        item.save()
-
+    if not add_item(request.user, book_id, get_quantity(request)):
+        raise Http404
     return redirect('view_cart')
 
 
@@ -264,22 +436,12 @@ def add_to_cart(request, book_id):
 def view_cart(request):
     lang = get_lang(request)
     cart, _ = Cart.objects.get_or_create(user=request.user)
-    items = cart.items.select_related('book').all()
+    items = list(cart.items.select_related('book').all())
     # Переводим названия книг при необходимости (если язык не ru)
-    target_lang = lang
-    if lang == 'kz':
-        target_lang = 'kk'
-
-    if target_lang != 'ru':
-        try:
-            for item in items:
-                # translatepy может быть медленным — оборачиваем в try
-                try:
-                    item.book.title = translator.translate(item.book.title, target_lang).result
-                except Exception:
-                    pass
-        except Exception:
-            pass
+    if lang != 'ru':
+        translated = translate_many([item.book.title for item in items], lang)
+        for item in items:
+            item.book.title = translated[item.book.title]
 
     return render(request, 'library/cart.html', {'cart': cart, 'items': items, 'lang': lang})
 
@@ -294,54 +456,93 @@ def remove_from_cart(request, item_id):
 
 
 @login_required
-def admin_users_list(request):
-    # only admin staff can access
-    if not request.user.is_staff:
-        raise PermissionDenied
-    User = get_user_model()
-    users = User.objects.all().order_by('username')
-    lang = get_lang(request)
-    return render(request, 'library/users_list.html', {'users': users, 'lang': lang})
+@require_http_methods(["POST"])
+def cart_batch(request):
+    """Несколько изменений корзины одной транзакцией.
+
+    Тело: {"ops": [{"op": "add" | "remove" | "set", "book": id, "quantity": n}, ...]}.
+    Ответ: содержимое корзины после изменений.
+    """
+    try:
+        result = apply_batch(request.user, parse_ops(json.loads(request.body)))
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse(result)
 
 
 @login_required
-def admin_user_cart(request, user_id):
-    # only admin staff can access
-    if not request.user.is_staff:
-        raise PermissionDenied
+@require_http_methods(["POST"])
+def checkout_cart(request):
+    """Оформить корзину: записать выдачу книг и очистить корзину."""
+    cart = Cart.objects.filter(user=request.user).first()
+    if cart is not None:
+        with transaction.atomic():
+            items = list(cart.items.select_for_update())
+            record_checkout(request.user, items)
+            cart.items.all().delete()
+    return redirect(f"{reverse('view_cart')}?lang={get_lang(request)}")
+
+
+def annotated_users(query=''):
+    """Пользователи с числом книг в корзине, последней активностью и флагом админа.
+
+    Всё считается коррелированными подзапросами в одном SELECT, поэтому
+    с LIMIT страницы они выполняются только для показанных строк, а не
+    для всей таблицы (как было бы с JOIN + GROUP BY).
+    """
     User = get_user_model()
-    try:
-        u = User.objects.get(pk=user_id)
-    except User.DoesNotExist:
-        raise Http404
+    items = CartItem.objects.filter(cart__user=OuterRef('pk')).order_by().values('cart__user')
+    users = User.objects.only('id', 'username', 'email', 'is_staff', 'last_login').annotate(
+        cart_items=Coalesce(Subquery(items.annotate(n=Sum('quantity')).values('n')), 0),
+        last_activity=Subquery(items.annotate(last=Max('added_at')).values('last')),
+        is_library_admin=Q(is_staff=True) | Exists(
+            User.groups.through.objects.filter(user=OuterRef('pk'), group__name=ADMIN_GROUP)
+        ),
+    )
+    if query:
+        # префикс по диапазону, чтобы работал уникальный индекс username
+        users = users.filter(username__gte=query, username__lt=query + '\U0010ffff')
+    return users
+
+
+@admin_required
+def admin_users_list(request):
+    lang = get_lang(request)
+    q = request.GET.get('q', '').strip()
+    page = keyset_paginate(
+        annotated_users(q),
+        USER_ORDERING,
+        get_page_size(request, settings.USERS_PAGE_SIZE),
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+    return render(request, 'library/users_list.html', {
+        'users': page.items,
+        'lang': lang,
+        'q': q,
+        'next_query': page_query(request, after=page.next_cursor, before=None) if page.has_next else None,
+        'prev_query': page_query(request, before=page.prev_cursor, after=None) if page.has_prev else None,
+    })
 
-    # get or create user's cart
-    cart, _ = Cart.objects.get_or_create(user=u)
-    items = cart.items.select_related('book').all()
+
+@admin_required
+def admin_user_cart(request, user_id):
+    u = get_object_or_404(get_user_model().objects.only('id', 'username'), pk=user_id)
+    # только просмотр: корзину не создаём, если её нет
+    items = list(CartItem.objects.filter(cart__user=u).select_related('book').order_by('added_at', 'id'))
 
     lang = get_lang(request)
     # translate titles if needed
-    target_lang = lang
-    if lang == 'kz':
-        target_lang = 'kk'
-    if target_lang != 'ru':
-        try:
-            for item in items:
-                try:
-                    item.book.title = translator.translate(item.book.title, target_lang).result
-                except Exception:
-                    pass
-        except Exception:
-            pass
+    if lang != 'ru':
+        translated = translate_many([item.book.title for item in items], lang)
+        for item in items:
+            item.book.title = translated[item.book.title]
 
     return render(request, 'library/admin_user_cart.html', {'cart_owner': u, 'items': items, 'lang': lang})
 
 
-@login_required
+@admin_required
 def admin_promote_user(request, user_id):
-    # only admin staff can access
-    if not request.user.is_staff:
-        raise PermissionDenied
     User = get_user_model()
     try:
         u = User.objects.get(pk=user_id)
@@ -352,16 +553,83 @@ def admin_promote_user(request, user_id):
     if u == request.user:
         return redirect('admin_users_list')
 
-    admin_group, _ = Group.objects.get_or_create(name='admin')
-    if admin_group in u.groups.all() or u.is_staff:
+    admin_group, _ = Group.objects.get_or_create(name=ADMIN_GROUP)
+    # m2m_changed сбрасывает роли пользователя в его сессиях (см. roles.py)
+    if u.is_staff or u.groups.filter(pk=admin_group.pk).exists():
         # demote
         u.is_staff = False
         u.groups.remove(admin_group)
-        u.save()
+        u.save(update_fields=['is_staff'])
     else:
         # promote
         u.is_staff = True
-        u.save()
+        u.save(update_fields=['is_staff'])
         admin_group.user_set.add(u)
 
     return redirect('admin_users_list')
+
+
+@admin_required
+def metrics_json(request):
+    """Счётчики производительности процесса (только для администраторов)."""
+    data = metrics.snapshot()
+    data['translation_cache'] = cache_stats()
+    hits, misses = metrics.get('grid_cache.hits'), metrics.get('grid_cache.misses')
+    data['grid_cache'] = {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None,
+        'render': data['timings'].get('grid_cache.render'),
+    }
+    return JsonResponse(data)
+
+
+def _export_response(request, name, rows_func, available):
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in export.FORMATS:
+        return HttpResponseBadRequest('format must be csv or jsonl')
+    try:
+        fields = export.parse_fields(request.GET.get('fields'), available)
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+    lang = get_lang(request)
+    rows = rows_func(fields, lang)
+    response = StreamingHttpResponse(export.stream(rows, fields, fmt), content_type=export.FORMATS[fmt])
+    stamp = timezone.now().strftime('%Y%m%d-%H%M%S')
+    response['Content-Disposition'] = f'attachment; filename="{name}-{lang}-{stamp}.{fmt}"'
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+@admin_required
+def export_books(request):
+    """Выгрузка каталога: ?format=csv|jsonl&lang=..&fields=a,b (только для администраторов)."""
+    return _export_response(request, 'books', export.book_rows, export.BOOK_FIELDS)
+
+
+@admin_required
+def export_carts(request):
+    """Выгрузка содержимого всех корзин (только для администраторов)."""
+    return _export_response(request, 'carts', export.cart_rows, export.CART_FIELDS)
+
+
+@admin_required
+def profiles_list(request):
+    """Сохранённые профили запросов и токен для профилирования следующих."""
+    return render(request, 'library/profiles.html', {
+        'lang': get_lang(request),
+        'profiles': profiling.list_profiles(),
+        'token': profiling.make_token(request.user),
+        'param': profiling.PROFILE_PARAM,
+        'header': profiling.PROFILE_HEADER,
+        'sampling': profiling.SamplingProfiler is not None,
+    })
+
+
+@admin_required
+def profile_download(request, name, ext):
+    path = profiling.profile_file(name, ext)
+    if path is None:
+        raise Http404
+    return FileResponse(open(path, 'rb'), as_attachment=ext == 'prof', filename=path.name)
+